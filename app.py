@@ -1,27 +1,27 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, abort
 import os
 import uuid
-from datetime import timedelta
-from dotenv import load_dotenv
-from backend.ai_engine import generate_response
-app = Flask(__name__)
+import hashlib
+from datetime import datetime, timedelta
 from flask_cors import CORS
-CORS(app)
-
-
+from backend.config import load_config
+from backend.ai_engine import generate_response
 from backend.prompts import (
     campaign_prompt,
     sales_prompt,
-    lead_scoring_prompt
+    lead_scoring_prompt,
+    CAMPAIGN_SECTIONS,
+    PITCH_SECTIONS
 )
 from backend.database import (
     init_database,
-    log_history_event,
+    ensure_database,
     get_grouped_user_history,
     delete_history_item,
     clear_user_history,
     delete_old_history,
-    get_user_by_id
+    get_user_by_id,
+    get_history_version
 )
 from backend.auth import (
     signup_user,
@@ -31,23 +31,133 @@ from backend.auth import (
     send_password_reset_email_to_user,
     reset_password
 )
+from backend.sections import (
+    split_sections,
+    join_sections,
+    splice_section,
+    strip_repeated_heading,
+    get_history_sections,
+    section_outline,
+    section_prompt,
+    section_title,
+    SECTION_MAX_TOKENS
+)
+from backend.leads import split_lead_score, get_top_leads, LEAD_TIERS, MAX_TOP_LEADS
+from backend.prescore import local_lead_result, prescore_leads, MAX_PRESCORE_BATCH
+from backend import prescore
+from backend.visits import record_visit
+from backend.throttle import TokenBucket, SharedWindowCounter
+from backend.passwords import HashingBusy
+from backend.quotas import QuotaExceeded, check_quota
+from backend import quotas
+from backend.metrics import login_throttled_total
+from backend.tasks import run_after_response, init_app as init_tasks
+from backend.outbox import init_app as init_outbox
+from backend.metrics import init_app as init_metrics
+from backend.tracing import span, init_app as init_tracing
+from backend.assets import init_app as init_assets
+from backend.capture import init_app as init_capture
+from backend import profiling
+from backend import live
 from backend.history import (
     log_user_activity,
     get_grouped_user_history as get_user_grouped_history,
+    filter_user_history,
+    get_history_cursor,
+    get_history_changes,
+    get_history_summaries,
+    get_history_item,
+    HISTORY_FILTERS,
+    validate_client_action,
+    log_user_activities,
+    MAX_ACTION_BATCH,
     delete_history_item as delete_user_history_item,
     clear_user_history as clear_user_activity_history
 )
 
-load_dotenv()
+def create_app():
+    """
+    Build and configure the Flask application
+    
+    Runs once per process at import and does not touch the database: the
+    schema is created/upgraded before the first request of each process
+    (or ahead of time with `flask init-db`). Per-process resources (LLM
+    client, thread pools, background threads) are created lazily on first
+    use in each worker, so gunicorn --preload can share this work.
+    """
+    load_config()
+    
+    flask_app = Flask(__name__, template_folder='frontend/templates', static_folder='frontend/static')
+    CORS(flask_app)
+    flask_app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    flask_app.config['SESSION_COOKIE_HTTPONLY'] = True
+    flask_app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
+    flask_app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=365)
+    
+    # Create/upgrade the schema before the first request of each process
+    flask_app.before_request(ensure_database)
+    
+    @flask_app.cli.command('init-db')
+    def init_db_command():
+        """Create or upgrade the database schema"""
+        init_database()
+    
+    # Deferred post-response work (history logging, bookkeeping)
+    init_tasks(flask_app)
+    
+    # Background delivery of queued emails (signup and password reset only enqueue)
+    init_outbox(flask_app)
+    
+    # Per-request span tracing with slow-request capture
+    init_tracing(flask_app)
+    
+    # Latency histograms and counters, served at /metrics
+    init_metrics(flask_app)
+    
+    # Fingerprinted, precompressed CSS/JS bundles (python -m backend.assets build)
+    init_assets(flask_app)
+    
+    # Opt-in anonymized traffic capture for benchmarks/replay.py (TRAFFIC_CAPTURE)
+    init_capture(flask_app)
+    
+    return flask_app
+
+app = create_app()
+
+# Per-session limit on tracker events: bursts of ACTION_BURST, refilled at ACTION_RATE/s
+action_throttle = TokenBucket(
+    capacity=int(os.getenv('ACTION_BURST', '100')),
+    rate=float(os.getenv('ACTION_RATE', '1'))
+)
+
+# Login attempts per IP, and failed logins per email, counted across all workers
+login_ip_limiter = SharedWindowCounter(
+    'login-ip',
+    limit=int(os.getenv('LOGIN_IP_LIMIT', '30')),
+    window=int(os.getenv('LOGIN_IP_WINDOW', '300'))
+)
+login_email_limiter = SharedWindowCounter(
+    'login-email',
+    limit=int(os.getenv('LOGIN_EMAIL_FAILURE_LIMIT', '5')),
+    window=int(os.getenv('LOGIN_EMAIL_WINDOW', '900'))
+)
 
-app = Flask(__name__, template_folder='frontend/templates', static_folder='frontend/static')
-app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=365)
+@app.errorhandler(HashingBusy)
+def password_hashing_busy(e):
+    """Shed load when the password hashing pool is saturated"""
+    response = jsonify({'success': False, 'message': 'Server is busy, please try again in a moment'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '2'
+    return response
 
-# Initialize database on startup
-init_database()
+@app.errorhandler(QuotaExceeded)
+def quota_exceeded(e):
+    """Refuse generation requests over the user's or IP's quota"""
+    response = jsonify({'error': str(e), 'scope': e.scope, 'quota': e.kind})
+    response.status_code = 429
+    response.headers.update(e.headers)
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 # ==================== HELPER FUNCTIONS ====================
 
@@ -59,7 +169,50 @@ def get_current_user():
     """Get current logged-in user"""
     if 'logged_in_user_id' not in session:
         return None
-    return get_user_by_id(session['logged_in_user_id'])
+    with span('auth.get_current_user'):
+        return get_user_by_id(session['logged_in_user_id'])
+
+def is_admin():
+    """Check if the logged-in user's email is listed in ADMIN_EMAILS"""
+    admin_emails = {e.strip().lower() for e in os.getenv('ADMIN_EMAILS', '').split(',') if e.strip()}
+    user = get_current_user()
+    return bool(user and user['email'].lower() in admin_emails)
+
+def history_etag(user_id, *parts):
+    """
+    Strong ETag for a history response
+    
+    Built from the user's history version plus the UTC date (date grouping
+    changes at midnight) and any request-specific parts such as filters.
+    """
+    version = get_history_version(user_id)
+    today = datetime.utcnow().strftime('%Y%m%d')
+    extra = hashlib.sha1(repr(parts).encode()).hexdigest()[:12] if parts else '0'
+    return f'h{user_id}-{version}-{today}-{extra}'
+
+def item_etag(user_id, history_id, *parts):
+    """
+    ETag for one history item (or its sections)
+    
+    Items can change in place (python -m backend.leads backfill), so the
+    ETag follows the history version instead of the item id alone.
+    """
+    return history_etag(user_id, 'item', history_id, *parts)
+
+def not_modified(etag):
+    """Return a 304 response if the client already has `etag`, else None"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+def with_etag(response, etag):
+    """Attach a strong ETag and force revalidation on every use"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 def require_login(f):
     """Decorator to require authentication"""
@@ -71,6 +224,18 @@ def require_login(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def require_admin(f):
+    """Decorator: JSON endpoints for users listed in ADMIN_EMAILS"""
+    from functools import wraps
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_logged_in():
+            return jsonify({'error': 'User not authenticated'}), 401
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
 # ==================== AUTHENTICATION ROUTES ====================
 
 @app.route('/signup', methods=['GET', 'POST'])
@@ -143,15 +308,34 @@ def login_page():
         email = data.get('email', '').strip()
         password = data.get('password', '')
         
+        # Throttle before hashing so floods cost a key lookup, not a hash
+        ip = request.remote_addr or '-'
+        email_key = email.lower()
+        for scope, limiter, key in (('ip', login_ip_limiter, ip), ('email', login_email_limiter, email_key)):
+            retry_after = limiter.retry_after(key)
+            if retry_after:
+                login_throttled_total.inc(scope=scope)
+                message = f'Too many login attempts. Try again in {retry_after} seconds.'
+                if request.is_json:
+                    response = jsonify({'success': False, 'message': message})
+                else:
+                    response = app.make_response(render_template('login.html', error=message, email=email))
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+        login_ip_limiter.hit(ip)
+        
         # Attempt login
         success, message, user_id = login_user(email, password)
         
         if not success:
+            login_email_limiter.hit(email_key)
             if request.is_json:
                 return jsonify({'success': False, 'message': message}), 401
             return render_template('login.html', error=message, email=email)
         
         # Set session and log activity
+        login_email_limiter.reset(email_key)
         session['logged_in_user_id'] = user_id
         log_user_activity(
             user_id=user_id,
@@ -247,11 +431,9 @@ def before_request():
     """Middleware: Auto-track page visits and set up user session"""
     session.permanent = True
     
-    # Create or retrieve user_id from session
-    if 'user_id' not in session:
-        session['user_id'] = str(uuid.uuid4())
-    
-    user_id = session['user_id']
+    # Anonymous visitor id - kept separate from the logged-in user id
+    if 'visitor_id' not in session:
+        session['visitor_id'] = str(uuid.uuid4())
     
     # Exclude static files and API endpoints for page visit tracking
     # Only track Campaign, Pitch, Lead Score, and History pages
@@ -265,20 +447,18 @@ def before_request():
         }
         
         if request.path in pages_to_track:
-            page_title = pages_to_track[request.path]
-            
-            # Log page visit silently in background
+            # Counted in memory and flushed in aggregate by a background thread
             try:
-                log_history_event(
-                    user_id=user_id,
+                record_visit(
                     page_url=request.path,
-                    page_title=page_title,
-                    action_type='visit',
+                    page_title=pages_to_track[request.path],
+                    user_id=session.get('logged_in_user_id'),
+                    session_id=session['visitor_id'],
                     ip_address=request.remote_addr,
                     user_agent=request.headers.get('User-Agent')
                 )
             except Exception as e:
-                print(f"History logging error: {e}")
+                print(f"Visit tracking error: {e}")
 
 # ==================== ROUTES ====================
 
@@ -331,21 +511,30 @@ def api_generate_campaign():
         if not all([product, audience, platform]):
             return jsonify({'error': 'Missing required fields'}), 400
         
+        # Raises QuotaExceeded (429) before any tokens are spent; invalid input uses none
+        quota = check_quota(user_id, request.remote_addr)
+        
         prompt = campaign_prompt(product, audience, platform)
-        result = generate_response(prompt)
+        result = generate_response(prompt, on_usage=quota.charge)
         
-        # Log to user history
-        log_user_activity(
+        # Log to user history once the response has been sent
+        run_after_response(
+            log_user_activity,
             user_id=user_id,
             page_url=request.path,
             page_title='Campaign Generator',
             action_type='campaign_generated',
-            metadata={'product': product, 'audience': audience, 'platform': platform, 'result': result},
+            metadata={'product': product, 'audience': audience, 'platform': platform, 'result': result,
+                      'template': prompt.template_id},
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
+            user_agent=request.headers.get('User-Agent'),
+            raise_errors=True,
+            sections=split_sections(result, CAMPAIGN_SECTIONS)
         )
         
         return jsonify({'success': True, 'result': result})
+    except QuotaExceeded:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -364,21 +553,29 @@ def api_generate_pitch():
         if not all([product, persona]):
             return jsonify({'error': 'Missing required fields'}), 400
         
+        # Raises QuotaExceeded (429) before any tokens are spent; invalid input uses none
+        quota = check_quota(user_id, request.remote_addr)
+        
         prompt = sales_prompt(product, persona)
-        result = generate_response(prompt)
+        result = generate_response(prompt, on_usage=quota.charge)
         
-        # Log to user history
-        log_user_activity(
+        # Log to user history once the response has been sent
+        run_after_response(
+            log_user_activity,
             user_id=user_id,
             page_url=request.path,
             page_title='Pitch Generator',
             action_type='pitch_generated',
-            metadata={'product': product, 'persona': persona, 'result': result},
+            metadata={'product': product, 'persona': persona, 'result': result, 'template': prompt.template_id},
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
+            user_agent=request.headers.get('User-Agent'),
+            raise_errors=True,
+            sections=split_sections(result, PITCH_SECTIONS)
         )
         
         return jsonify({'success': True, 'result': result})
+    except QuotaExceeded:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -399,21 +596,106 @@ def api_score_lead():
         if not all([name, budget, need, urgency]):
             return jsonify({'error': 'Missing required fields'}), 400
         
+        # Obviously cold leads are answered locally: no LLM call, so no token budget needed
+        local = local_lead_result(name, budget, need, urgency)
+        
+        # Raises QuotaExceeded (429) before any tokens are spent; invalid input uses none
+        quota = check_quota(user_id, request.remote_addr, tokens=not local)
+        
+        if local:
+            result, extra = local
+            prescore.record_outcome(local)
+            run_after_response(
+                log_user_activity,
+                user_id=user_id,
+                page_url=request.path,
+                page_title='Lead Scorer',
+                action_type='lead_scored',
+                metadata={'name': name, 'budget': budget, 'need': need, 'urgency': urgency, 'result': result, **extra},
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent'),
+                raise_errors=True
+            )
+            return jsonify({'success': True, 'result': result, **extra})
+        
         prompt = lead_scoring_prompt(name, budget, need, urgency)
-        result = generate_response(prompt)
+        result, scores = split_lead_score(generate_response(prompt, on_usage=quota.charge))
+        prescore.record_outcome(None)
         
-        # Log to user history
-        log_user_activity(
+        # Log to user history once the response has been sent
+        run_after_response(
+            log_user_activity,
             user_id=user_id,
             page_url=request.path,
             page_title='Lead Scorer',
             action_type='lead_scored',
-            metadata={'name': name, 'budget': budget, 'need': need, 'urgency': urgency, 'result': result},
+            metadata={'name': name, 'budget': budget, 'need': need, 'urgency': urgency, 'result': result,
+                      'scores': scores, 'template': prompt.template_id},
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
+            user_agent=request.headers.get('User-Agent'),
+            raise_errors=True
         )
         
-        return jsonify({'success': True, 'result': result})
+        return jsonify({'success': True, 'result': result, 'scores': scores})
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leads/top', methods=['GET'])
+def api_top_leads():
+    """Get the current user's scored leads, best first (keyset-paginated)"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    readiness = request.args.get('readiness') or None
+    if readiness and readiness not in {tier for _, tier in LEAD_TIERS}:
+        return jsonify({'error': 'readiness must be one of hot, warm, lukewarm, cold'}), 400
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        limit = max(1, min(request.args.get('limit', 20, type=int), MAX_TOP_LEADS))
+        min_score = request.args.get('min_score', type=int)
+        before_score = request.args.get('before_score', type=int)
+        before_id = request.args.get('before_id', type=int)
+        before = (before_score, before_id) if before_score is not None and before_id is not None else None
+        
+        etag = history_etag(user_id, 'top-leads', readiness, min_score, before, limit)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        page = get_top_leads(user_id, limit=limit, readiness=readiness, min_score=min_score, before=before)
+        return with_etag(jsonify({'success': True, **page}), etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leads/prescore', methods=['POST'])
+def api_prescore_leads():
+    """Provisional local scores for a batch of leads (no LLM calls)"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    data = request.get_json(silent=True)
+    leads = data.get('leads') if isinstance(data, dict) else None
+    if (not isinstance(leads, list) or len(leads) > MAX_PRESCORE_BATCH
+            or not all(isinstance(lead, dict) for lead in leads)):
+        return jsonify({'error': f'Expected a list of at most {MAX_PRESCORE_BATCH} lead objects'}), 400
+    
+    try:
+        # One request-rate slot per batch; no tokens are spent
+        check_quota(session.get('logged_in_user_id'), request.remote_addr, tokens=False)
+        items = prescore_leads(leads)
+        escalated = sum(1 for item in items if item['escalate'])
+        return jsonify({
+            'success': True,
+            'items': items,
+            'threshold': prescore.LEAD_PRESCORE_THRESHOLD,
+            'escalated': escalated,
+            'local': len(items) - escalated
+        })
+    except QuotaExceeded:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -427,8 +709,270 @@ def get_grouped_history():
     
     try:
         user_id = session.get('logged_in_user_id')
+        
+        # Read the cursor first: changes racing with the query are replayed
+        # by /api/history/changes, and re-applying an insert is harmless
+        cursor = get_history_cursor(user_id)
+        
+        # Skip the history query entirely when the client copy is current
+        etag = history_etag(user_id, cursor)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
         history = get_user_grouped_history(user_id)
-        return jsonify({'success': True, 'data': history})
+        return with_etag(jsonify({'success': True, 'data': history, 'cursor': cursor}), etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history', methods=['GET'])
+def get_filtered_history():
+    """Get current user's history filtered by metadata fields"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        filters = {
+            name: request.args[name]
+            for name in HISTORY_FILTERS
+            if request.args.get(name)
+        }
+        action_type = request.args.get('action_type') or None
+        limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+        
+        etag = history_etag(user_id, sorted(filters.items()), action_type, limit)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        history = filter_user_history(user_id, filters, limit=limit, action_type=action_type)
+        return with_etag(jsonify({'success': True, 'data': history}), etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/summaries', methods=['GET'])
+def get_history_summary_page():
+    """Get one page of lightweight history summaries (no result bodies)"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+        before_ts = request.args.get('before_ts')
+        before_id = request.args.get('before_id', type=int)
+        before = (before_ts, before_id) if before_ts and before_id is not None else None
+        
+        cursor = get_history_cursor(user_id)
+        etag = history_etag(user_id, cursor, before, limit)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        page = get_history_summaries(user_id, limit=limit, before=before)
+        return with_etag(jsonify({'success': True, 'cursor': cursor, **page}), etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/item/<int:history_id>', methods=['GET'])
+def get_history_item_detail(history_id):
+    """Get one full history item, including the generated result"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        etag = item_etag(user_id, history_id)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        item = get_history_item(user_id, history_id)
+        if not item:
+            return jsonify({'error': 'History item not found'}), 404
+        return with_etag(jsonify({'success': True, 'data': item}), etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/item/<int:history_id>/sections', methods=['GET'])
+def get_history_item_sections(history_id):
+    """List the sections of a campaign or pitch result (no section bodies)"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        etag = item_etag(user_id, history_id, 'sections')
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        item = get_history_sections(user_id, history_id)
+        if not item:
+            return jsonify({'error': 'History item not found'}), 404
+        if not item['parts']:
+            return jsonify({'error': 'This result has no sections'}), 409
+        return with_etag(jsonify({'success': True, 'sections': section_outline(item['parts'])}), etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/item/<int:history_id>/sections/<key>', methods=['GET'])
+def get_history_item_section(history_id, key):
+    """Get one section of a campaign or pitch result"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        etag = item_etag(user_id, history_id, 'sections', key)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        item = get_history_sections(user_id, history_id)
+        if not item:
+            return jsonify({'error': 'History item not found'}), 404
+        section = next((part for part in item['parts'] or () if part[0] == key), None)
+        if not section:
+            return jsonify({'error': f'Unknown section: {key}'}), 404
+        _, heading, body = section
+        response = jsonify({'success': True, 'key': key, 'title': section_title(heading),
+                            'content': body.strip()})
+        return with_etag(response, etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/item/<int:history_id>/sections/<key>/regenerate', methods=['POST'])
+def regenerate_history_section(history_id, key):
+    """
+    Regenerate one section of a campaign or pitch result
+    
+    Only the section is sent to the model, with the other sections as
+    short context. The spliced result is saved as a new history entry.
+    """
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        item = get_history_sections(user_id, history_id)
+        if not item:
+            return jsonify({'error': 'History item not found'}), 404
+        if not item['parts']:
+            return jsonify({'error': 'This result has no sections'}), 409
+        try:
+            prompt = section_prompt(item['action_type'], item['metadata'], item['parts'], key)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Raises QuotaExceeded (429) before any tokens are spent
+        quota = check_quota(user_id, request.remote_addr)
+        
+        heading = next(heading for part_key, heading, _ in item['parts'] if part_key == key)
+        content = generate_response(prompt, on_usage=quota.charge, max_tokens=SECTION_MAX_TOKENS)
+        content = strip_repeated_heading(content, heading).strip()
+        parts = splice_section(item['parts'], key, content)
+        result = join_sections(parts)
+        
+        # Logged before responding: the client addresses the new entry by its id
+        metadata = dict(item['metadata'], result=result, revised_from=history_id, regenerated_section=key,
+                        template=prompt.template_id)
+        new_id = log_user_activity(
+            user_id=user_id,
+            page_url=request.path,
+            page_title=item['page_title'],
+            action_type=item['action_type'],
+            metadata=metadata,
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent'),
+            raise_errors=True,
+            sections=parts
+        )
+        
+        return jsonify({'success': True, 'id': new_id, 'section': key, 'content': content, 'result': result})
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/changes', methods=['GET'])
+def get_history_changes_feed():
+    """Get history inserts and deletes after a cursor"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'since must be a non-negative integer cursor'}), 400
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        limit = max(1, min(request.args.get('limit', 500, type=int), 500))
+        changes = get_history_changes(user_id, since, limit=limit)
+        return jsonify({'success': True, **changes})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/stream', methods=['GET'])
+def history_stream():
+    """Server-Sent Events stream of the current user's history changes"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    user_id = session.get('logged_in_user_id')
+    # EventSource sends Last-Event-ID on reconnect; the first connect passes ?since=
+    since = live.parse_since(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    
+    # Subscribe before replaying so nothing falls in between; duplicates are harmless
+    subscriber = live.hub.subscribe(user_id)
+    
+    def generate():
+        try:
+            yield from live.opening_events(user_id, since)
+            for item in subscriber.events():
+                yield live.format_item(item)
+        finally:
+            live.hub.unsubscribe(subscriber)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/history/log-action', methods=['POST'])
+def log_actions():
+    """Bulk-ingest tracker events from history-tracker.js"""
+    if not is_logged_in():
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    try:
+        user_id = session.get('logged_in_user_id')
+        # sendBeacon bodies may arrive without a JSON content type
+        data = request.get_json(force=True, silent=True)
+        events = data.get('events') if isinstance(data, dict) and 'events' in data else data
+        if isinstance(events, dict):
+            events = [events]
+        if not isinstance(events, list) or len(events) > MAX_ACTION_BATCH:
+            return jsonify({'error': f'Expected a list of at most {MAX_ACTION_BATCH} events'}), 400
+        
+        valid = [v for v in (validate_client_action(e) for e in events) if v]
+        granted = action_throttle.take(session.get('visitor_id') or str(user_id), len(valid))
+        if valid and not granted:
+            return jsonify({'error': 'Too many tracked actions, slow down'}), 429
+        
+        accepted = log_user_activities(
+            user_id,
+            valid[:granted],
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent')
+        )
+        return jsonify({
+            'success': True,
+            'accepted': accepted,
+            'rejected': len(events) - len(valid),
+            'throttled': len(valid) - granted
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -473,6 +1017,141 @@ def clear_all_history():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ==================== ADMIN QUOTA ENDPOINTS ====================
+
+def _optional_limit(data, field):
+    """Non-negative int, or None for the configured default"""
+    value = data.get(field)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f'{field} must be a non-negative integer or null')
+    return value
+
+@app.route('/admin/quotas', methods=['GET'])
+@require_admin
+def admin_list_quotas():
+    """Limits and today's usage for users with an override or usage today"""
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        user_id = request.args.get('user_id', type=int)
+        users = quotas.get_quotas([user_id] if user_id else None, limit)
+        return jsonify({
+            'success': True,
+            'defaults': {
+                'rate_limit': quotas.QUOTA_USER_RATE_LIMIT,
+                'rate_window': quotas.QUOTA_RATE_WINDOW,
+                'daily_tokens': quotas.QUOTA_USER_DAILY_TOKENS,
+                'ip_rate_limit': quotas.QUOTA_IP_RATE_LIMIT,
+                'ip_daily_tokens': quotas.QUOTA_IP_DAILY_TOKENS,
+            },
+            'users': users
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/quotas/<int:user_id>', methods=['PUT'])
+@require_admin
+def admin_set_quota(user_id):
+    """Override a user's daily token budget and request rate (null = default)"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    try:
+        daily_tokens = _optional_limit(data, 'daily_tokens')
+        rate_limit = _optional_limit(data, 'rate_limit')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        if not get_user_by_id(user_id):
+            return jsonify({'error': 'User not found'}), 404
+        quotas.set_user_quota(user_id, daily_tokens, rate_limit, updated_by=get_current_user()['email'])
+        return jsonify({'success': True, 'quota': quotas.get_quotas([user_id])[0]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/quotas/<int:user_id>/reset', methods=['POST'])
+@require_admin
+def admin_reset_quota_usage(user_id):
+    """Clear a user's request and token counters"""
+    try:
+        quotas.reset_user_usage(user_id)
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== ADMIN PROFILING ENDPOINTS ====================
+
+def require_profiling_admin(f):
+    """Decorator: profiling must be enabled and the user must be an admin"""
+    from functools import wraps
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not profiling.PROFILING_ENABLED:
+            abort(404)
+        if not is_logged_in():
+            return jsonify({'error': 'User not authenticated'}), 401
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+@app.route('/admin/profile/cpu', methods=['GET'])
+@require_profiling_admin
+def profile_cpu():
+    """Sample all threads of this worker and return collapsed stacks"""
+    duration = request.args.get('duration', 5, type=float)
+    interval = request.args.get('interval', 0.005, type=float)
+    include_idle = request.args.get('idle') == '1'
+    
+    try:
+        result = profiling.sample_stacks(duration, interval, include_idle)
+    except profiling.ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, 'pid': os.getpid(), **result})
+    return Response(profiling.collapsed(result['stacks']), mimetype='text/plain',
+                    headers={'X-Profile-Samples': str(result['samples']), 'X-Profile-Pid': str(os.getpid())})
+
+@app.route('/admin/profile/memory/start', methods=['POST'])
+@require_profiling_admin
+def profile_memory_start():
+    """Start tracemalloc in this worker"""
+    frames = min(request.args.get('frames', 10, type=int), 50)
+    profiling.start_memory_tracking(frames)
+    return jsonify({'success': True, 'pid': os.getpid()})
+
+@app.route('/admin/profile/memory/stop', methods=['POST'])
+@require_profiling_admin
+def profile_memory_stop():
+    """Stop tracemalloc in this worker"""
+    profiling.stop_memory_tracking()
+    return jsonify({'success': True, 'pid': os.getpid()})
+
+@app.route('/admin/profile/memory/snapshot', methods=['GET'])
+@require_profiling_admin
+def profile_memory_snapshot():
+    """Top allocation sites; also becomes the baseline for the next diff"""
+    try:
+        limit = request.args.get('limit', 25, type=int)
+        group_by = 'traceback' if request.args.get('group_by') == 'traceback' else 'lineno'
+        return jsonify({'success': True, 'pid': os.getpid(), **profiling.memory_snapshot(limit, group_by)})
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
+@app.route('/admin/profile/memory/diff', methods=['GET'])
+@require_profiling_admin
+def profile_memory_diff():
+    """Allocation growth since the previous snapshot or diff"""
+    try:
+        limit = request.args.get('limit', 25, type=int)
+        group_by = 'traceback' if request.args.get('group_by') == 'traceback' else 'lineno'
+        return jsonify({'success': True, 'pid': os.getpid(), **profiling.memory_diff(limit, group_by)})
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
 # ==================== ERROR HANDLERS ====================
 
 @app.errorhandler(404)
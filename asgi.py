@@ -0,0 +1,470 @@
+"""
+ASGI entry point (async serving mode)
+The generation endpoints (/api/generate-campaign, /api/generate-pitch,
+/api/score-lead) are served by native async handlers that await the async
+Groq client, so a waiting generation holds a coroutine instead of a worker
+thread and one process can keep hundreds of LLM calls in flight. A request
+whose client disconnects is cancelled, which aborts the call to Groq.
+
+The live history stream (/api/history/stream) is served on the event loop
+too: an open stream is a waiting coroutine, so any number of them leave
+the Flask pool free, and a stream ends as soon as its client disconnects.
+
+Every other route is the unchanged Flask app, run on a bounded thread pool
+(ASYNC_WSGI_WORKERS). Database calls from the async handlers (quota
+checks, stream subscriptions) run on a second bounded pool
+(ASYNC_DB_WORKERS) and history logging goes to the post-response task pool
+(TASK_WORKERS), so SQLite never blocks the loop.
+
+    uvicorn asgi:app --workers 4
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 4
+
+The WSGI entry point (gunicorn app:app) keeps working as before.
+"""
+
+import os
+import io
+import json
+import time
+import asyncio
+import threading
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+from app import app as flask_app
+from backend import live
+from backend.ai_engine import generate_response_async
+from backend.prompts import campaign_prompt, sales_prompt, lead_scoring_prompt, CAMPAIGN_SECTIONS, PITCH_SECTIONS
+from backend.history import log_user_activity
+from backend.database import ensure_database
+from backend.metrics import http_request_duration, http_requests_total
+from backend.tracing import begin_trace, finish_trace, REQUEST_ID_HEADER, TRACE_SLOW_MS, TRACE_LOG
+from backend.tasks import submit, wait_for_tasks
+from backend.quotas import QuotaExceeded, check_quota
+from backend.leads import split_lead_score
+from backend.prescore import local_lead_result, record_outcome as record_prescore_outcome
+from backend.sections import split_sections
+from backend.capture import annotate_request
+
+# Threads per process running the Flask app (every route except generation)
+ASYNC_WSGI_WORKERS = int(os.getenv('ASYNC_WSGI_WORKERS', '8'))
+
+# Threads per process for database calls made by the async handlers (quota checks)
+ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', '4'))
+
+# Largest request body (bytes) read into memory
+ASYNC_MAX_BODY = int(os.getenv('ASYNC_MAX_BODY', str(1024 * 1024)))
+
+HISTORY_STREAM_PATH = '/api/history/stream'
+
+
+def _lead_score_fields(text):
+    result, scores = split_lead_score(text)
+    return result, {'scores': scores}
+
+
+# Async generation endpoints: path -> endpoint name, required JSON fields,
+# prompt builder, the history entry written after the response, an optional
+# result parser returning (result, extra response/metadata fields), the
+# optional section layout stored with the entry (backend/sections.py) and an
+# optional local answer returning (result, extra fields) or None to call the LLM,
+# with local_outcome(answer) counting each served request either way
+GENERATION_ENDPOINTS = {
+    '/api/generate-campaign': {
+        'endpoint': 'api_generate_campaign',
+        'fields': ('product', 'audience', 'platform'),
+        'prompt': campaign_prompt,
+        'page_title': 'Campaign Generator',
+        'action_type': 'campaign_generated',
+        'sections': CAMPAIGN_SECTIONS,
+    },
+    '/api/generate-pitch': {
+        'endpoint': 'api_generate_pitch',
+        'fields': ('product', 'persona'),
+        'prompt': sales_prompt,
+        'page_title': 'Pitch Generator',
+        'action_type': 'pitch_generated',
+        'sections': PITCH_SECTIONS,
+    },
+    '/api/score-lead': {
+        'endpoint': 'api_score_lead',
+        'fields': ('name', 'budget', 'need', 'urgency'),
+        'prompt': lead_scoring_prompt,
+        'page_title': 'Lead Scorer',
+        'action_type': 'lead_scored',
+        'parse': _lead_score_fields,
+        'local': local_lead_result,
+        'local_outcome': record_prescore_outcome,
+    },
+}
+
+_executors = {}
+_executors_pid = None
+_executors_lock = threading.Lock()
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was sent"""
+
+
+class RequestTooLarge(Exception):
+    """The request body is larger than ASYNC_MAX_BODY"""
+
+
+def _get_executor(kind):
+    """Bounded 'wsgi' or 'db' thread pool, created lazily once per process (safe after fork)"""
+    global _executors_pid
+    pid = os.getpid()
+    if _executors_pid != pid or kind not in _executors:
+        with _executors_lock:
+            if _executors_pid != pid:
+                _executors.clear()
+                _executors_pid = pid
+            if kind not in _executors:
+                workers = ASYNC_WSGI_WORKERS if kind == 'wsgi' else ASYNC_DB_WORKERS
+                _executors[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'asgi-{kind}')
+    return _executors[kind]
+
+
+async def run_in_db_executor(func, *args):
+    """Run a blocking database call on the bounded db pool"""
+    return await asyncio.get_running_loop().run_in_executor(_get_executor('db'), func, *args)
+
+
+async def read_body(receive):
+    """Read the whole request body; raises ClientDisconnected or RequestTooLarge"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > ASYNC_MAX_BODY:
+            raise RequestTooLarge('Request body too large')
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def wait_for_disconnect(receive):
+    """Return once the client has disconnected"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def cancel_on_disconnect(receive, coro):
+    """
+    Await a coroutine, cancelling it if the client disconnects first
+
+    Raises:
+        ClientDisconnected: the client went away and the coroutine was cancelled
+    """
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        # Wait for the cancellation to close the upstream request
+        await asyncio.wait({task})
+        raise ClientDisconnected()
+    return task.result()
+
+
+def load_session(headers):
+    """Decode the Flask session cookie (same signing as the WSGI app)"""
+    cookie = parse_cookie(headers.get('cookie', '')).get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return {}
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        return serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+def _decode_headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+async def send_json(send, status, payload, request_id, extra_headers=None):
+    body = json.dumps(payload).encode('utf-8')
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (REQUEST_ID_HEADER.lower().encode(), request_id.encode()),
+    ]
+    for name, value in (extra_headers or {}).items():
+        headers.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+    return len(body)
+
+
+def record_request(endpoint, method, status, start):
+    """Request metrics and the slow-trace log, as the Flask hooks record them"""
+    http_request_duration.observe(time.perf_counter() - start, endpoint=endpoint, method=method)
+    http_requests_total.inc(endpoint=endpoint, method=method, status=status)
+    record = finish_trace(endpoint=endpoint, status=status, mode='async')
+    if record and record['duration_ms'] >= TRACE_SLOW_MS:
+        flask_app.logger.warning('Slow request %s took %.0f ms (trace written to %s)',
+                                 record['name'], record['duration_ms'], TRACE_LOG)
+
+
+# ==================== ASYNC GENERATION ENDPOINTS ====================
+
+async def generation_endpoint(scope, receive, send, spec):
+    """Async counterpart of the Flask generation routes (same JSON contract)"""
+    headers = _decode_headers(scope)
+    trace = begin_trace(f"{scope['method']} {scope['path']}", headers.get(REQUEST_ID_HEADER.lower()))
+    start = time.perf_counter()
+    status = 500
+    extra_headers = None
+    data = None
+    client = scope.get('client')
+    try:
+        session = load_session(headers)
+        user_id = session.get('logged_in_user_id')
+        if not user_id:
+            status, payload = 401, {'error': 'User not authenticated'}
+        else:
+            try:
+                data = json.loads(await read_body(receive) or b'null')
+                values = [data.get(field, '') for field in spec['fields']] if isinstance(data, dict) else []
+                if not isinstance(data, dict):
+                    raise ValueError('Expected a JSON object')
+                elif not all(values):
+                    status, payload = 400, {'error': 'Missing required fields'}
+                else:
+                    # Requests the spec answers locally need no LLM call, so only a rate slot
+                    local = spec['local'](*values) if 'local' in spec else None
+                    # Invalid input is refused above without using a quota slot
+                    quota = await run_in_db_executor(check_quota, user_id, client[0] if client else None, not local)
+                    if local:
+                        result, extra = local
+                    else:
+                        prompt = spec['prompt'](*values)
+                        result = await cancel_on_disconnect(
+                            receive, generate_response_async(prompt, on_usage=quota.charge))
+                        extra = {}
+                        if 'parse' in spec:
+                            result, extra = spec['parse'](result)
+                    if 'local' in spec:
+                        # Counted only once the request has been answered, locally or by the LLM
+                        spec['local_outcome'](local)
+                    status, payload = 200, {'success': True, 'result': result, **extra}
+                    if not local:
+                        # Stored with the history entry, not returned
+                        extra = dict(extra, template=prompt.template_id)
+            except ClientDisconnected:
+                raise
+            except RequestTooLarge as e:
+                status, payload = 413, {'error': str(e)}
+            except QuotaExceeded as e:
+                status, payload = 429, {'error': str(e), 'scope': e.scope, 'quota': e.kind}
+                extra_headers = dict(e.headers, **{'Retry-After': str(e.retry_after)})
+            except Exception as e:
+                status, payload = 500, {'error': str(e)}
+
+        response_bytes = await send_json(send, status, payload, trace.request_id, extra_headers)
+        annotate_request('POST', scope['path'], user_id, int(headers.get('content-length') or 0),
+                         response_bytes, data)
+
+        if status == 200:
+            # Log to user history on the post-response pool, off the event loop
+            submit(
+                log_user_activity,
+                user_id=user_id,
+                page_url=scope['path'],
+                page_title=spec['page_title'],
+                action_type=spec['action_type'],
+                metadata=dict(zip(spec['fields'], values), result=result, **extra),
+                ip_address=client[0] if client else None,
+                user_agent=headers.get('user-agent'),
+                raise_errors=True,
+                sections=split_sections(result, spec['sections']) if 'sections' in spec else None
+            )
+    except ClientDisconnected:
+        # nginx's "client closed request"
+        status = 499
+    finally:
+        record_request(spec['endpoint'], 'POST', status, start)
+
+
+# ==================== LIVE HISTORY STREAM ====================
+
+async def _send_history_events(send, subscriber, chunks):
+    """Write the opening chunks, then every event the hub delivers, until max_seconds"""
+    for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    async for item in subscriber.stream():
+        chunk = live.format_item(item)
+        await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+
+
+async def history_stream_endpoint(scope, receive, send):
+    """Async counterpart of the Flask /api/history/stream route (same events)"""
+    headers = _decode_headers(scope)
+    trace = begin_trace(f"GET {scope['path']}", headers.get(REQUEST_ID_HEADER.lower()))
+    start = time.perf_counter()
+    status = 500
+    subscriber = None
+    try:
+        # Like the Flask route, metrics and the trace end with the response headers
+        try:
+            user_id = load_session(headers).get('logged_in_user_id')
+            if not user_id:
+                status = 401
+                await send_json(send, status, {'error': 'User not authenticated'}, trace.request_id)
+                return
+            query = parse_qs(scope['query_string'].decode('latin-1'))
+            since = live.parse_since(headers.get('last-event-id') or query.get('since', [None])[0])
+            # Subscribe before replaying so nothing falls in between; duplicates are harmless
+            subscriber = await run_in_db_executor(live.hub.subscribe, user_id)
+            chunks = await run_in_db_executor(live.opening_events, user_id, since)
+            annotate_request('GET', scope['path'], user_id, 0, None)
+            status = 200
+            await send({'type': 'http.response.start', 'status': status, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                (REQUEST_ID_HEADER.lower().encode(), trace.request_id.encode()),
+            ]})
+        except Exception as e:
+            status = 500
+            await send_json(send, status, {'error': str(e)}, trace.request_id)
+            return
+        finally:
+            record_request('history_stream', 'GET', status, start)
+
+        try:
+            await cancel_on_disconnect(receive, _send_history_events(send, subscriber, chunks))
+        except ClientDisconnected:
+            return
+        # max_seconds reached: the browser reconnects with Last-Event-ID
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if subscriber is not None:
+            live.hub.unsubscribe(subscriber)
+
+
+# ==================== WSGI BRIDGE ====================
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name != 'CONTENT_TYPE':
+            name = 'HTTP_' + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def wsgi_bridge(scope, receive, send):
+    """
+    Serve a request with the Flask app on the bounded WSGI pool
+
+    Streaming responses are forwarded chunk by chunk and closed once the
+    client disconnects. Each chunk is produced on the pool, so long-lived
+    streams belong on the event loop (see history_stream_endpoint).
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_executor('wsgi')
+    try:
+        body = await read_body(receive)
+    except ClientDisconnected:
+        return
+    except RequestTooLarge:
+        await send({'type': 'http.response.start', 'status': 413, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                     for name, value in headers]
+
+    iterable = await loop.run_in_executor(pool, flask_app, build_environ(scope, body), start_response)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', **response_start})
+        chunks = iter(iterable)
+        while not disconnected.done():
+            chunk = await loop.run_in_executor(pool, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        # Runs call_on_close callbacks (post-response tasks) like a WSGI server would
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(pool, iterable.close)
+
+
+# ==================== ASGI APPLICATION ====================
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Create/upgrade the schema before the worker serves its first request
+            await asyncio.get_running_loop().run_in_executor(None, ensure_database)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Let queued history writes finish before the worker exits
+            await asyncio.get_running_loop().run_in_executor(None, wait_for_tasks, 10)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application: async generation endpoints, Flask for everything else"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    spec = GENERATION_ENDPOINTS.get(scope['path'])
+    if spec is not None and scope['method'] == 'POST':
+        return await generation_endpoint(scope, receive, send, spec)
+    if scope['path'] == HISTORY_STREAM_PATH and scope['method'] == 'GET':
+        return await history_stream_endpoint(scope, receive, send)
+    return await wsgi_bridge(scope, receive, send)
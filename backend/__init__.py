@@ -1 +1,5 @@
-# Backend module initialization
\ No newline at end of file
+# Backend module initialization
+# Settings are read from the environment at import time, so .env is loaded first
+from backend.config import load_config
+
+load_config()
@@ -1,63 +1,205 @@
 import os
 import sys
-from groq import Groq
-from dotenv import load_dotenv
+import time
+import asyncio
+import weakref
+import threading
+from backend.metrics import llm_requests_total, llm_request_duration, llm_tokens_total
+from backend.tracing import start_span, end_span
+from backend.capture import llm_span_attrs
 
-load_dotenv()
+# Groq client, created on first use in each process. The groq SDK is slow to
+# import and its httpx connection pool must not be shared across a fork
+# (gunicorn --preload), so neither happens at import time.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
 
-# Initialize Groq client
-client = None
-api_key = os.getenv("GROQ_API_KEY")
 
-if api_key:
+def get_client():
+    """
+    Get this process's Groq client, creating it on first use
+
+    Returns:
+        Groq client, or None if GROQ_API_KEY is not set or the client failed
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client_pid == pid:
+            return _client
+        _client = _create_client()
+        _client_pid = pid
+        return _client
+
+
+def _create_client():
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        print("Warning: GROQ_API_KEY not found in environment variables")
+        return None
+
+    from groq import Groq
     try:
-        # Try to initialize with different approaches
-        import httpx
-        
         # Create a custom httpx client without proxies parameter
-        http_client = httpx.Client()
-        client = Groq(api_key=api_key, http_client=http_client)
-    except Exception as e:
+        import httpx
+        return Groq(api_key=api_key, http_client=httpx.Client())
+    except Exception:
         try:
             # Fallback: try direct initialization
-            client = Groq(api_key=api_key)
+            return Groq(api_key=api_key)
         except Exception as e2:
             print(f"Warning: Could not initialize Groq client: {e2}")
-            client = None
-else:
-    print("Warning: GROQ_API_KEY not found in environment variables")
+            return None
 
 
-def generate_response(prompt):
+MODEL = "llama-3.1-8b-instant"
+SYSTEM_PROMPT = "You are a professional business intelligence AI assistant specializing in marketing, sales, and lead qualification. Provide detailed, actionable insights in a clear and structured format."
+
+
+def _chat_request(prompt, max_tokens=2000):
+    """Keyword arguments for a chat completion of one prompt"""
+    return dict(
+        model=MODEL,
+        messages=[
+            {
+                "role": "system", 
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user", 
+                "content": prompt
+            }
+        ],
+        temperature=0.7,
+        max_tokens=max_tokens,
+    )
+
+
+def _prompt_attrs(prompt):
+    """Span attributes of a prompt rendered from a template (backend/prompts.py)"""
+    attrs = {}
+    if hasattr(prompt, 'tokens'):
+        attrs['prompt_tokens_est'] = prompt.tokens
+    if getattr(prompt, 'truncated', None):
+        attrs['prompt_truncated'] = ','.join(prompt.truncated)
+    return attrs
+
+
+def _record_usage(response):
+    """Count tokens of a completion; returns span attributes"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return {}
+    llm_tokens_total.inc(usage.prompt_tokens or 0, model=MODEL, direction='prompt')
+    llm_tokens_total.inc(usage.completion_tokens or 0, model=MODEL, direction='completion')
+    return {'prompt_tokens': usage.prompt_tokens, 'completion_tokens': usage.completion_tokens}
+
+
+def generate_response(prompt, on_usage=None, max_tokens=2000):
     """
     Generate a response using Groq's API with LLaMA model.
     
     Args:
-        prompt (str): The prompt to send to the AI model
+        prompt (str): The prompt to send to the AI model (a RenderedPrompt
+            labels metrics and the trace span with its template id)
+        on_usage (callable): Optional, called with (prompt_tokens, completion_tokens)
+            after a successful completion (quota accounting)
+        max_tokens (int): Completion length cap (SECTION_MAX_TOKENS for one section)
         
     Returns:
         str: The generated response from the AI model
     """
+    client = get_client()
     if not client:
         raise Exception("Groq client not initialized. Please check your API key in the .env file.")
     
+    start = time.perf_counter()
+    status = 'error'
+    usage_attrs = {}
+    template = getattr(prompt, 'template_id', 'adhoc')
+    trace_span = start_span('llm.generate', model=MODEL, template=template, prompt_chars=len(prompt),
+                            **_prompt_attrs(prompt), **llm_span_attrs(prompt))
     try:
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a professional business intelligence AI assistant specializing in marketing, sales, and lead qualification. Provide detailed, actionable insights in a clear and structured format."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            max_tokens=2000,
-        )
-        
+        response = client.chat.completions.create(**_chat_request(prompt, max_tokens))
+        status = 'ok'
+        usage_attrs = _record_usage(response)
+        if on_usage and usage_attrs:
+            on_usage(usage_attrs['prompt_tokens'], usage_attrs['completion_tokens'])
+        return response.choices[0].message.content
+    except Exception as e:
+        raise Exception(f"Error generating response: {str(e)}")
+    finally:
+        llm_request_duration.observe(time.perf_counter() - start, model=MODEL, template=template)
+        llm_requests_total.inc(model=MODEL, template=template, status=status)
+        end_span(trace_span, status=status, **usage_attrs)
+
+
+# ==================== ASYNC CLIENT ====================
+
+# Concurrent connections to Groq per process in async mode (httpx defaults to 100)
+ASYNC_LLM_MAX_CONNECTIONS = int(os.getenv('ASYNC_LLM_MAX_CONNECTIONS', '500'))
+
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Get the AsyncGroq client of the running event loop, creating it on first use
+
+    Returns:
+        AsyncGroq client, or None if GROQ_API_KEY is not set
+    """
+    loop = asyncio.get_running_loop()
+    if loop in _async_clients:
+        return _async_clients[loop]
+
+    api_key = os.getenv("GROQ_API_KEY")
+    client = None
+    if api_key:
+        import httpx
+        from groq import AsyncGroq
+        limits = httpx.Limits(max_connections=ASYNC_LLM_MAX_CONNECTIONS,
+                              max_keepalive_connections=ASYNC_LLM_MAX_CONNECTIONS)
+        client = AsyncGroq(api_key=api_key, http_client=httpx.AsyncClient(limits=limits, timeout=120))
+    else:
+        print("Warning: GROQ_API_KEY not found in environment variables")
+    _async_clients[loop] = client
+    return client
+
+
+async def generate_response_async(prompt, on_usage=None, max_tokens=2000):
+    """
+    Async version of generate_response() for the ASGI serving mode
+
+    Cancelling the awaiting task aborts the HTTP request to Groq.
+    """
+    client = get_async_client()
+    if not client:
+        raise Exception("Groq client not initialized. Please check your API key in the .env file.")
+    
+    start = time.perf_counter()
+    status = 'error'
+    usage_attrs = {}
+    template = getattr(prompt, 'template_id', 'adhoc')
+    trace_span = start_span('llm.generate', model=MODEL, template=template, prompt_chars=len(prompt),
+                            **_prompt_attrs(prompt), **llm_span_attrs(prompt))
+    try:
+        response = await client.chat.completions.create(**_chat_request(prompt, max_tokens))
+        status = 'ok'
+        usage_attrs = _record_usage(response)
+        if on_usage and usage_attrs:
+            on_usage(usage_attrs['prompt_tokens'], usage_attrs['completion_tokens'])
         return response.choices[0].message.content
+    except asyncio.CancelledError:
+        status = 'cancelled'
+        raise
     except Exception as e:
         raise Exception(f"Error generating response: {str(e)}")
+    finally:
+        llm_request_duration.observe(time.perf_counter() - start, model=MODEL, template=template)
+        llm_requests_total.inc(model=MODEL, template=template, status=status)
+        end_span(trace_span, status=status, **usage_attrs)
@@ -0,0 +1,361 @@
+"""
+Static asset pipeline
+Bundles and minifies the CSS and JS that the templates load on every page.
+Writes content-hashed copies to frontend/static/dist/ with gzip variants
+(and brotli variants if the brotli package is installed), and records them
+in dist/manifest.json:
+
+    python -m backend.assets build
+    python -m backend.assets report    # bytes and requests per page, before/after
+
+Templates call asset_urls('app.css'). With a manifest it returns the one
+hashed bundle URL. Without one (development) it returns the source files.
+Responses under /static/dist/ use the precompressed variant the client
+accepts and are cached for a year as immutable. A changed file gets a new
+name, so it is never served stale.
+"""
+
+import os
+import re
+import json
+import gzip
+import hashlib
+import argparse
+import mimetypes
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT, 'frontend', 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# Output name -> source files (relative to frontend/static), in load order
+BUNDLES = {
+    'app.css': ['css/style.css', 'css/modern.css'],
+    'app.js': ['js/history-tracker.js', 'js/main.js', 'js/modern.js'],
+    'auth.css': ['css/modern.css'],
+    'logo.svg': ['images/marketai-logo.svg'],
+}
+
+# Assets each kind of page loads (for the size report)
+PAGES = {
+    'app pages (base.html)': ['app.css', 'app.js', 'logo.svg'],
+    'auth pages (login, signup, ...)': ['auth.css'],
+}
+
+# Cache lifetime of fingerprinted files, in seconds
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Precompressed variants: Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+# ==================== MINIFICATION ====================
+
+_CSS_STRINGS_AND_COMMENTS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+_CSS_STRINGS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+
+
+def minify_css(source):
+    """Strip comments and whitespace that CSS does not need"""
+    source = _CSS_STRINGS_AND_COMMENTS.sub(lambda m: m.group(1) or '', source)
+    parts = _CSS_STRINGS.split(source)
+    for i in range(0, len(parts), 2):
+        text = re.sub(r'\s+', ' ', parts[i])
+        text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+        # Only after ':' - a space before it is a descendant selector (a :hover)
+        text = re.sub(r':\s+', ':', text)
+        parts[i] = text.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+# A '/' after one of these starts a regular expression literal, not a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void',
+                   'throw', 'instanceof', 'yield', 'await'}
+
+
+def _regex_allowed(out):
+    text = ''.join(out[-32:]).rstrip()
+    if not text or text[-1] in _REGEX_PRECEDERS:
+        return True
+    word = re.search(r'[A-Za-z_$][\w$]*$', text)
+    return bool(word) and word.group(0) in _REGEX_KEYWORDS
+
+
+def _skip_quoted(source, i, quote):
+    """Index just past the string (or regex) literal starting at i"""
+    j = i + 1
+    in_class = False
+    while j < len(source):
+        c = source[j]
+        if c == '\\':
+            j += 2
+            continue
+        if quote == '/' and c == '[':
+            in_class = True
+        elif quote == '/' and c == ']':
+            in_class = False
+        elif c == quote and not in_class:
+            return j + 1
+        j += 1
+    return j
+
+
+def minify_js(source):
+    """
+    Conservative JS minifier: drops comments, indentation and blank lines
+
+    Line breaks are kept, so automatic semicolon insertion behaves exactly
+    as in the source. Strings, template literals and regex literals are
+    copied untouched.
+    """
+    out = []
+
+    def space():
+        if out and out[-1] not in (' ', '\n'):
+            out.append(' ')
+
+    def newline():
+        if out and out[-1] == ' ':
+            out.pop()
+        if out and out[-1] != '\n':
+            out.append('\n')
+
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        nxt = source[i + 1] if i + 1 < n else ''
+        if c in '"\'`':
+            j = _skip_quoted(source, i, c)
+            out.append(source[i:j])
+            i = j
+        elif c == '/' and nxt == '/':
+            while i < n and source[i] != '\n':
+                i += 1
+        elif c == '/' and nxt == '*':
+            end = source.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            # A comment spanning lines still separates statements
+            newline() if '\n' in source[i:end] else space()
+            i = end
+        elif c == '/' and _regex_allowed(out):
+            j = _skip_quoted(source, i, '/')
+            while j < n and source[j].isalnum():
+                j += 1
+            out.append(source[i:j])
+            i = j
+        elif c in ' \t':
+            space()
+            i += 1
+        elif c in '\r\n':
+            newline()
+            i += 1
+        else:
+            out.append(c)
+            i += 1
+
+    if out and out[-1] in (' ', '\n'):
+        out.pop()
+    return ''.join(out)
+
+
+def _minify(name, text):
+    if name.endswith('.css'):
+        return minify_css(text)
+    if name.endswith('.js'):
+        return minify_js(text)
+    return text
+
+
+# ==================== BUILD ====================
+
+def bundle_source(name):
+    """Concatenated, minified contents of one bundle"""
+    chunks = []
+    for path in BUNDLES[name]:
+        with open(os.path.join(STATIC_DIR, path), encoding='utf-8') as f:
+            chunks.append(_minify(name, f.read()))
+    # A separator so a file without a trailing semicolon cannot run into the next
+    return (';\n' if name.endswith('.js') else '\n').join(chunks)
+
+
+def fingerprinted_name(name, data):
+    """app.css + contents -> app.<hash>.css"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def compress(data):
+    """Precompressed variants of a file: {suffix: bytes}"""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+def build(dist_dir=DIST_DIR):
+    """
+    Write every bundle, its compressed variants and the manifest
+
+    Files of the previous build are kept, so pages rendered before a deploy
+    can still load their assets. Anything older is deleted.
+
+    Returns:
+        The new manifest (bundle name -> fingerprinted file name)
+    """
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest_path = os.path.join(dist_dir, 'manifest.json')
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            previous = json.load(f)
+
+    manifest = {}
+    for name in BUNDLES:
+        data = bundle_source(name).encode('utf-8')
+        filename = fingerprinted_name(name, data)
+        with open(os.path.join(dist_dir, filename), 'wb') as f:
+            f.write(data)
+        for suffix, compressed in compress(data).items():
+            with open(os.path.join(dist_dir, filename + suffix), 'wb') as f:
+                f.write(compressed)
+        manifest[name] = filename
+
+    keep = set(manifest.values()) | set(previous.values())
+    for filename in os.listdir(dist_dir):
+        base = re.sub(r'\.(gz|br)$', '', filename)
+        if filename != 'manifest.json' and base not in keep:
+            os.remove(os.path.join(dist_dir, filename))
+
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    reload_manifest()
+    return manifest
+
+
+def size_report():
+    """
+    Bytes and requests per page before (source files, uncompressed) and after the build
+
+    Returns:
+        List of dicts per page: requests, bytes, gzip and brotli transfer sizes
+    """
+    report = []
+    for page, names in PAGES.items():
+        sources = [path for name in names for path in BUNDLES[name]]
+        before = 0
+        for path in dict.fromkeys(sources):
+            before += os.path.getsize(os.path.join(STATIC_DIR, path))
+        built = [bundle_source(name).encode('utf-8') for name in names]
+        report.append({
+            'page': page,
+            'requests_before': len(dict.fromkeys(sources)),
+            'requests_after': len(names),
+            'bytes_before': before,
+            'bytes_minified': sum(len(data) for data in built),
+            'bytes_gzip': sum(len(compress(data)['.gz']) for data in built),
+            'bytes_brotli': sum(len(compress(data)['.br']) for data in built) if brotli else None,
+        })
+    return report
+
+
+# ==================== TEMPLATES AND SERVING ====================
+
+def reload_manifest():
+    """Forget the cached manifest (re-read on next use)"""
+    global _manifest
+    with _manifest_lock:
+        _manifest = None
+
+
+def get_manifest():
+    """Bundle name -> fingerprinted file, or {} if the assets were not built"""
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                try:
+                    with open(MANIFEST_PATH, encoding='utf-8') as f:
+                        _manifest = json.load(f)
+                except (OSError, ValueError):
+                    _manifest = {}
+    return _manifest
+
+
+def asset_urls(name):
+    """URLs a template includes for a bundle: the built file, or its sources in development"""
+    from flask import url_for
+    built = get_manifest().get(name)
+    if built:
+        return [url_for('dist_asset', filename=built)]
+    return [url_for('static', filename=path) for path in BUNDLES[name]]
+
+
+def asset_url(name):
+    """URL of a single-file asset (see asset_urls)"""
+    return asset_urls(name)[0]
+
+
+def serve_dist_asset(filename):
+    """Serve a fingerprinted file, precompressed if the client accepts it, cached as immutable"""
+    from flask import request, send_from_directory, abort
+    if filename == 'manifest.json' or filename.endswith(('.gz', '.br')):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype)
+
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = ASSET_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Expose asset_urls()/asset_url() to templates and serve /static/dist/"""
+    app.jinja_env.globals['asset_urls'] = asset_urls
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.add_url_rule('/static/dist/<path:filename>', 'dist_asset', serve_dist_asset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Static asset pipeline')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='Bundle, minify, fingerprint and precompress the static assets')
+    sub.add_parser('report', help='Bytes and requests per page before and after the build')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        for name, filename in build().items():
+            print(f'{name:<10} -> dist/{filename}')
+        if brotli is None:
+            print('brotli is not installed; only gzip variants were written (pip install brotli)')
+        print()
+
+    print(f"{'page':<34}{'requests':>10}{'source':>10}{'minified':>10}{'gzip':>8}{'brotli':>8}")
+    for row in size_report():
+        requests = f"{row['requests_before']} -> {row['requests_after']}"
+        print(f"{row['page']:<34}{requests:>10}{row['bytes_before']:>10}{row['bytes_minified']:>10}"
+              f"{row['bytes_gzip']:>8}{row['bytes_brotli'] or '-':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,13 @@ Authentication module for user signup, login, email verification, and password r
 """
 
 import re
-from werkzeug.security import generate_password_hash, check_password_hash
+from backend.passwords import hash_password, verify_password, needs_rehash, HashingBusy
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from backend.database import (
     create_user, get_user_by_email, verify_user_email, update_user_password
 )
 from backend.email_utils import send_verification_email, send_password_reset_email
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 # Secret key for token signing
 SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -103,7 +100,7 @@ def signup_user(name, email, password, password_confirm):
         return False, "Email already registered", None
     
     # Hash password and create user
-    password_hash = generate_password_hash(password)
+    password_hash = hash_password(password)
     user_id = create_user(name.strip(), email.strip(), password_hash)
     
     if not user_id:
@@ -178,9 +175,17 @@ def login_user(email, password):
     #     return False, "Please verify your email before logging in", None
     
     # Check password
-    if not check_password_hash(user['password_hash'], password):
+    if not verify_password(user['password_hash'], password):
         return False, "Invalid password", None
     
+    # Upgrade hashes made with older parameters while we have the password.
+    # Best effort: a busy pool must not fail a correct login; the next login retries.
+    if needs_rehash(user['password_hash']):
+        try:
+            update_user_password(user['id'], hash_password(password))
+        except HashingBusy as e:
+            print(f"Password rehash skipped: {str(e)}")
+    
     return True, "Login successful", user['id']
 
 # ==================== PASSWORD RESET ====================
@@ -238,7 +243,7 @@ def reset_password(token, new_password, new_password_confirm):
         return False, msg
     
     # Update password
-    password_hash = generate_password_hash(new_password)
+    password_hash = hash_password(new_password)
     updated = update_user_password(user_id, password_hash)
     
     if updated:
@@ -0,0 +1,236 @@
+"""
+Opt-in production traffic capture
+With TRAFFIC_CAPTURE=true, every finished request trace is appended as
+one compact JSON line to TRAFFIC_CAPTURE_PATH. A line holds:
+- the route template (not the concrete path)
+- status and duration
+- request and response sizes
+- the length of each JSON field
+- for every LLM call: a keyed prompt hash, prompt length, token counts
+  and latency
+
+Users appear only as keyed pseudonyms. No content, ids, IPs or user
+agents are stored. benchmarks/replay.py replays a capture against a local
+server and a fake Groq that reproduces the recorded LLM latencies and
+output lengths:
+
+    python -m backend.capture summary logs/traffic.jsonl
+
+Keys: t start time, r "METHOD /route", s status, d duration ms, u user
+pseudonym, i request bytes, o response bytes, f {field: length},
+l [{h prompt hash, tv prompt template id, pc prompt chars,
+pt/ct prompt/completion tokens, d ms, ok}], m 'async' for the async generation endpoints.
+"""
+
+import os
+import hmac
+import json
+import time
+import atexit
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from backend.tracing import annotate_trace, add_trace_listener
+
+# Record request traces (off unless explicitly enabled)
+TRAFFIC_CAPTURE = os.getenv('TRAFFIC_CAPTURE', 'false').lower() in ('1', 'true', 'yes')
+
+# Append-only capture file (JSON lines)
+TRAFFIC_CAPTURE_PATH = os.getenv(
+    'TRAFFIC_CAPTURE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs', 'traffic.jsonl')
+)
+
+# Fraction of users (and of anonymous requests) captured
+TRAFFIC_CAPTURE_SAMPLE = float(os.getenv('TRAFFIC_CAPTURE_SAMPLE', '1.0'))
+
+# Key for prompt hashes and user pseudonyms (defaults to SECRET_KEY); keep it
+# stable across workers and restarts so repeated prompts hash alike
+TRAFFIC_CAPTURE_KEY = os.getenv('TRAFFIC_CAPTURE_KEY') or os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+
+# Buffered lines are written once this many are queued or this many seconds passed
+CAPTURE_FLUSH_RECORDS = 100
+CAPTURE_FLUSH_SECONDS = 1.0
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _digest(kind, value, length):
+    key = TRAFFIC_CAPTURE_KEY.encode('utf-8')
+    return hmac.new(key, f'{kind}:{value}'.encode('utf-8'), hashlib.sha256).hexdigest()[:length]
+
+
+def prompt_hash(prompt):
+    """Keyed hash of a prompt: equal prompts match, contents cannot be recovered"""
+    return _digest('prompt', prompt, 16)
+
+
+def user_pseudonym(user_id):
+    return _digest('user', user_id, 12) if user_id else None
+
+
+def llm_span_attrs(prompt):
+    """Extra llm.generate span attributes while capturing"""
+    return {'prompt_hash': prompt_hash(prompt)} if TRAFFIC_CAPTURE else {}
+
+
+def _sampled(pseudonym):
+    if TRAFFIC_CAPTURE_SAMPLE >= 1:
+        return True
+    if pseudonym:
+        # Whole users are kept or dropped, so their sessions replay coherently
+        return int(pseudonym[:8], 16) / 0xFFFFFFFF < TRAFFIC_CAPTURE_SAMPLE
+    return random.random() < TRAFFIC_CAPTURE_SAMPLE
+
+
+def annotate_request(method, route, user_id, request_bytes, response_bytes, body=None):
+    """
+    Attach the anonymized request facts to the current trace
+
+    Args:
+        route: Route template ('/api/history/item/<int:history_id>')
+        body: Parsed JSON body; only the length of each field is kept
+    """
+    if not TRAFFIC_CAPTURE:
+        return
+    pseudonym = user_pseudonym(user_id)
+    if not _sampled(pseudonym):
+        return
+    fields = None
+    if isinstance(body, dict):
+        fields = {str(k)[:40]: len(v) if isinstance(v, str) else len(json.dumps(v)) for k, v in body.items()}
+    annotate_trace(capture={'r': f'{method} {route}', 'u': pseudonym, 'i': request_bytes,
+                            'o': response_bytes, 'f': fields})
+
+
+def capture_line(record):
+    """Compact capture entry for a finished trace record (None if not annotated)"""
+    attrs = record.get('attrs', {})
+    facts = attrs.get('capture')
+    if not facts:
+        return None
+    entry = {'t': round(record['timestamp'], 3), 'r': facts['r'], 's': attrs.get('status'),
+             'd': round(record['duration_ms'], 1)}
+    for key in ('u', 'i', 'o', 'f'):
+        if facts.get(key) is not None:
+            entry[key] = facts[key]
+    if attrs.get('mode'):
+        entry['m'] = attrs['mode']
+    calls = []
+    for span in record.get('spans', []):
+        if span['name'] != 'llm.generate':
+            continue
+        span_attrs = span['attrs']
+        call = {'h': span_attrs.get('prompt_hash'), 'tv': span_attrs.get('template'),
+                'pc': span_attrs.get('prompt_chars'),
+                'pt': span_attrs.get('prompt_tokens'), 'ct': span_attrs.get('completion_tokens'),
+                'd': round(span['duration_ms'] or 0, 1), 'ok': span_attrs.get('status') == 'ok'}
+        calls.append({k: v for k, v in call.items() if v is not None})
+    if calls:
+        entry['l'] = calls
+    return json.dumps(entry, separators=(',', ':'))
+
+
+def _on_trace(record):
+    line = capture_line(record)
+    if line is not None:
+        with _buffer_lock:
+            _buffer.append(line)
+            due = len(_buffer) >= CAPTURE_FLUSH_RECORDS or time.monotonic() - _last_flush >= CAPTURE_FLUSH_SECONDS
+        if due:
+            flush()
+
+
+def flush():
+    """Append buffered lines to the capture file in one write"""
+    global _last_flush
+    with _buffer_lock:
+        lines, _buffer[:] = list(_buffer), []
+        _last_flush = time.monotonic()
+    if not lines:
+        return
+    try:
+        os.makedirs(os.path.dirname(TRAFFIC_CAPTURE_PATH), exist_ok=True)
+        # O_APPEND and a single write keep lines from concurrent workers whole
+        with open(TRAFFIC_CAPTURE_PATH, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+    except Exception as e:
+        print(f"Traffic capture error: {str(e)}")
+
+
+def read_capture(path):
+    """Capture entries of a file, oldest first"""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    entries.sort(key=lambda e: e['t'])
+    return entries
+
+
+def summarize(entries):
+    """
+    Traffic mix and LLM prompt reuse of a capture
+
+    Returns:
+        Dict with duration_s, requests, users, routes (counts), llm_calls and
+        repeated_prompts (calls whose prompt hash was seen before: the hit
+        rate of a perfect prompt cache)
+    """
+    hashes = [call['h'] for e in entries for call in e.get('l', []) if call.get('h')]
+    seen, repeated = set(), 0
+    for h in hashes:
+        repeated += h in seen
+        seen.add(h)
+    return {
+        'duration_s': round(entries[-1]['t'] - entries[0]['t'], 1) if entries else 0,
+        'requests': len(entries),
+        'users': len({e['u'] for e in entries if e.get('u')}),
+        'routes': dict(Counter(e['r'] for e in entries).most_common()),
+        'llm_calls': len(hashes),
+        'repeated_prompts': repeated,
+        'prompt_cache_hit_rate': round(repeated / len(hashes), 3) if hashes else 0.0,
+    }
+
+
+def init_app(app):
+    """Annotate Flask request traces and write them to the capture file"""
+    from flask import request, session
+
+    @app.after_request
+    def _capture_annotate(response):
+        if TRAFFIC_CAPTURE:
+            route = request.url_rule.rule if request.url_rule else '<unmatched>'
+            annotate_request(request.method, route, session.get('logged_in_user_id'),
+                             request.content_length or 0,
+                             None if response.is_streamed else response.calculate_content_length(),
+                             request.get_json(silent=True) if request.is_json else None)
+        return response
+
+    add_trace_listener(_on_trace)
+    atexit.register(flush)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect traffic capture files')
+    sub = parser.add_subparsers(dest='command', required=True)
+    summary = sub.add_parser('summary', help='Traffic mix and prompt reuse of a capture file')
+    summary.add_argument('path', nargs='?', default=TRAFFIC_CAPTURE_PATH)
+    args = parser.parse_args()
+
+    stats = summarize(read_capture(args.path))
+    print(f"{stats['requests']} requests from {stats['users']} users over {stats['duration_s']}s")
+    print(f"{stats['llm_calls']} LLM calls, {stats['repeated_prompts']} repeated prompts "
+          f"(perfect prompt cache hit rate {stats['prompt_cache_hit_rate']:.1%})\n")
+    for route, count in stats['routes'].items():
+        print(f'{count:>8}  {route}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""
+Configuration loading
+Reads .env into the process environment exactly once, before any backend
+module reads its settings (backend/__init__.py calls load_config()).
+Values already set in the real environment win over .env.
+"""
+
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_config():
+    """Load .env once per process; later calls are no-ops"""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        from dotenv import load_dotenv
+        load_dotenv()
+        _loaded = True
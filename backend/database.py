@@ -1,20 +1,68 @@
 import sqlite3
 import json
+import sys
+import time
 from datetime import datetime, timedelta
 import os
+import threading
 from contextlib import contextmanager
+from backend.metrics import db_operation_duration, db_errors_total
+from backend.tracing import span
 
-DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'marketmind.db')
+DATABASE_PATH = os.getenv(
+    'DATABASE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'marketmind.db')
+)
+
+# Metadata fields exposed as virtual generated columns on user_history.
+# Maps column name -> JSON path inside the metadata TEXT column.
+HISTORY_METADATA_COLUMNS = {
+    'meta_product': '$.product',
+    'meta_audience': '$.audience',
+    'meta_platform': '$.platform',
+    'meta_persona': '$.persona',
+    'meta_lead_name': '$.name',
+    'meta_urgency': '$.urgency',
+}
+
+# Structured lead scores (see backend/leads.py) as typed generated columns.
+# Maps column name -> (type, JSON path inside metadata).
+LEAD_SCORE_COLUMNS = {
+    'lead_score': ('INTEGER', '$.scores.score'),
+    'lead_conversion': ('INTEGER', '$.scores.conversion_probability'),
+    'lead_readiness': ('TEXT', '$.scores.readiness'),
+}
+
+# Database path whose schema this process has already created/upgraded
+_schema_ready = None
+_schema_lock = threading.Lock()
+
+# Days of history_changes kept for incremental sync
+HISTORY_CHANGES_RETENTION_DAYS = int(os.getenv('HISTORY_CHANGES_RETENTION_DAYS', '7'))
 
 @contextmanager
-def get_db():
-    """Context manager for database connections"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
+def get_db(operation=None):
+    """
+    Context manager for database connections
+    
+    The time the connection is held is recorded under `operation`, which
+    defaults to the name of the calling function.
+    """
+    if operation is None:
+        # Frame 0 is this generator, 1 is contextlib's __enter__, 2 the caller
+        operation = sys._getframe(2).f_code.co_name
+    start = time.perf_counter()
+    with span(f'db.{operation}'):
+        conn = sqlite3.connect(DATABASE_PATH)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        except Exception:
+            db_errors_total.inc(operation=operation)
+            raise
+        finally:
+            conn.close()
+            db_operation_duration.observe(time.perf_counter() - start, operation=operation)
 
 def init_database():
     """Initialize SQLite database with all required tables"""
@@ -58,9 +106,251 @@ def init_database():
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON user_history(timestamp)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_action_type ON user_history(action_type)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_timestamp ON user_history(user_id, timestamp DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_timestamp_id ON user_history(user_id, timestamp DESC, id DESC)')
+        
+        # Generated columns for commonly filtered metadata fields
+        _ensure_history_metadata_columns(cursor)
+        
+        # Page visit aggregates - one row per visitor, page and minute.
+        # Logged-in visitors use user_id (session_id = ''), anonymous ones
+        # use their session id (user_id = 0).
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS page_visit_counts (
+                user_id INTEGER NOT NULL DEFAULT 0,
+                session_id TEXT NOT NULL DEFAULT '',
+                page_url TEXT NOT NULL,
+                minute TEXT NOT NULL,
+                visit_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, session_id, page_url, minute)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_visit_counts_minute ON page_visit_counts(minute)')
+        
+        # Per-user history version, bumped by triggers on every insert/delete
+        # so readers can validate cached history with a single key lookup
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS history_versions (
+                user_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_history_version_insert
+            AFTER INSERT ON user_history
+            BEGIN
+                INSERT INTO history_versions (user_id, version) VALUES (NEW.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_history_version_delete
+            AFTER DELETE ON user_history
+            BEGIN
+                INSERT INTO history_versions (user_id, version) VALUES (OLD.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
+        ''')
+        
+        # Append-only change log feeding /api/history/changes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS history_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                history_id INTEGER NOT NULL,
+                op TEXT NOT NULL CHECK (op IN ('insert', 'delete')),
+                changed_at DATETIME NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_changes_user_seq ON history_changes(user_id, seq)')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_history_changes_insert
+            AFTER INSERT ON user_history
+            BEGIN
+                INSERT INTO history_changes (user_id, history_id, op, changed_at)
+                VALUES (NEW.user_id, NEW.id, 'insert', strftime('%Y-%m-%dT%H:%M:%f', 'now'));
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_history_changes_delete
+            AFTER DELETE ON user_history
+            BEGIN
+                INSERT INTO history_changes (user_id, history_id, op, changed_at)
+                VALUES (OLD.user_id, OLD.id, 'delete', strftime('%Y-%m-%dT%H:%M:%f', 'now'));
+            END
+        ''')
+        
+        # Campaign/pitch results split into their numbered sections (backend/sections.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS history_sections (
+                history_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                section_key TEXT NOT NULL,
+                heading TEXT NOT NULL,
+                body TEXT NOT NULL,
+                PRIMARY KEY (history_id, position)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_history_sections_delete
+            AFTER DELETE ON user_history
+            BEGIN
+                DELETE FROM history_sections WHERE history_id = OLD.id;
+            END
+        ''')
+        
+        # Highest pruned change log position per user; cursors below it
+        # can no longer be served incrementally
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS history_change_floors (
+                user_id INTEGER PRIMARY KEY,
+                seq INTEGER NOT NULL
+            )
+        ''')
+        
+        # Durable queue of outgoing emails, drained by the outbox sender
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                to_email TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                html_body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending'
+                    CHECK (status IN ('pending', 'sending', 'sent', 'dead')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at DATETIME NOT NULL,
+                claimed_at DATETIME,
+                last_error TEXT,
+                created_at DATETIME NOT NULL,
+                sent_at DATETIME
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)')
+        outbox_columns = {row[1] for row in cursor.execute('PRAGMA table_info(email_outbox)')}
+        if 'dedupe_key' not in outbox_columns:
+            cursor.execute('ALTER TABLE email_outbox ADD COLUMN dedupe_key TEXT')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_email_outbox_dedupe
+            ON email_outbox(dedupe_key) WHERE dedupe_key IS NOT NULL
+        ''')
+        
+        # One row per digest period; last_user_id is the resume checkpoint
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS digest_runs (
+                period TEXT PRIMARY KEY,
+                started_at DATETIME NOT NULL,
+                finished_at DATETIME,
+                last_user_id INTEGER NOT NULL DEFAULT 0,
+                queued_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Windowed event counters shared by all workers (login throttling, generation quotas)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_counters (
+                bucket TEXT NOT NULL,
+                window_id INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (bucket, window_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Per-user quota overrides set by admins (NULL = the configured default)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_quotas (
+                user_id INTEGER PRIMARY KEY,
+                daily_tokens INTEGER,
+                rate_limit INTEGER,
+                updated_at DATETIME NOT NULL,
+                updated_by TEXT,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''')
+        
+        prune_history_changes(cursor)
         
         conn.commit()
 
+def ensure_database():
+    """
+    Create/upgrade the schema once per process, before its first request
+    
+    Importing the app does not touch the database; the web servers call
+    this lazily, and `flask init-db` / `python -m backend.database` run it
+    ahead of a deploy.
+    """
+    global _schema_ready
+    if _schema_ready == DATABASE_PATH:
+        return
+    with _schema_lock:
+        if _schema_ready != DATABASE_PATH:
+            try:
+                init_database()
+                _schema_ready = DATABASE_PATH
+            except Exception as e:
+                # Retried on the next request; the route reports its own database error
+                print(f"Schema setup error: {str(e)}")
+
+def prune_history_changes(cursor):
+    """
+    Drop change log entries older than the retention window (on the caller's transaction)
+    
+    The highest dropped position per user is kept in history_change_floors
+    so older cursors get a reset instead of silently missing changes.
+    
+    Returns:
+        Number of entries deleted
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=HISTORY_CHANGES_RETENTION_DAYS)).isoformat()
+    cursor.execute('''
+        INSERT INTO history_change_floors (user_id, seq)
+        SELECT user_id, MAX(seq) FROM history_changes WHERE changed_at < ? GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET seq = MAX(seq, excluded.seq)
+    ''', (cutoff,))
+    cursor.execute('DELETE FROM history_changes WHERE changed_at < ?', (cutoff,))
+    return cursor.rowcount
+
+def _ensure_history_metadata_columns(cursor):
+    """Add JSON1-extracted virtual columns and their indexes to user_history"""
+    cursor.execute('PRAGMA table_xinfo(user_history)')
+    existing = {row[1] for row in cursor.fetchall()}
+    
+    columns = {column: ('TEXT', path) for column, path in HISTORY_METADATA_COLUMNS.items()}
+    columns.update(LEAD_SCORE_COLUMNS)
+    for column, (column_type, path) in columns.items():
+        if column not in existing:
+            # VIRTUAL columns can be added to an existing table; json_valid guards
+            # against legacy rows whose metadata is not valid JSON
+            cursor.execute(f'''
+                ALTER TABLE user_history ADD COLUMN {column} {column_type}
+                GENERATED ALWAYS AS (
+                    CASE WHEN json_valid(metadata) THEN json_extract(metadata, '{path}') END
+                ) VIRTUAL
+            ''')
+    
+    # Filter, order and action_type are all answered from the index, so the table
+    # is only read for the rows returned. Not fully covering: that would copy the
+    # metadata (with the multi-KB LLM result) into every one of these indexes.
+    for column in HISTORY_METADATA_COLUMNS:
+        name = f'idx_history_{column}'
+        indexed = [row[2] for row in cursor.execute(f'PRAGMA index_info({name})')]
+        if indexed and 'action_type' not in indexed:
+            # Built by an older version without action_type
+            cursor.execute(f'DROP INDEX {name}')
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS {name}
+            ON user_history(user_id, {column}, timestamp DESC, action_type)
+        ''')
+    
+    # Ranked lead lookups; partial, so only scored leads are indexed
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_top_leads
+        ON user_history(user_id, lead_score DESC, id DESC) WHERE lead_score IS NOT NULL
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_lead_readiness
+        ON user_history(user_id, lead_readiness, lead_score DESC, id DESC) WHERE lead_score IS NOT NULL
+    ''')
+
 def log_history_event(user_id, page_url, page_title, action_type, metadata=None, ip_address=None, user_agent=None):
     """Log a user action or page visit to history"""
     with get_db() as conn:
@@ -82,6 +372,14 @@ def log_history_event(user_id, page_url, page_title, action_type, metadata=None,
         conn.commit()
         return cursor.lastrowid
 
+def get_history_version(user_id):
+    """Get the user's history version (0 if nothing was ever logged)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT version FROM history_versions WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        return row['version'] if row else 0
+
 def get_user_history(user_id, limit=100, action_type=None):
     """Get user's history entries (most recent first)"""
     with get_db() as conn:
@@ -771,7 +1069,6 @@ def update_user_password(user_id, password_hash):
         conn.commit()
         return cursor.rowcount > 0
 
-# Initialize database on import
-if not os.path.exists(DATABASE_PATH):
+if __name__ == '__main__':
     init_database()
-
+    print(f'Schema ready: {DATABASE_PATH}')
@@ -0,0 +1,239 @@
+"""
+Weekly activity digest emails
+Users are streamed from the database in chunks of DIGEST_CHUNK_SIZE (keyset
+on users.id). Each chunk's activity rollups are loaded with one grouped
+query, rendered with the precompiled digest template and added to the email
+outbox, whose sender delivers them in batches over one SMTP connection
+while the job renders the next chunks.
+
+A chunk's messages and the run checkpoint (digest_runs.last_user_id) are
+committed in one transaction, and every message carries the dedupe key
+digest:<period>:<user id>. A run that crashed resumes after its last
+committed chunk without queueing anybody twice. Run it weekly from cron:
+
+    python -m backend.digest send [--period 2026-W41]
+    python -m backend.digest status
+"""
+
+import os
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from backend.database import get_db, init_database
+from backend.email_utils import render_email, is_email_configured, APP_URL
+from backend import outbox
+
+# Users loaded, rendered and queued per transaction
+DIGEST_CHUNK_SIZE = int(os.getenv('DIGEST_CHUNK_SIZE', '200'))
+
+# Skip users without any activity in the period
+DIGEST_SKIP_INACTIVE = os.getenv('DIGEST_SKIP_INACTIVE', 'true').lower() in ('1', 'true', 'yes')
+
+# Generated items listed per digest
+DIGEST_RECENT_ITEMS = 3
+
+# Rows of the digest table: history action type -> label
+DIGEST_ROLLUP_LABELS = (
+    ('campaign_generated', 'Campaigns generated'),
+    ('pitch_generated', 'Sales pitches generated'),
+    ('lead_scored', 'Leads scored'),
+)
+
+
+def period_bounds(period=None, today=None):
+    """
+    Resolve an ISO week label to its date range
+
+    Args:
+        period: 'YYYY-Www' label (default: the last complete week)
+        today: Reference date for the default period
+
+    Returns:
+        (label, start datetime, end datetime) - end is exclusive
+    """
+    if period is None:
+        last_week = (today or datetime.utcnow().date()) - timedelta(days=7)
+        year, week, _ = last_week.isocalendar()
+        period = f'{year}-W{week:02d}'
+    year, week = period.split('-W')
+    start = date.fromisocalendar(int(year), int(week), 1)
+    start = datetime(start.year, start.month, start.day)
+    return period, start, start + timedelta(days=7)
+
+
+def iter_user_chunks(after_id=0, chunk_size=DIGEST_CHUNK_SIZE):
+    """Yield lists of users (id, name, email) in id order, one query per chunk"""
+    while True:
+        with get_db('digest_users') as conn:
+            rows = conn.execute('''
+                SELECT id, name, email FROM users WHERE id > ? ORDER BY id LIMIT ?
+            ''', (after_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield [dict(row) for row in rows]
+        after_id = rows[-1]['id']
+
+
+def load_rollups(user_ids, start, end):
+    """
+    Activity counts and latest generated products for a chunk of users
+
+    Returns:
+        Dict of user_id -> {'counts': {action_type: n}, 'visits': n, 'recent': [product, ...]}
+    """
+    rollups = {user_id: {'counts': {}, 'visits': 0, 'recent': []} for user_id in user_ids}
+    if not user_ids:
+        return rollups
+    placeholders = ','.join('?' * len(user_ids))
+    start_ts, end_ts = start.isoformat(), end.isoformat()
+
+    with get_db('digest_rollups') as conn:
+        for row in conn.execute(f'''
+            SELECT user_id, action_type, COUNT(*) AS n FROM user_history
+            WHERE user_id IN ({placeholders}) AND timestamp >= ? AND timestamp < ?
+            GROUP BY user_id, action_type
+        ''', list(user_ids) + [start_ts, end_ts]):
+            rollups[row['user_id']]['counts'][row['action_type']] = row['n']
+
+        for row in conn.execute(f'''
+            SELECT user_id, SUM(visit_count) AS visits FROM page_visit_counts
+            WHERE user_id IN ({placeholders}) AND minute >= ? AND minute < ?
+            GROUP BY user_id
+        ''', list(user_ids) + [start.strftime('%Y-%m-%dT%H:%M'), end.strftime('%Y-%m-%dT%H:%M')]):
+            rollups[row['user_id']]['visits'] = row['visits']
+
+        for row in conn.execute(f'''
+            SELECT user_id, meta_product FROM (
+                SELECT user_id, meta_product,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY timestamp DESC, id DESC) AS rn
+                FROM user_history
+                WHERE user_id IN ({placeholders}) AND timestamp >= ? AND timestamp < ?
+                  AND action_type IN ('campaign_generated', 'pitch_generated') AND meta_product IS NOT NULL
+            ) WHERE rn <= ?
+            ORDER BY user_id, rn
+        ''', list(user_ids) + [start_ts, end_ts, DIGEST_RECENT_ITEMS]):
+            rollups[row['user_id']]['recent'].append(row['meta_product'])
+    return rollups
+
+
+def render_digest(user, rollup, start, end):
+    """Render one user's digest HTML"""
+    rows = [(label, rollup['counts'].get(action_type, 0)) for action_type, label in DIGEST_ROLLUP_LABELS]
+    rows.append(('Page visits', rollup['visits']))
+    return render_email(
+        'digest.html',
+        user_name=user['name'],
+        period_start=start.strftime('%b %d'),
+        period_end=(end - timedelta(days=1)).strftime('%b %d, %Y'),
+        rollup=rows,
+        recent=rollup['recent'],
+        history_link=f'{APP_URL}/history'
+    )
+
+
+def run_digest(period=None, chunk_size=DIGEST_CHUNK_SIZE, wake_sender=True):
+    """
+    Queue the digest for every user, resuming from the run's checkpoint
+
+    Args:
+        period: ISO week label (default: the last complete week)
+        chunk_size: Users per transaction
+        wake_sender: Wake the outbox sender after every chunk
+
+    Returns:
+        Dict with period, resumed_from, queued, skipped and finished
+    """
+    period, start, end = period_bounds(period)
+    now = datetime.utcnow().isoformat()
+    with get_db('digest_checkpoint') as conn:
+        conn.execute('''
+            INSERT OR IGNORE INTO digest_runs (period, started_at) VALUES (?, ?)
+        ''', (period, now))
+        conn.commit()
+        run = dict(conn.execute('SELECT * FROM digest_runs WHERE period = ?', (period,)).fetchone())
+
+    result = {'period': period, 'resumed_from': run['last_user_id'], 'queued': 0, 'skipped': 0,
+              'finished': bool(run['finished_at'])}
+    if run['finished_at']:
+        return result
+
+    subject = f'Your MarketMind week ({period})'
+    for users in iter_user_chunks(run['last_user_id'], chunk_size):
+        rollups = load_rollups([user['id'] for user in users], start, end)
+        messages = []
+        for user in users:
+            rollup = rollups[user['id']]
+            if DIGEST_SKIP_INACTIVE and not rollup['visits'] and not any(rollup['counts'].values()):
+                result['skipped'] += 1
+                continue
+            html_body = render_digest(user, rollup, start, end)
+            messages.append((user['email'], subject, html_body, f"digest:{period}:{user['id']}"))
+
+        with get_db('digest_checkpoint') as conn:
+            queued = outbox.insert_messages(conn, messages)
+            conn.execute('''
+                UPDATE digest_runs SET last_user_id = ?, queued_count = queued_count + ? WHERE period = ?
+            ''', (users[-1]['id'], queued, period))
+            conn.commit()
+        result['queued'] += queued
+
+        # Let the sender deliver this chunk while the next one is rendered
+        if queued and wake_sender and outbox.OUTBOX_AUTOSTART:
+            outbox.sender.wake()
+
+    with get_db('digest_checkpoint') as conn:
+        conn.execute('UPDATE digest_runs SET finished_at = ? WHERE period = ?',
+                     (datetime.utcnow().isoformat(), period))
+        conn.commit()
+    result['finished'] = True
+    return result
+
+
+def get_digest_runs(limit=10):
+    """Most recent digest runs"""
+    with get_db('digest_runs') as conn:
+        rows = conn.execute('SELECT * FROM digest_runs ORDER BY period DESC LIMIT ?', (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Weekly activity digest emails')
+    sub = parser.add_subparsers(dest='command', required=True)
+    send = sub.add_parser('send', help='Queue digests for a period (resumes an interrupted run)')
+    send.add_argument('--period', help='ISO week, e.g. 2026-W41 (default: last week)')
+    send.add_argument('--chunk-size', type=int, default=DIGEST_CHUNK_SIZE)
+    sub.add_parser('status', help='Show recent digest runs')
+    args = parser.parse_args()
+    init_database()
+
+    if args.command == 'status':
+        for run in get_digest_runs():
+            print(run)
+        return
+
+    if not is_email_configured():
+        parser.error('Email is not configured (GMAIL_ADDRESS / GMAIL_APP_PASSWORD)')
+
+    # Deliver on a foreground thread while chunks are rendered, then finish the queue
+    done = threading.Event()
+
+    def _deliver():
+        while True:
+            if sum(outbox.process_outbox().values()):
+                continue
+            if done.is_set():
+                return
+            done.wait(0.5)
+
+    deliverer = threading.Thread(target=_deliver, name='digest-delivery')
+    deliverer.start()
+    try:
+        print(run_digest(args.period, args.chunk_size, wake_sender=False))
+    finally:
+        done.set()
+        deliverer.join()
+    print(outbox.outbox_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,89 @@
 """
 Email utilities for sending verification and password reset emails
-Uses Gmail SMTP with App Passwords
+Uses Gmail SMTP with App Passwords. Transactional emails are queued in the
+durable outbox (see outbox.py) and delivered by a background sender.
 """
 
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from backend.metrics import emails_sent_total, email_send_duration
 
 GMAIL_ADDRESS = os.getenv('GMAIL_ADDRESS')
 GMAIL_APP_PASSWORD = os.getenv('GMAIL_APP_PASSWORD')
 APP_URL = os.getenv('APP_URL', 'http://127.0.0.1:5000')
 
+# SMTP server (Gmail by default; point at a local server for testing)
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '465'))
+SMTP_USE_SSL = os.getenv('SMTP_USE_SSL', 'true').lower() in ('1', 'true', 'yes')
+
+# Log in with GMAIL_ADDRESS / GMAIL_APP_PASSWORD (disable for local test servers)
+SMTP_AUTH = os.getenv('SMTP_AUTH', 'true').lower() in ('1', 'true', 'yes')
+
+# Seconds before an SMTP connect or command times out
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
+
+# Email templates, compiled on first use and reused for every message
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'frontend', 'templates', 'email')
+
+_email_env = Environment(
+    loader=FileSystemLoader(EMAIL_TEMPLATE_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False
+)
+_email_templates = None
+
+def _get_email_templates():
+    """Compile all email templates once (layout and partials too, so extends/include hit the cache)"""
+    global _email_templates
+    if _email_templates is None:
+        _email_templates = {name: _email_env.get_template(name) for name in _email_env.list_templates()}
+    return _email_templates
+
+def is_email_configured():
+    """Check that a sender address (and password, when logging in) is set"""
+    return bool(GMAIL_ADDRESS and (GMAIL_APP_PASSWORD or not SMTP_AUTH))
+
+def build_message(to_email, subject, html_body):
+    """Build a MIME message from the configured sender address"""
+    msg = MIMEMultipart('alternative')
+    msg['From'] = GMAIL_ADDRESS
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+def open_smtp_connection():
+    """
+    Open and authenticate an SMTP connection
+    
+    Skips the login when SMTP_AUTH is off, so a local server without
+    authentication can stand in for Gmail.
+    
+    Returns:
+        Connected smtplib.SMTP / SMTP_SSL instance
+    """
+    if SMTP_USE_SSL:
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    try:
+        if SMTP_AUTH:
+            server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
 def send_email(to_email, subject, html_body):
     """
-    Send an email using Gmail SMTP
+    Send an email right away on its own SMTP connection
+    
+    Request handlers should use queue_email() instead.
     
     Args:
         to_email: Recipient email address
@@ -27,30 +93,59 @@ def send_email(to_email, subject, html_body):
     Returns:
         True if successful, False otherwise
     """
-    if not GMAIL_ADDRESS or not GMAIL_APP_PASSWORD:
+    if not is_email_configured():
         print("ERROR: Gmail credentials not configured. Set GMAIL_ADDRESS and GMAIL_APP_PASSWORD in .env")
+        emails_sent_total.inc(status='not_configured')
         return False
     
+    start = time.perf_counter()
+    status = 'error'
     try:
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['From'] = GMAIL_ADDRESS
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Attach HTML body
-        part = MIMEText(html_body, 'html')
-        msg.attach(part)
-        
-        # Send via Gmail SMTP
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
+        msg = build_message(to_email, subject, html_body)
+        with open_smtp_connection() as server:
             server.send_message(msg)
         
+        status = 'ok'
         return True
     except Exception as e:
         print(f"ERROR sending email to {to_email}: {str(e)}")
         return False
+    finally:
+        email_send_duration.observe(time.perf_counter() - start, status=status)
+        emails_sent_total.inc(status=status)
+
+def queue_email(to_email, subject, html_body):
+    """
+    Queue an email in the outbox for background delivery
+    
+    Args:
+        to_email: Recipient email address
+        subject: Email subject
+        html_body: HTML email body
+    
+    Returns:
+        True if queued, False if email is not configured or queueing failed
+    """
+    if not is_email_configured():
+        print("ERROR: Gmail credentials not configured. Set GMAIL_ADDRESS and GMAIL_APP_PASSWORD in .env")
+        emails_sent_total.inc(status='not_configured')
+        return False
+    
+    from backend.outbox import enqueue_email
+    return enqueue_email(to_email, subject, html_body) is not None
+
+def render_email(template_name, **context):
+    """
+    Render an email template (compiled once per process)
+    
+    Args:
+        template_name: File name under frontend/templates/email
+        context: Template variables
+    
+    Returns:
+        Rendered HTML string
+    """
+    return _get_email_templates()[template_name].render(**context)
 
 def send_verification_email(user_email, user_name, verification_link):
     """
@@ -62,54 +157,11 @@ def send_verification_email(user_email, user_name, verification_link):
         verification_link: Full URL to verification endpoint
     
     Returns:
-        True if successful, False otherwise
+        True if queued, False otherwise
     """
     subject = "Verify Your MarketMind Account"
-    
-    html_body = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <div style="background-color: #f8f9fc; padding: 20px; border-radius: 8px;">
-                <h2 style="color: #223CCF; margin-top: 0;">Welcome to MarketMind! 🚀</h2>
-                
-                <p>Hi {user_name},</p>
-                
-                <p>Thank you for signing up. To complete your registration and start using MarketMind, 
-                please verify your email address by clicking the button below.</p>
-                
-                <div style="text-align: center; margin: 30px 0;">
-                    <a href="{verification_link}" 
-                       style="background-color: #223CCF; color: white; padding: 12px 30px; 
-                              text-decoration: none; border-radius: 6px; display: inline-block;
-                              font-weight: bold;">
-                        ✓ Verify Email Address
-                    </a>
-                </div>
-                
-                <p style="font-size: 12px; color: #999;">
-                    Or copy and paste this link in your browser:<br>
-                    <code style="background-color: #eee; padding: 2px 6px; border-radius: 3px;">
-                        {verification_link}
-                    </code>
-                </p>
-                
-                <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-                
-                <p style="font-size: 12px; color: #999;">
-                    This verification link will expire in 24 hours.<br>
-                    If you did not create this account, please ignore this email.
-                </p>
-                
-                <p style="color: #999; font-size: 12px; margin-top: 20px;">
-                    Best regards,<br>
-                    <strong>MarketMind Team</strong>
-                </p>
-            </div>
-        </body>
-    </html>
-    """
-    
-    return send_email(user_email, subject, html_body)
+    html_body = render_email('verification.html', user_name=user_name, verification_link=verification_link)
+    return queue_email(user_email, subject, html_body)
 
 def send_password_reset_email(user_email, user_name, reset_link):
     """
@@ -121,52 +173,8 @@ def send_password_reset_email(user_email, user_name, reset_link):
         reset_link: Full URL to password reset endpoint
     
     Returns:
-        True if successful, False otherwise
+        True if queued, False otherwise
     """
     subject = "Reset Your MarketMind Password"
-    
-    html_body = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <div style="background-color: #f8f9fc; padding: 20px; border-radius: 8px;">
-                <h2 style="color: #223CCF; margin-top: 0;">Password Reset Request 🔐</h2>
-                
-                <p>Hi {user_name},</p>
-                
-                <p>We received a request to reset the password for your MarketMind account. 
-                Click the button below to create a new password.</p>
-                
-                <div style="text-align: center; margin: 30px 0;">
-                    <a href="{reset_link}" 
-                       style="background-color: #ED3D63; color: white; padding: 12px 30px; 
-                              text-decoration: none; border-radius: 6px; display: inline-block;
-                              font-weight: bold;">
-                        🔄 Reset Password
-                    </a>
-                </div>
-                
-                <p style="font-size: 12px; color: #999;">
-                    Or copy and paste this link in your browser:<br>
-                    <code style="background-color: #eee; padding: 2px 6px; border-radius: 3px;">
-                        {reset_link}
-                    </code>
-                </p>
-                
-                <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-                
-                <p style="font-size: 12px; color: #999;">
-                    This password reset link will expire in 1 hour.<br>
-                    If you did not request a password reset, please ignore this email 
-                    and your password will remain unchanged.
-                </p>
-                
-                <p style="color: #999; font-size: 12px; margin-top: 20px;">
-                    Best regards,<br>
-                    <strong>MarketMind Team</strong>
-                </p>
-            </div>
-        </body>
-    </html>
-    """
-    
-    return send_email(user_email, subject, html_body)
+    html_body = render_email('password_reset.html', user_name=user_name, reset_link=reset_link)
+    return queue_email(user_email, subject, html_body)
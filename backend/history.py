@@ -3,11 +3,49 @@ User activity history tracking module
 Logs user actions for authenticated users only
 """
 
+import time
 from datetime import datetime, timedelta
-from backend.database import get_db
+from backend.database import get_db, prune_history_changes
+from backend.sections import store_sections
+from backend.tracing import span
 import json
 
-def log_user_activity(user_id, page_url, page_title, action_type, metadata=None, ip_address=None, user_agent=None):
+# Query parameter -> generated metadata column on user_history
+HISTORY_FILTERS = {
+    'product': 'meta_product',
+    'audience': 'meta_audience',
+    'platform': 'meta_platform',
+    'persona': 'meta_persona',
+    'lead_name': 'meta_lead_name',
+    'urgency': 'meta_urgency',
+}
+
+# Action types the browser tracker may submit
+CLIENT_ACTION_TYPES = {'click', 'search', 'form_input', 'form_change', 'submit'}
+
+MAX_ACTION_BATCH = 50
+MAX_ACTION_METADATA_BYTES = 2048
+
+HISTORY_COLUMNS = 'id, user_id, page_url, page_title, action_type, metadata, timestamp, ip_address, user_agent'
+
+# Lightweight listing columns: metadata without the (multi-KB) LLM result,
+# reduced inside SQLite so the result body never leaves the database
+HISTORY_SUMMARY_COLUMNS = '''
+    id, page_url, page_title, action_type, timestamp,
+    CASE WHEN json_valid(metadata) THEN json_remove(metadata, '$.result') END AS metadata,
+    CASE WHEN json_valid(metadata) THEN length(json_extract(metadata, '$.result')) END AS result_chars
+'''
+
+# Longest metadata string kept in a summary
+SUMMARY_TEXT_LIMIT = 200
+
+# Seconds between change log prunes in each process (init_database prunes at startup)
+HISTORY_CHANGES_PRUNE_INTERVAL = 3600
+
+_last_changes_prune = time.monotonic()
+
+def log_user_activity(user_id, page_url, page_title, action_type, metadata=None, ip_address=None, user_agent=None,
+                      raise_errors=False, sections=None):
     """
     Log a user activity/action to history
     
@@ -19,6 +57,10 @@ def log_user_activity(user_id, page_url, page_title, action_type, metadata=None,
         metadata: Optional JSON metadata dict
         ip_address: User's IP address
         user_agent: User's browser user agent
+        raise_errors: Re-raise database errors instead of returning None
+                      (lets deferred tasks retry)
+        sections: Optional result sections from split_sections(), stored
+                  in the same transaction
     
     Returns:
         History record ID or None on error
@@ -26,7 +68,7 @@ def log_user_activity(user_id, page_url, page_title, action_type, metadata=None,
     if not user_id:
         return None
     
-    with get_db() as conn:
+    with span('history.log', action_type=action_type), get_db() as conn:
         cursor = conn.cursor()
         try:
             cursor.execute('''
@@ -43,11 +85,93 @@ def log_user_activity(user_id, page_url, page_title, action_type, metadata=None,
                 ip_address,
                 user_agent
             ))
+            history_id = cursor.lastrowid
+            if sections:
+                store_sections(cursor, history_id, sections)
             conn.commit()
-            return cursor.lastrowid
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error logging activity: {str(e)}")
             return None
+    _prune_changes_if_due()
+    return history_id
+
+def _prune_changes_if_due():
+    """Trim the change log once per HISTORY_CHANGES_PRUNE_INTERVAL (runs in the logging task)"""
+    global _last_changes_prune
+    now = time.monotonic()
+    if now - _last_changes_prune < HISTORY_CHANGES_PRUNE_INTERVAL:
+        return
+    _last_changes_prune = now
+    try:
+        with get_db('history_changes_prune') as conn:
+            prune_history_changes(conn.cursor())
+            conn.commit()
+    except Exception as e:
+        print(f"Error pruning history changes: {str(e)}")
+
+def validate_client_action(event):
+    """
+    Validate one tracker event from the browser
+    
+    Returns:
+        (page_url, page_title, action_type, metadata_json) or None if invalid
+    """
+    if not isinstance(event, dict):
+        return None
+    
+    action_type = event.get('action_type')
+    page_url = event.get('page_url')
+    page_title = event.get('page_title') or ''
+    metadata = event.get('metadata')
+    
+    if action_type not in CLIENT_ACTION_TYPES:
+        return None
+    if not isinstance(page_url, str) or not page_url.startswith('/') or len(page_url) > 500:
+        return None
+    if not isinstance(page_title, str):
+        return None
+    if metadata is not None and not isinstance(metadata, dict):
+        return None
+    
+    metadata_json = json.dumps(metadata) if metadata else None
+    if metadata_json and len(metadata_json) > MAX_ACTION_METADATA_BYTES:
+        return None
+    
+    return page_url, page_title[:200], action_type, metadata_json
+
+def log_user_activities(user_id, events, ip_address=None, user_agent=None):
+    """
+    Log a batch of already validated tracker events in one statement
+    
+    Args:
+        user_id: Integer user ID
+        events: List of (page_url, page_title, action_type, metadata_json)
+        ip_address: User's IP address
+        user_agent: User's browser user agent
+    
+    Returns:
+        Number of records written
+    """
+    if not user_id or not events:
+        return 0
+    
+    timestamp = datetime.utcnow().isoformat()
+    rows = [
+        (user_id, page_url, page_title, action_type, metadata_json, timestamp, ip_address, user_agent)
+        for page_url, page_title, action_type, metadata_json in events
+    ]
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO user_history 
+            (user_id, page_url, page_title, action_type, metadata, timestamp, ip_address, user_agent)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        return len(rows)
 
 def get_user_history(user_id, limit=500, action_type=None):
     """
@@ -79,6 +203,243 @@ def get_user_history(user_id, limit=500, action_type=None):
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
 
+def build_history_filter_query(user_id, filters, limit=100, action_type=None):
+    """
+    Build the SQL for a filtered history lookup
+    
+    Args:
+        user_id: User ID
+        filters: Dict of filter name (see HISTORY_FILTERS) -> exact value
+        limit: Maximum number of records
+        action_type: Optional filter by action type
+    
+    Returns:
+        (sql: str, params: list)
+    """
+    clauses = ['user_id = ?']
+    params = [user_id]
+    
+    for name, value in filters.items():
+        column = HISTORY_FILTERS.get(name)
+        if column is None:
+            raise ValueError(f"Unknown history filter: {name}")
+        clauses.append(f'{column} = ?')
+        params.append(value)
+    
+    if action_type:
+        clauses.append('action_type = ?')
+        params.append(action_type)
+    
+    sql = f'''
+        SELECT {HISTORY_COLUMNS} FROM user_history
+        WHERE {' AND '.join(clauses)}
+        ORDER BY timestamp DESC LIMIT ?
+    '''
+    params.append(limit)
+    return sql, params
+
+def filter_user_history(user_id, filters, limit=100, action_type=None):
+    """
+    Get user's history filtered on indexed metadata fields
+    
+    Args:
+        user_id: User ID
+        filters: Dict of filter name (product, audience, platform, persona,
+                 lead_name, urgency) -> exact value
+        limit: Maximum number of records
+        action_type: Optional filter by action type
+    
+    Returns:
+        List of history records with parsed metadata
+    """
+    sql, params = build_history_filter_query(user_id, filters, limit, action_type)
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        
+        records = []
+        for row in cursor.fetchall():
+            row_dict = dict(row)
+            if row_dict.get('metadata'):
+                try:
+                    row_dict['metadata'] = json.loads(row_dict['metadata'])
+                except:
+                    row_dict['metadata'] = {}
+            records.append(row_dict)
+        return records
+
+def get_history_cursor(user_id):
+    """
+    Get the latest change log position for a user
+    
+    Returns:
+        Integer cursor to pass to get_history_changes (0 if no changes)
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT MAX(
+                COALESCE((SELECT MAX(seq) FROM history_changes WHERE user_id = ?), 0),
+                COALESCE((SELECT seq FROM history_change_floors WHERE user_id = ?), 0)
+            ) AS seq
+        ''', (user_id, user_id))
+        return cursor.fetchone()['seq']
+
+def get_history_changes(user_id, since, limit=500):
+    """
+    Get history inserts and deletes recorded after a cursor
+    
+    Args:
+        user_id: User ID
+        since: Cursor from a previous call (or from the grouped history)
+        limit: Maximum number of change log entries to read
+    
+    Returns:
+        Dictionary with:
+            cursor: Position to pass as `since` next time
+            inserts: Summaries of items added or changed in place (and still present)
+            deletes: IDs of items removed
+            has_more: True if more changes are waiting after cursor
+            reset: True if the log no longer reaches back to `since`;
+                   the client must reload the full history
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        # Entries after `since` may have been pruned by the retention window
+        cursor.execute('SELECT seq FROM history_change_floors WHERE user_id = ?', (user_id,))
+        floor = cursor.fetchone()
+        if floor and since < floor['seq']:
+            return {'cursor': since, 'inserts': [], 'deletes': [], 'has_more': False, 'reset': True}
+        
+        cursor.execute('''
+            SELECT seq, history_id, op FROM history_changes
+            WHERE user_id = ? AND seq > ?
+            ORDER BY seq LIMIT ?
+        ''', (user_id, since, limit + 1))
+        changes = cursor.fetchall()
+        
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if not changes:
+            return {'cursor': since, 'inserts': [], 'deletes': [], 'has_more': False, 'reset': False}
+        
+        # Only the last operation per item matters
+        final_ops = {}
+        for change in changes:
+            final_ops[change['history_id']] = change['op']
+        
+        inserted_ids = [hid for hid, op in final_ops.items() if op == 'insert']
+        deleted_ids = [hid for hid, op in final_ops.items() if op == 'delete']
+        
+        inserts = fetch_history_summaries_by_id(conn, user_id, inserted_ids)
+        if inserted_ids:
+            # Inserted then deleted by a change beyond this page
+            present = {row['id'] for row in inserts}
+            deleted_ids.extend(hid for hid in inserted_ids if hid not in present)
+        
+        return {
+            'cursor': changes[-1]['seq'],
+            'inserts': inserts,
+            'deletes': deleted_ids,
+            'has_more': has_more,
+            'reset': False
+        }
+
+def _summary_from_row(row):
+    """Convert a HISTORY_SUMMARY_COLUMNS row to a summary dict"""
+    item = dict(row)
+    metadata = {}
+    if item.get('metadata'):
+        try:
+            metadata = json.loads(item['metadata'])
+        except:
+            metadata = {}
+    item['metadata'] = {
+        key: (value[:SUMMARY_TEXT_LIMIT] + '…' if isinstance(value, str) and len(value) > SUMMARY_TEXT_LIMIT else value)
+        for key, value in metadata.items()
+    }
+    item['has_result'] = bool(item['result_chars'])
+    return item
+
+def fetch_history_summaries_by_id(conn, user_id, history_ids):
+    """
+    Load summaries for specific history items on an open connection
+    
+    Returns:
+        List of summary dicts (missing ids are skipped), newest first
+    """
+    if not history_ids:
+        return []
+    placeholders = ','.join('?' * len(history_ids))
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {HISTORY_SUMMARY_COLUMNS} FROM user_history
+        WHERE user_id = ? AND id IN ({placeholders})
+        ORDER BY timestamp DESC, id DESC
+    ''', [user_id] + list(history_ids))
+    return [_summary_from_row(row) for row in cursor.fetchall()]
+
+def get_history_summaries(user_id, limit=50, before=None):
+    """
+    Get one page of lightweight history summaries (newest first)
+    
+    Args:
+        user_id: User ID
+        limit: Page size
+        before: Optional (timestamp, id) of the last item of the previous page
+    
+    Returns:
+        Dictionary with items, has_more and next (the `before` for the next page)
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if before:
+            cursor.execute(f'''
+                SELECT {HISTORY_SUMMARY_COLUMNS} FROM user_history
+                WHERE user_id = ? AND (timestamp < ? OR (timestamp = ? AND id < ?))
+                ORDER BY timestamp DESC, id DESC LIMIT ?
+            ''', (user_id, before[0], before[0], before[1], limit + 1))
+        else:
+            cursor.execute(f'''
+                SELECT {HISTORY_SUMMARY_COLUMNS} FROM user_history
+                WHERE user_id = ?
+                ORDER BY timestamp DESC, id DESC LIMIT ?
+            ''', (user_id, limit + 1))
+        rows = cursor.fetchall()
+    
+    items = [_summary_from_row(row) for row in rows[:limit]]
+    has_more = len(rows) > limit
+    return {
+        'items': items,
+        'has_more': has_more,
+        'next': [items[-1]['timestamp'], items[-1]['id']] if has_more else None
+    }
+
+def get_history_item(user_id, history_id):
+    """
+    Get one full history item, including the generated result
+    
+    Returns:
+        Record dict with parsed metadata, or None if not found
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {HISTORY_COLUMNS} FROM user_history WHERE id = ? AND user_id = ?
+        ''', (history_id, user_id))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    item = dict(row)
+    if item.get('metadata'):
+        try:
+            item['metadata'] = json.loads(item['metadata'])
+        except:
+            item['metadata'] = {}
+    return item
+
 def get_grouped_user_history(user_id, limit=500):
     """
     Get user's history grouped by date (Today, Yesterday, This week, Older)
@@ -0,0 +1,223 @@
+"""
+Structured lead scores
+The lead-scoring prompt asks the model to end its analysis with a JSON
+block of numbers. split_lead_score() validates that block and strips it
+from the narrative. The numbers are stored under metadata.scores of the
+'lead_scored' history entry, where the lead_* generated columns and
+their indexes (see LEAD_SCORE_COLUMNS in backend/database.py) make
+ranked lookups cheap:
+
+    python -m backend.leads backfill    # score results stored before this existed
+
+Results without a usable JSON block (older models, truncated replies)
+fall back to the first "NN/100" or "Score: NN" in the text.
+"""
+
+import re
+import json
+import argparse
+from backend.database import get_db
+
+# Readiness tiers by minimum score, as defined in lead_scoring_prompt
+LEAD_TIERS = (
+    (90, 'hot'),
+    (75, 'warm'),
+    (60, 'lukewarm'),
+    (0, 'cold'),
+)
+
+# BANU sub-scores (0-100 each)
+BANU_FIELDS = ('budget', 'authority', 'need', 'urgency')
+
+MAX_TOP_LEADS = 100
+
+_JSON_BLOCK = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```\s*$', re.DOTALL)
+_TEXT_SCORES = (
+    re.compile(r'\b(\d{1,3})\s*(?:/\s*100|out of 100)\b', re.IGNORECASE),
+    re.compile(r'\bscore\b[:*\s]+(\d{1,3})\b', re.IGNORECASE),
+)
+
+
+def readiness_tier(score):
+    for minimum, tier in LEAD_TIERS:
+        if score >= minimum:
+            return tier
+    return 'cold'
+
+
+def _percent(value):
+    """Integer 0-100, or None for anything else (strings like '85%' included)"""
+    if isinstance(value, str):
+        value = value.strip().rstrip('%')
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if not 0 <= value <= 100:
+        return None
+    return int(round(value))
+
+
+def validate_lead_score(data):
+    """
+    Normalize the model's JSON scores
+
+    Args:
+        data: Parsed JSON object from the model
+
+    Returns:
+        Dict with score, conversion_probability, readiness and the BANU
+        sub-scores (None where missing or invalid), or None if there is no
+        valid overall score. readiness always follows the score bands.
+    """
+    if not isinstance(data, dict):
+        return None
+    score = _percent(data.get('score'))
+    if score is None:
+        return None
+    scores = {
+        'score': score,
+        'conversion_probability': _percent(data.get('conversion_probability')),
+        'readiness': readiness_tier(score),
+    }
+    banu = data.get('banu') if isinstance(data.get('banu'), dict) else data
+    for field in BANU_FIELDS:
+        scores[field] = _percent(banu.get(field))
+    return scores
+
+
+def split_lead_score(text):
+    """
+    Separate the narrative from the structured scores of a lead analysis
+
+    Returns:
+        (narrative without the JSON block, scores dict or None)
+    """
+    match = _JSON_BLOCK.search(text or '')
+    if match:
+        try:
+            scores = validate_lead_score(json.loads(match.group(1)))
+        except ValueError:
+            scores = None
+        if scores:
+            return text[:match.start()].rstrip(), scores
+    return text, score_from_text(text)
+
+
+def score_from_text(text):
+    """Best-effort scores from a narrative without a JSON block"""
+    for pattern in _TEXT_SCORES:
+        match = pattern.search(text or '')
+        if match:
+            return validate_lead_score({'score': int(match.group(1))})
+    return None
+
+
+def get_top_leads(user_id, limit=20, readiness=None, min_score=None, before=None):
+    """
+    Get one page of the user's scored leads, best first
+
+    Args:
+        readiness: Optional tier filter (hot, warm, lukewarm, cold)
+        min_score: Optional lowest score to include
+        before: Optional (score, id) of the last item of the previous page
+
+    Returns:
+        Dictionary with items, has_more and next (the `before` for the next page)
+    """
+    clauses = ['user_id = ?', 'lead_score IS NOT NULL']
+    params = [user_id]
+    if readiness:
+        clauses.append('lead_readiness = ?')
+        params.append(readiness)
+    if min_score is not None:
+        clauses.append('lead_score >= ?')
+        params.append(min_score)
+    if before:
+        clauses.append('(lead_score < ? OR (lead_score = ? AND id < ?))')
+        params.extend([before[0], before[0], before[1]])
+    params.append(limit + 1)
+
+    banu = ', '.join(f"json_extract(metadata, '$.scores.{field}') AS {field}" for field in BANU_FIELDS)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        # Served from idx_history_top_leads / idx_history_lead_readiness in index order
+        cursor.execute(f'''
+            SELECT id, timestamp, meta_lead_name AS name, lead_score AS score,
+                   lead_conversion AS conversion_probability, lead_readiness AS readiness, {banu}
+            FROM user_history
+            WHERE {' AND '.join(clauses)}
+            ORDER BY lead_score DESC, id DESC LIMIT ?
+        ''', params)
+        rows = cursor.fetchall()
+
+    items = [dict(row) for row in rows[:limit]]
+    has_more = len(rows) > limit
+    return {
+        'items': items,
+        'has_more': has_more,
+        'next': [items[-1]['score'], items[-1]['id']] if has_more else None
+    }
+
+
+def backfill_lead_scores(batch_size=500):
+    """
+    Add metadata.scores to stored lead results that lack it
+
+    Returns:
+        (rows scored, rows without a recognizable score)
+    """
+    scored = unscored = 0
+    last_id = 0
+    while True:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, json_extract(metadata, '$.result') AS result FROM user_history
+                WHERE action_type = 'lead_scored' AND id > ? AND json_valid(metadata)
+                  AND json_type(metadata, '$.scores') IS NULL
+                ORDER BY id LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return scored, unscored
+            last_id = rows[-1]['id']
+            updates = []
+            changed = []
+            for row in rows:
+                scores = score_from_text(row['result'])
+                if scores:
+                    updates.append((json.dumps(scores), row['id']))
+                    changed.append((row['user_id'], row['id']))
+                else:
+                    unscored += 1
+            cursor.executemany('''
+                UPDATE user_history SET metadata = json_set(metadata, '$.scores', json(?)) WHERE id = ?
+            ''', updates)
+            # Stored history changed in place: invalidate cached history responses
+            # and re-send the updated summaries through the change feed
+            cursor.executemany('''
+                UPDATE history_versions SET version = version + 1 WHERE user_id = ?
+            ''', [(user_id,) for user_id in {user_id for user_id, _ in changed}])
+            cursor.executemany('''
+                INSERT INTO history_changes (user_id, history_id, op, changed_at)
+                VALUES (?, ?, 'insert', strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+            ''', changed)
+            conn.commit()
+            scored += len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Structured lead score maintenance')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('backfill', help='Extract scores from lead results stored without them')
+    parser.parse_args()
+
+    scored, unscored = backfill_lead_scores()
+    print(f'Scored {scored} stored lead results ({unscored} without a recognizable score)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Live history updates over Server-Sent Events
+Each worker process runs one hub thread that polls the history_changes
+log (see history.py) for a new high-water mark - a single MAX(seq) lookup
+per poll. When it moves, the new changes are fetched once and fanned out
+to the subscribers of that worker, so every gunicorn worker sees writes
+made by any other worker without extra infrastructure.
+
+Subscribers get bounded queues. A client that falls behind has its queue
+replaced with a single 'resync' event and catches up through
+/api/history/changes instead of growing server memory. The Flask route
+reads a subscriber with events() on its request thread; the ASGI app
+(asgi.py) uses stream(), which waits on the event loop instead.
+"""
+
+import os
+import json
+import queue
+import asyncio
+import threading
+import time
+from backend.database import get_db
+from backend.history import fetch_history_summaries_by_id, get_history_changes
+
+# Seconds between high-water-mark polls
+HISTORY_STREAM_POLL = float(os.getenv('HISTORY_STREAM_POLL', '1'))
+
+# Seconds between heartbeat comments on idle streams
+HISTORY_STREAM_HEARTBEAT = float(os.getenv('HISTORY_STREAM_HEARTBEAT', '15'))
+
+# Events buffered per connection before it is told to resync
+HISTORY_STREAM_BUFFER = int(os.getenv('HISTORY_STREAM_BUFFER', '50'))
+
+# Seconds before a stream is closed (the browser reconnects with Last-Event-ID)
+HISTORY_STREAM_MAX_SECONDS = float(os.getenv('HISTORY_STREAM_MAX_SECONDS', '300'))
+
+MAX_CHANGES_PER_POLL = 1000
+
+
+class Subscriber:
+    """One connected client of a user"""
+
+    def __init__(self, user_id, buffer_size):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.overflowed = False
+        # Set by stream(): wakes its event loop from the hub thread
+        self._wake = None
+
+    def push(self, event):
+        """Queue an event; on overflow collapse the backlog into one resync"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(('resync', {}))
+        wake = self._wake
+        if wake is not None:
+            try:
+                wake()
+            except RuntimeError:
+                # The stream's event loop has closed
+                pass
+
+    def events(self, heartbeat=HISTORY_STREAM_HEARTBEAT, max_seconds=HISTORY_STREAM_MAX_SECONDS):
+        """Yield queued events, or None as a heartbeat when idle"""
+        deadline = time.monotonic() + max_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                yield self.queue.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                if time.monotonic() < deadline:
+                    yield None
+
+    async def stream(self, heartbeat=HISTORY_STREAM_HEARTBEAT, max_seconds=HISTORY_STREAM_MAX_SECONDS):
+        """Async events(): waits on the running event loop, without a thread"""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        self._wake = lambda: loop.call_soon_threadsafe(ready.set)
+        deadline = time.monotonic() + max_seconds
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    yield self.queue.get_nowait()
+                    continue
+                except queue.Empty:
+                    pass
+                ready.clear()
+                # Pushed between get_nowait() and clear()
+                if not self.queue.empty():
+                    continue
+                try:
+                    await asyncio.wait_for(ready.wait(), min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    if time.monotonic() < deadline:
+                        yield None
+        finally:
+            self._wake = None
+
+
+class HistoryHub:
+    """Per-process fan-out of history changes to live subscribers"""
+
+    def __init__(self, poll_interval=HISTORY_STREAM_POLL, buffer_size=HISTORY_STREAM_BUFFER):
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.high_water_mark = None
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def subscribe(self, user_id):
+        subscriber = Subscriber(user_id, self.buffer_size)
+        # Queried before taking the lock, so a slow database does not stall the other streams
+        current = self._current_seq()
+        with self._lock:
+            # While nobody listens the poller is idle; restart from "now"
+            if self.high_water_mark is None or not self._subscribers:
+                self.high_water_mark = current
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        self._ensure_poller()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def _current_seq(self):
+        with get_db('history_stream_hwm') as conn:
+            row = conn.execute('SELECT MAX(seq) FROM history_changes').fetchone()
+            return row[0] or 0
+
+    def poll_once(self):
+        """
+        Check the high-water mark and deliver any new changes
+
+        Returns:
+            Number of events delivered
+        """
+        current = self._current_seq()
+        if self.high_water_mark is None or current <= self.high_water_mark:
+            self.high_water_mark = current
+            return 0
+
+        with self._lock:
+            watched = set(self._subscribers)
+        if not watched:
+            self.high_water_mark = current
+            return 0
+
+        with get_db('history_stream_fetch') as conn:
+            changes = conn.execute('''
+                SELECT seq, user_id, history_id, op FROM history_changes
+                WHERE seq > ? ORDER BY seq LIMIT ?
+            ''', (self.high_water_mark, MAX_CHANGES_PER_POLL)).fetchall()
+
+            per_user = {}
+            for change in changes:
+                if change['user_id'] in watched:
+                    entry = per_user.setdefault(change['user_id'], {'cursor': 0, 'ops': {}})
+                    entry['ops'][change['history_id']] = change['op']
+                    entry['cursor'] = change['seq']
+
+            events = {}
+            for user_id, entry in per_user.items():
+                inserted = [hid for hid, op in entry['ops'].items() if op == 'insert']
+                deletes = [hid for hid, op in entry['ops'].items() if op == 'delete']
+                inserts = fetch_history_summaries_by_id(conn, user_id, inserted)
+                present = {item['id'] for item in inserts}
+                deletes.extend(hid for hid in inserted if hid not in present)
+                events[user_id] = {'cursor': entry['cursor'], 'inserts': inserts, 'deletes': deletes}
+
+        if changes:
+            self.high_water_mark = changes[-1]['seq']
+
+        delivered = 0
+        with self._lock:
+            for user_id, event in events.items():
+                for subscriber in self._subscribers.get(user_id, ()):
+                    subscriber.push(('history', event))
+                    delivered += 1
+        return delivered
+
+    def _ensure_poller(self):
+        """Start the polling thread once per process (safe after fork)"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='history-hub', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self.subscriber_count():
+                continue
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"History hub poll error: {str(e)}")
+
+
+hub = HistoryHub()
+
+
+def format_sse(event, data, event_id=None):
+    """Encode one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def parse_since(value):
+    """Stream cursor from Last-Event-ID (reconnects) or ?since= (first connect)"""
+    return int(value) if value and value.isdigit() else None
+
+
+def opening_events(user_id, since):
+    """
+    First chunks of a stream: the reconnect delay, then what the client
+    missed after `since` (nothing if since is None)
+    """
+    chunks = ['retry: 3000\n\n']
+    if since is not None:
+        changes = get_history_changes(user_id, since)
+        if changes['reset']:
+            chunks.append(format_sse('reset', {}))
+        elif changes['has_more']:
+            chunks.append(format_sse('resync', {}))
+        elif changes['inserts'] or changes['deletes']:
+            chunks.append(format_sse('history', changes, event_id=changes['cursor']))
+    return chunks
+
+
+def format_item(item):
+    """Encode an item from Subscriber.events() / stream() (None is a heartbeat)"""
+    if item is None:
+        return ': heartbeat\n\n'
+    event, data = item
+    return format_sse(event, data, event_id=data.get('cursor'))
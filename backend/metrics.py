@@ -0,0 +1,317 @@
+"""
+Lightweight Prometheus-style metrics
+Counters and latency histograms for Flask endpoints, database operations,
+LLM calls, template rendering and email sends, exposed in the Prometheus
+text format at /metrics.
+
+Each process keeps its metrics in memory. When METRICS_DIR is set (one
+directory shared by all gunicorn workers), every process periodically
+writes a snapshot there and /metrics sums the snapshots of all workers.
+Snapshots are named by PID and process start time, so a restarted worker
+(or a new process reusing a PID) never overwrites an earlier one. The
+snapshots of exited workers stay in the sums, like prometheus_client's
+multiprocess mode: every metric here is a counter or a histogram, so the
+totals never go down when a worker restarts.
+"""
+
+import os
+import re
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Shared directory for per-process snapshots (unset = single process)
+METRICS_DIR = os.getenv('METRICS_DIR')
+
+# Seconds between snapshot writes in multi-process mode
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Optional bearer token required to read /metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = {}
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(k): v for k, v in self._values.items()}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # per-bucket counts (+Inf last), then sum
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(k): list(v) for k, v in self._values.items()}
+
+
+# ==================== METRIC DEFINITIONS ====================
+
+http_requests_total = Counter(
+    'marketmind_http_requests_total', 'HTTP requests by endpoint, method and status',
+    ('endpoint', 'method', 'status'))
+http_request_duration = Histogram(
+    'marketmind_http_request_duration_seconds', 'HTTP request latency by endpoint',
+    ('endpoint', 'method'))
+db_operation_duration = Histogram(
+    'marketmind_db_operation_duration_seconds', 'Time a database connection is held, by operation',
+    ('operation',))
+db_errors_total = Counter(
+    'marketmind_db_errors_total', 'Database operations that raised, by operation',
+    ('operation',))
+llm_requests_total = Counter(
+    'marketmind_llm_requests_total', 'LLM calls by model, prompt template and status',
+    ('model', 'template', 'status'))
+llm_request_duration = Histogram(
+    'marketmind_llm_request_duration_seconds', 'LLM call latency by model and prompt template',
+    ('model', 'template'), buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0))
+llm_tokens_total = Counter(
+    'marketmind_llm_tokens_total', 'LLM tokens by model and direction (prompt/completion)',
+    ('model', 'direction'))
+prompt_truncations_total = Counter(
+    'marketmind_prompt_truncations_total', 'Prompt fields cut to their token budget by template and field',
+    ('template', 'field'))
+lead_prescore_total = Counter(
+    'marketmind_lead_prescore_total', 'Leads pre-scored locally, by outcome (escalated to the LLM / avoided)',
+    ('outcome',))
+template_render_duration = Histogram(
+    'marketmind_template_render_duration_seconds', 'Jinja template render latency',
+    ('template',))
+emails_sent_total = Counter(
+    'marketmind_emails_sent_total', 'Emails sent by status',
+    ('status',))
+email_send_duration = Histogram(
+    'marketmind_email_send_duration_seconds', 'SMTP send latency',
+    ('status',), buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0))
+password_hash_duration = Histogram(
+    'marketmind_password_hash_duration_seconds', 'Password hash/verify latency including pool wait',
+    ('op',), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+password_hash_rejected_total = Counter(
+    'marketmind_password_hash_rejected_total', 'Hash requests refused because the pool was saturated',
+    ('op',))
+login_throttled_total = Counter(
+    'marketmind_login_throttled_total', 'Login attempts refused by the throttle, by scope (ip/email)',
+    ('scope',))
+quota_throttled_total = Counter(
+    'marketmind_quota_throttled_total', 'Generation requests refused by quota, by scope (user/ip) and kind (rate/tokens)',
+    ('scope', 'kind'))
+
+
+# ==================== MULTI-PROCESS SNAPSHOTS ====================
+
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+# PID -> start time (ms) of the process writing snapshots under that PID
+_process_start = {}
+
+_SNAPSHOT_FILE = re.compile(r'metrics_(\d+)(?:_(\d+))?\.json')
+
+
+def _snapshot():
+    return {
+        name: {'type': metric.type, 'samples': metric.snapshot()}
+        for name, metric in _registry.items()
+    }
+
+
+def write_snapshot():
+    """Write this process's metrics to METRICS_DIR (atomic replace)"""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    pid = os.getpid()
+    start = _process_start.setdefault(pid, int(time.time() * 1000))
+    path = os.path.join(METRICS_DIR, f'metrics_{pid}_{start}.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _writer_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except Exception as e:
+            print(f"Metrics snapshot error: {str(e)}")
+
+
+def _ensure_writer():
+    """Start the snapshot writer once per process (after any fork)"""
+    global _writer_pid
+    if not METRICS_DIR or _writer_pid == os.getpid():
+        return
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        _writer_pid = os.getpid()
+        threading.Thread(target=_writer_loop, name='metrics-writer', daemon=True).start()
+
+
+def _snapshot_paths():
+    """Snapshots of every worker that has run since METRICS_DIR was emptied"""
+    return [os.path.join(METRICS_DIR, filename) for filename in sorted(os.listdir(METRICS_DIR))
+            if _SNAPSHOT_FILE.fullmatch(filename)]
+
+
+def _collect():
+    """Merge snapshots from every worker (or just this process)"""
+    if not METRICS_DIR:
+        return _snapshot()
+
+    write_snapshot()
+    merged = {}
+    for path in _snapshot_paths():
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, metric in data.items():
+            target = merged.setdefault(name, {'type': metric['type'], 'samples': {}})['samples']
+            for key, value in metric['samples'].items():
+                if key not in target:
+                    target[key] = value
+                elif isinstance(value, list):
+                    target[key] = [a + b for a, b in zip(target[key], value)]
+                else:
+                    target[key] += value
+    return merged
+
+
+# ==================== EXPOSITION ====================
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    data = _collect()
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        samples = data.get(name, {}).get('samples', {})
+        for key, value in sorted(samples.items()):
+            pairs = list(zip(metric.labelnames, json.loads(key)))
+            if metric.type == 'counter':
+                lines.append(f'{name}{_format_labels(pairs)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{name}_bucket{_format_labels(pairs + [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(pairs)} {_format_value(float(value[-1]))}')
+            lines.append(f'{name}_count{_format_labels(pairs)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== FLASK INTEGRATION ====================
+
+def init_app(app):
+    """Record per-endpoint and per-template timings and serve /metrics"""
+    from flask import g, request, Response, before_render_template, template_rendered
+
+    @app.before_request
+    def _metrics_start_timer():
+        _ensure_writer()
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _metrics_record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            http_request_duration.observe(time.perf_counter() - start,
+                                          endpoint=endpoint, method=request.method)
+            http_requests_total.inc(endpoint=endpoint, method=request.method,
+                                    status=response.status_code)
+        return response
+
+    def _template_started(sender, template, context, **extra):
+        g.setdefault('metrics_template_starts', []).append(time.perf_counter())
+
+    def _template_finished(sender, template, context, **extra):
+        starts = g.get('metrics_template_starts')
+        if starts:
+            template_render_duration.observe(time.perf_counter() - starts.pop(),
+                                             template=template.name or 'string')
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus scrape endpoint"""
+        if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
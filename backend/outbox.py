@@ -0,0 +1,387 @@
+"""
+Durable outbound email queue
+Request handlers insert messages into the email_outbox table and return
+right away. A background sender thread (one per process, started when mail
+is queued) claims due messages in batches and delivers each batch over a
+single authenticated SMTP connection:
+
+- delivered messages are marked 'sent'
+- temporary failures go back to 'pending' with an exponential backoff
+- permanent SMTP rejections (5xx) and messages that used up
+  OUTBOX_MAX_ATTEMPTS are marked 'dead' and kept for inspection
+
+A claim is one UPDATE ... RETURNING, so several workers can drain the same
+outbox without sending a message twice. Claims older than
+OUTBOX_CLAIM_TIMEOUT (a worker died mid-batch) are picked up again.
+
+    python -m backend.outbox stats
+    python -m backend.outbox drain
+    python -m backend.outbox requeue [--id ID ...]
+"""
+
+import os
+import time
+import smtplib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from backend.database import get_db, init_database
+from backend.email_utils import build_message, open_smtp_connection
+from backend.metrics import emails_sent_total, email_send_duration
+
+# Messages claimed and sent per SMTP connection
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '20'))
+
+# Delivery attempts before a message is moved to the dead letters
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+
+# Base delay in seconds before a retry (doubled after every failure)
+OUTBOX_RETRY_DELAY = float(os.getenv('OUTBOX_RETRY_DELAY', '30'))
+
+# Seconds after which a claimed but unfinished message is claimed again
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv('OUTBOX_CLAIM_TIMEOUT', '300'))
+
+# Start the background sender when mail is queued (turn off to drain manually)
+OUTBOX_AUTOSTART = os.getenv('OUTBOX_AUTOSTART', 'true').lower() in ('1', 'true', 'yes')
+
+
+def enqueue_email(to_email, subject, html_body):
+    """
+    Store an email in the outbox and wake the sender
+
+    Returns:
+        Outbox message ID or None on error
+    """
+    now = datetime.utcnow().isoformat()
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO email_outbox (to_email, subject, html_body, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (to_email, subject, html_body, now, now))
+            conn.commit()
+            message_id = cursor.lastrowid
+    except Exception as e:
+        print(f"ERROR queueing email to {to_email}: {str(e)}")
+        return None
+
+    if OUTBOX_AUTOSTART:
+        sender.wake()
+    return message_id
+
+
+def insert_messages(conn, messages):
+    """
+    Add messages to the outbox on an open connection (caller commits)
+
+    Messages whose dedupe_key is already in the outbox are skipped, so a
+    job that is re-run after a crash cannot queue the same email twice.
+
+    Args:
+        conn: Open database connection
+        messages: Iterable of (to_email, subject, html_body, dedupe_key)
+
+    Returns:
+        Number of messages inserted
+    """
+    now = datetime.utcnow().isoformat()
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT OR IGNORE INTO email_outbox (to_email, subject, html_body, dedupe_key, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(to_email, subject, html_body, dedupe_key, now, now)
+          for to_email, subject, html_body, dedupe_key in messages])
+    return cursor.rowcount
+
+
+def claim_batch(limit=OUTBOX_BATCH_SIZE):
+    """
+    Claim due messages for delivery (counts as an attempt)
+
+    Returns:
+        List of claimed rows (id, to_email, subject, html_body, attempts)
+    """
+    now = datetime.utcnow()
+    stale = (now - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)).isoformat()
+    with get_db() as conn:
+        rows = conn.execute('''
+            UPDATE email_outbox
+            SET status = 'sending', claimed_at = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND claimed_at < ?)
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, to_email, subject, html_body, attempts
+        ''', (now.isoformat(), now.isoformat(), stale, limit)).fetchall()
+        conn.commit()
+    return sorted((dict(row) for row in rows), key=lambda row: row['id'])
+
+
+def _is_permanent(error):
+    """True for per-message SMTP rejections that will not succeed on retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _failure_outcome(error, attempts, connected=True):
+    # Without a connection (connect, greeting or login refused) the server is at fault,
+    # not the message: even a 5xx reply only counts as a failed attempt
+    if (connected and _is_permanent(error)) or attempts >= OUTBOX_MAX_ATTEMPTS:
+        return 'dead'
+    return 'retry'
+
+
+class SMTPSession:
+    """One lazily opened SMTP connection shared by a batch of messages"""
+
+    def __init__(self):
+        self.server = None
+        self.connections = 0
+
+    def send(self, message):
+        for attempt in (1, 2):
+            if self.server is None:
+                self.server = open_smtp_connection()
+                self.connections += 1
+            try:
+                self.server.send_message(message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                # Idle timeout or server hangup: reconnect once
+                self.server = None
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+
+def _record_results(results):
+    now = datetime.utcnow()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        for row, outcome, error in results:
+            if outcome == 'sent':
+                cursor.execute('''
+                    UPDATE email_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?
+                ''', (now.isoformat(), row['id']))
+            elif outcome == 'retry':
+                delay = OUTBOX_RETRY_DELAY * (2 ** (row['attempts'] - 1))
+                cursor.execute('''
+                    UPDATE email_outbox SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?
+                ''', ((now + timedelta(seconds=delay)).isoformat(), error, row['id']))
+            else:
+                cursor.execute('''
+                    UPDATE email_outbox SET status = 'dead', last_error = ? WHERE id = ?
+                ''', (error, row['id']))
+        conn.commit()
+
+
+def process_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Claim one batch of due messages and deliver it over one SMTP connection
+
+    Returns:
+        Dict with 'sent', 'retry' and 'dead' counts
+    """
+    counts = {'sent': 0, 'retry': 0, 'dead': 0}
+    batch = claim_batch(batch_size)
+    if not batch:
+        return counts
+
+    session = SMTPSession()
+    results = []
+    try:
+        for index, row in enumerate(batch):
+            start = time.perf_counter()
+            try:
+                session.send(build_message(row['to_email'], row['subject'], row['html_body']))
+                results.append((row, 'sent', None))
+            except Exception as e:
+                print(f"ERROR sending email to {row['to_email']} (attempt {row['attempts']}): {str(e)}")
+                if session.server is None:
+                    # No connection: retry this message and the rest of the batch later
+                    for rest in batch[index:]:
+                        results.append((rest, _failure_outcome(e, rest['attempts'], connected=False), str(e)))
+                    break
+                results.append((row, _failure_outcome(e, row['attempts']), str(e)))
+            finally:
+                status = 'ok' if results[-1][1] == 'sent' else results[-1][1]
+                email_send_duration.observe(time.perf_counter() - start, status=status)
+    finally:
+        session.close()
+        _record_results(results)
+
+    for _, outcome, _ in results:
+        counts[outcome] += 1
+        emails_sent_total.inc(status='ok' if outcome == 'sent' else outcome)
+    return counts
+
+
+def seconds_until_due():
+    """
+    Seconds until the next pending retry or stale claim is due
+
+    Returns:
+        Seconds (0 if something is due now) or None if nothing is waiting
+    """
+    with get_db() as conn:
+        row = conn.execute('''
+            SELECT
+                (SELECT MIN(next_attempt_at) FROM email_outbox WHERE status = 'pending') AS next_attempt,
+                (SELECT MIN(claimed_at) FROM email_outbox WHERE status = 'sending') AS oldest_claim
+        ''').fetchone()
+
+    due = []
+    if row['next_attempt']:
+        due.append(datetime.fromisoformat(row['next_attempt']))
+    if row['oldest_claim']:
+        due.append(datetime.fromisoformat(row['oldest_claim']) + timedelta(seconds=OUTBOX_CLAIM_TIMEOUT))
+    if not due:
+        return None
+    return max(0.0, (min(due) - datetime.utcnow()).total_seconds())
+
+
+class OutboxSender:
+    """Background thread that drains the outbox while it has work"""
+
+    def __init__(self, batch_size=OUTBOX_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        """Signal new mail; starts the thread if it is not running in this process"""
+        self._wake.set()
+        pid = os.getpid()
+        with self._lock:
+            if self._thread is None or self.pid != pid:
+                self.pid = pid
+                self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                while sum(process_outbox(self.batch_size).values()):
+                    pass
+                delay = seconds_until_due()
+            except Exception as e:
+                print(f"Email outbox error: {str(e)}")
+                delay = OUTBOX_RETRY_DELAY
+
+            if delay is None:
+                # Idle: exit; the next wake() starts a new thread
+                with self._lock:
+                    if not self._wake.is_set():
+                        self._thread = None
+                        return
+                continue
+            self._wake.wait(delay)
+
+
+sender = OutboxSender()
+
+
+def outbox_stats():
+    """Number of outbox messages per status"""
+    with get_db() as conn:
+        rows = conn.execute('SELECT status, COUNT(*) AS n FROM email_outbox GROUP BY status').fetchall()
+    return {row['status']: row['n'] for row in rows}
+
+
+def get_dead_letters(limit=50):
+    """Most recent dead messages, without their bodies"""
+    with get_db() as conn:
+        rows = conn.execute('''
+            SELECT id, to_email, subject, attempts, last_error, created_at FROM email_outbox
+            WHERE status = 'dead' ORDER BY id DESC LIMIT ?
+        ''', (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def requeue_dead(message_ids=None):
+    """
+    Move dead messages back to pending with a fresh attempt count
+
+    Args:
+        message_ids: Optional list of IDs (all dead messages if omitted)
+
+    Returns:
+        Number of messages requeued
+    """
+    now = datetime.utcnow().isoformat()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if message_ids:
+            placeholders = ','.join('?' * len(message_ids))
+            cursor.execute(f'''
+                UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+                WHERE status = 'dead' AND id IN ({placeholders})
+            ''', [now] + list(message_ids))
+        else:
+            cursor.execute('''
+                UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+                WHERE status = 'dead'
+            ''', (now,))
+        conn.commit()
+        requeued = cursor.rowcount
+
+    if requeued and OUTBOX_AUTOSTART:
+        sender.wake()
+    return requeued
+
+
+def init_app(app):
+    """Resume delivery of mail left in the outbox by a previous run"""
+
+    @app.before_request
+    def _outbox_resume():
+        if OUTBOX_AUTOSTART and sender.pid != os.getpid():
+            sender.wake()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and drain the email outbox')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help='Count messages per status and list dead letters')
+    sub.add_parser('drain', help='Deliver all due messages now')
+    requeue = sub.add_parser('requeue', help='Move dead messages back to pending')
+    requeue.add_argument('--id', type=int, action='append')
+    args = parser.parse_args()
+    init_database()
+
+    if args.command == 'stats':
+        print(outbox_stats())
+        for message in get_dead_letters():
+            print(f"dead #{message['id']} {message['to_email']}: {message['last_error']}")
+    elif args.command == 'drain':
+        totals = {'sent': 0, 'retry': 0, 'dead': 0}
+        while True:
+            counts = process_outbox()
+            if not sum(counts.values()):
+                break
+            for key, value in counts.items():
+                totals[key] += value
+        print(totals)
+    else:
+        print(f"Requeued {requeue_dead(args.id)} message(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Password hashing off the request thread
+Hashes are computed on a small process pool so a burst of logins cannot
+hold the GIL and starve every other route of the worker. The pool is
+bounded: when PASSWORD_HASH_MAX_PENDING hashes are already queued,
+new requests fail fast with HashingBusy (served as 503) instead of piling up.
+
+Hash parameters come from PASSWORD_HASH_METHOD (a Werkzeug method string).
+Pick them for your hardware with:
+
+    python -m backend.passwords calibrate --target-ms 250
+
+Hashes made with other parameters still verify; needs_rehash() tells the
+login flow to store a fresh hash.
+"""
+
+import os
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from backend.metrics import password_hash_duration, password_hash_rejected_total
+
+# Werkzeug hash method for new hashes (scrypt:N:r:p or pbkdf2:sha256:iterations)
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+# Hashing processes per worker (0 hashes on the calling thread)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+
+# Hashes queued or running per worker before new ones are refused. The default
+# queues 8 per hashing process: at the calibrated ~250 ms per hash, the last one
+# waits about 2 s, well inside PASSWORD_HASH_TIMEOUT.
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', str(8 * max(1, PASSWORD_HASH_WORKERS))))
+
+# Seconds to wait for a hash before giving up
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+
+# Calibration never goes above this scrypt N (memory use is 128 * N * r bytes)
+SCRYPT_MAX_N = 2 ** 20
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated or unavailable"""
+
+
+def _get_pool():
+    """Create the process pool lazily, once per process (safe after fork)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                # Spawned, not forked: a forked child would inherit this worker's client
+                # sockets and keep connections the worker closed half-open
+                _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+                _pool_pid = pid
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def _run(op, func, *args):
+    """Run a hashing function on the pool, bounded by the pending-slot semaphore"""
+    start = time.perf_counter()
+    try:
+        if PASSWORD_HASH_WORKERS <= 0:
+            return func(*args)
+
+        if not _slots.acquire(blocking=False):
+            password_hash_rejected_total.inc(op=op)
+            raise HashingBusy('Too many password checks in progress, try again shortly')
+        try:
+            return _get_pool().submit(func, *args).result(timeout=PASSWORD_HASH_TIMEOUT)
+        except BrokenProcessPool:
+            # A hashing process died; start a fresh pool for the next request
+            _reset_pool()
+            raise HashingBusy('Password hashing is temporarily unavailable')
+        except FutureTimeout:
+            password_hash_rejected_total.inc(op=op)
+            raise HashingBusy('Password hashing timed out')
+        finally:
+            _slots.release()
+    finally:
+        password_hash_duration.observe(time.perf_counter() - start, op=op)
+
+
+def hash_password(password):
+    """Hash a password with the configured method"""
+    return _run('hash', generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash (any supported method)"""
+    return _run('verify', check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with different parameters than PASSWORD_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+
+def _time_method(method, rounds=3):
+    """Best-of-n seconds to hash one password with a method"""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash('calibration-password', method)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate(target_ms=250, algorithm='scrypt'):
+    """
+    Find the strongest parameters that hash within target_ms on this machine
+
+    scrypt doubles N (r=8, p=1) while the hash stays under the target;
+    pbkdf2 scales the iteration count from a timed sample.
+
+    Returns:
+        (method string, measured milliseconds)
+    """
+    target = target_ms / 1000
+    if algorithm == 'pbkdf2':
+        sample = 100_000
+        per_iteration = _time_method(f'pbkdf2:sha256:{sample}') / sample
+        iterations = max(sample, int(target / per_iteration) // 10_000 * 10_000)
+        method = f'pbkdf2:sha256:{iterations}'
+        return method, _time_method(method) * 1000
+
+    n = 2 ** 14
+    method = f'scrypt:{n}:8:1'
+    elapsed = _time_method(method)
+    while n < SCRYPT_MAX_N:
+        candidate = f'scrypt:{n * 2}:8:1'
+        candidate_elapsed = _time_method(candidate)
+        if candidate_elapsed > target:
+            break
+        n, method, elapsed = n * 2, candidate, candidate_elapsed
+    return method, elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Password hashing tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    cal = sub.add_parser('calibrate', help='Pick hash parameters for a target latency on this machine')
+    cal.add_argument('--target-ms', type=float, default=250)
+    cal.add_argument('--algorithm', choices=('scrypt', 'pbkdf2'), default='scrypt')
+    args = parser.parse_args()
+
+    current = _time_method(PASSWORD_HASH_METHOD) * 1000
+    method, elapsed = calibrate(args.target_ms, args.algorithm)
+    print(f"Current {PASSWORD_HASH_METHOD}: {current:.0f} ms per hash")
+    print(f"Selected {method}: {elapsed:.0f} ms per hash (target {args.target_ms:.0f} ms)")
+    print(f"\nAdd to .env:\nPASSWORD_HASH_METHOD={method}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Local lead pre-scoring
+Keyword and number rules give every lead a provisional score from its
+budget, need and urgency text before any LLM call. Leads scoring below
+LEAD_PRESCORE_THRESHOLD are answered right away with the provisional
+score. They are stored like any other lead result, with prescored: true.
+They still use a request-rate slot, but no LLM call or token budget.
+Leads at or above the threshold get the full LLM analysis.
+
+A batch is scored in one pass per dimension: the distinct texts of all
+leads are joined and scanned with a single compiled pattern, and each
+match is mapped back to its lead. 10,000 leads take well under a second
+(POST /api/leads/prescore, or offline):
+
+    python -m backend.prescore score leads.csv    # columns: name, budget, need, urgency
+
+marketmind_lead_prescore_total{outcome="avoided"} counts the LLM calls
+saved and outcome="escalated" the LLM calls made; the routes count each
+request once it has passed the quota (record_outcome). A dimension without any recognizable signal counts as
+UNKNOWN_SUBSCORE, so vague leads are escalated rather than dismissed.
+"""
+
+import os
+import re
+import csv
+import time
+import argparse
+from bisect import bisect_right
+from backend.leads import readiness_tier
+from backend.metrics import lead_prescore_total
+
+# Leads with a provisional score below this get no LLM analysis (0 sends every lead)
+LEAD_PRESCORE_THRESHOLD = int(os.getenv('LEAD_PRESCORE_THRESHOLD', '35'))
+
+# Most leads per /api/leads/prescore request
+MAX_PRESCORE_BATCH = 5000
+
+# Weight of each dimension in the provisional score
+PRESCORE_WEIGHTS = {'budget': 0.4, 'need': 0.3, 'urgency': 0.3}
+
+# Sub-score of a dimension with no recognizable signal
+UNKNOWN_SUBSCORE = 50
+
+# Between the texts of a batch: no pattern can match across a NUL
+_SEPARATOR = '\n\0\n'
+
+# Skip "no pain" / "not urgent" style negations of a positive keyword
+_NOT = r'(?<!\bno )(?<!\bnot )'
+
+
+def _amount_score(match):
+    """Budget sub-score of a money amount ($50k, USD 120,000, 2.5M, $2,000/month)"""
+    if not match.group('currency') and not match.group('unit'):
+        return None
+    value = float(match.group('amount').replace(',', ''))
+    value *= {'k': 1e3, 'thousand': 1e3, 'm': 1e6, 'mn': 1e6, 'million': 1e6}.get(match.group('unit') or '', 1)
+    if match.group('monthly'):
+        value *= 12
+    for minimum, score in ((100000, 95), (50000, 85), (20000, 70), (5000, 50), (1, 30)):
+        if value >= minimum:
+            return score
+    return 0
+
+
+def _timeline_score(match):
+    """Urgency sub-score of a timeline ("within 3 weeks", "6-week deadline")"""
+    days = int(match.group('count')) * {'day': 1, 'week': 7, 'month': 30, 'year': 365}[match.group('period')]
+    for maximum, score in ((14, 95), (45, 80), (120, 60), (270, 35)):
+        if days <= maximum:
+            return score
+    return 10
+
+
+# Dimension -> ((sub-score or scorer(match), pattern), ...). The highest match wins;
+# a scorer returning None ignores the match.
+SIGNALS = {
+    'budget': (
+        (0, r"no budget|zero budget|\bnone\b|\bnil\b|\bn/?a\b|unfunded|no funds|can'?t afford|not allocated"),
+        (20, r'\blow\b|limited|tight|small|minimal|shoestring|pending approval|not approved'),
+        (55, r'\bmedium\b|moderate|mid-?range|flexible'),
+        (85, _NOT + r'(?:\bhigh\b|large|significant|substantial|approved|allocated|signed off|enterprise)'),
+        (_amount_score, r'(?P<currency>[$€£]|\busd ?)?(?P<amount>\d[\d,]*(?:\.\d+)?) ?'
+                        r'(?P<unit>k|mn|m|thousand|million)?\b(?P<monthly> ?(?:/ ?mo(?:nth)?|per month|a month|monthly))?'),
+    ),
+    'need': (
+        (10, r'no need|not needed|just (?:looking|browsing|curious)|nice to have|no pain|satisfied with|no interest'
+             r'|not interested'),
+        (45, _NOT + r'\b(?:medium|moderate|could help|interested|considering|evaluating|exploring)'),
+        (75, _NOT + r'\b(?:important|significant|high\b|priority|struggl|pain|problem|manual|inefficien|losing'
+                    r'|replac|migrat|expan|scal)'),
+        (95, _NOT + r'(?:critical|essential|must[- ]have|mission[- ]critical|blocking|compliance|urgent need)'),
+    ),
+    'urgency': (
+        (5, r'no rush|no hurry|no timeline|someday|not urgent|not a priority|next year|long[- ]term|\blow\b|\bnone\b'),
+        (40, r'next quarter|six months|later this year|\bmedium\b|mid[- ]term|eventually'),
+        (75, _NOT + r'(?:this quarter|this month|short[- ]term|soon|\bhigh\b)'),
+        (95, _NOT + r'(?:immediate|asap|urgent|right away|\bnow\b|today|this week|critical|deadline)'),
+        (_timeline_score, r'\b(?P<count>\d{1,3})[- ]?(?P<period>day|week|month|year)s?\b'),
+    ),
+}
+
+
+def _compile(signals):
+    """One alternation per dimension; each rule is a named group starting at a word"""
+    groups = []
+    scorers = {}
+    for index, (score, pattern) in enumerate(signals):
+        scorers[f's{index}'] = score
+        groups.append(f'(?P<s{index}>{pattern})')
+    # Mid-word positions fail on the first check instead of trying every rule
+    return re.compile(r'(?<!\w)(?:' + '|'.join(groups) + ')'), scorers
+
+
+_PATTERNS = {dimension: _compile(signals) for dimension, signals in SIGNALS.items()}
+
+
+def _scan(texts, dimension):
+    """
+    Sub-score of each text for one dimension, in a single regex pass
+
+    Each distinct text is scanned once: bulk lists repeat the same budget
+    and urgency picklist values across thousands of leads.
+
+    Returns:
+        List of sub-scores, None where no signal matched
+    """
+    pattern, scorers = _PATTERNS[dimension]
+    distinct = list(dict.fromkeys(texts))
+    starts = []
+    position = 0
+    for text in distinct:
+        starts.append(position)
+        position += len(text) + len(_SEPARATOR)
+    scores = [None] * len(distinct)
+    for match in pattern.finditer(_SEPARATOR.join(distinct).lower()):
+        scorer = scorers[match.lastgroup]
+        value = scorer(match) if callable(scorer) else scorer
+        if value is None:
+            continue
+        index = bisect_right(starts, match.start()) - 1
+        if scores[index] is None or value > scores[index]:
+            scores[index] = value
+    by_text = dict(zip(distinct, scores))
+    return [by_text[text] for text in texts]
+
+
+def prescore_leads(leads, threshold=None):
+    """
+    Provisional scores of a batch of leads
+
+    Args:
+        leads: Dicts with budget, need and urgency text
+        threshold: Escalation threshold (default LEAD_PRESCORE_THRESHOLD)
+
+    Returns:
+        List of dicts shaped like validate_lead_score() results, plus
+        escalate (send to the LLM). Sub-scores are None where the text
+        gave no signal; authority and conversion_probability are always
+        None (left to the LLM).
+    """
+    threshold = LEAD_PRESCORE_THRESHOLD if threshold is None else threshold
+    columns = [_scan([str(lead.get(dimension) or '') for lead in leads], dimension)
+               for dimension in PRESCORE_WEIGHTS]
+    weights = list(PRESCORE_WEIGHTS.values())
+    results = []
+    for budget, need, urgency in zip(*columns):
+        score = int(round(sum(weight * (UNKNOWN_SUBSCORE if value is None else value)
+                              for weight, value in zip(weights, (budget, need, urgency)))))
+        results.append({
+            'score': score,
+            'conversion_probability': None,
+            'readiness': readiness_tier(score),
+            'budget': budget,
+            'authority': None,
+            'need': need,
+            'urgency': urgency,
+            'escalate': score >= threshold,
+        })
+    return results
+
+
+def _subscore(value):
+    return 'not stated' if value is None else value
+
+
+def local_lead_result(name, budget, need, urgency):
+    """
+    Answer an obviously cold lead without the LLM
+
+    Returns:
+        (narrative, {'scores': ..., 'prescored': True}) for a lead below the
+        threshold, or None if it should get the full LLM analysis
+    """
+    if LEAD_PRESCORE_THRESHOLD <= 0:
+        return None
+    [result] = prescore_leads([{'budget': budget, 'need': need, 'urgency': urgency}])
+    if result.pop('escalate'):
+        return None
+    narrative = (
+        f"## Lead Qualification Score: {result['score']}/100 (provisional)\n\n"
+        f"**Readiness:** {result['readiness'].capitalize()}\n\n"
+        f"{name} was scored from the stated budget ({_subscore(result['budget'])}), "
+        f"need ({_subscore(result['need'])}) and urgency ({_subscore(result['urgency'])}). "
+        f"Leads below {LEAD_PRESCORE_THRESHOLD} do not get a full AI analysis. "
+        "Score this lead again once it has a budget or a timeline."
+    )
+    return narrative, {'scores': result, 'prescored': True}
+
+
+def record_outcome(local):
+    """Count a served lead: answered locally (local_lead_result()) or sent to the LLM (None)"""
+    if LEAD_PRESCORE_THRESHOLD > 0:
+        lead_prescore_total.inc(outcome='avoided' if local else 'escalated')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local lead pre-scoring')
+    sub = parser.add_subparsers(dest='command', required=True)
+    score = sub.add_parser('score', help='Pre-score a CSV of leads (name, budget, need, urgency)')
+    score.add_argument('path')
+    score.add_argument('--threshold', type=int, default=LEAD_PRESCORE_THRESHOLD)
+    score.add_argument('--out', help='Write the leads with their provisional scores to this CSV')
+    args = parser.parse_args()
+
+    with open(args.path, newline='') as f:
+        leads = list(csv.DictReader(f))
+    start = time.perf_counter()
+    results = prescore_leads(leads, threshold=args.threshold)
+    elapsed = (time.perf_counter() - start) * 1000
+    escalated = sum(1 for result in results if result['escalate'])
+
+    if args.out:
+        fields = ['score', 'readiness', 'escalate']
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(leads[0].keys() if leads else []) + fields)
+            writer.writeheader()
+            for lead, result in zip(leads, results):
+                writer.writerow(dict(lead, **{field: result[field] for field in fields}))
+
+    print(f'{len(leads)} leads pre-scored in {elapsed:.1f} ms (threshold {args.threshold})')
+    print(f'  {escalated} escalated to the LLM, {len(leads) - escalated} LLM calls avoided')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+On-demand profiling for live workers
+A sampling profiler that walks sys._current_frames() and returns collapsed
+stacks (one "frame;frame;frame count" line per unique stack, the input
+format of flamegraph.pl and speedscope), plus tracemalloc snapshots and
+diffs for tracking memory growth.
+
+Only threads of the current process are visible, so under gunicorn sync
+workers use --threads > 1 (or profile from a second thread) to see the
+request being investigated.
+"""
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+
+# Master switch for the admin profiling endpoints
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+# Innermost frames of threads that are parked rather than working
+IDLE_FRAMES = ('wait (threading.py', 'select (selectors.py', 'accept (socket.py')
+
+MAX_PROFILE_SECONDS = 60
+MIN_SAMPLE_INTERVAL = 0.001
+
+_profile_lock = threading.Lock()
+_memory_lock = threading.Lock()
+_baseline = None
+
+
+class ProfilerBusy(Exception):
+    """Raised when a CPU profile is already running in this process"""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+def sample_stacks(duration=5.0, interval=0.005, include_idle=False):
+    """
+    Sample the stacks of all other threads for `duration` seconds
+
+    Args:
+        duration: Seconds to sample (capped at MAX_PROFILE_SECONDS)
+        interval: Seconds between samples
+        include_idle: Keep stacks of threads parked in lock/sleep waits
+
+    Returns:
+        Dict with 'samples', 'duration' and 'stacks' (collapsed stack -> count)
+    """
+    duration = max(0.0, min(float(duration), MAX_PROFILE_SECONDS))
+    interval = max(float(interval), MIN_SAMPLE_INTERVAL)
+
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy('A profile is already running in this worker')
+
+    try:
+        me = threading.get_ident()
+        names = {}
+        stacks = {}
+        samples = 0
+        end = time.perf_counter() + duration
+
+        while True:
+            names.update({t.ident: t.name for t in threading.enumerate()})
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if not include_idle and labels and labels[0].startswith(IDLE_FRAMES):
+                    continue
+                labels.append(f'thread:{names.get(ident, ident)}')
+                key = ';'.join(reversed(labels))
+                stacks[key] = stacks.get(key, 0) + 1
+            samples += 1
+            if time.perf_counter() >= end:
+                break
+            time.sleep(interval)
+
+        return {'samples': samples, 'duration': duration, 'stacks': stacks}
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(stacks):
+    """Render sampled stacks as collapsed-stack text"""
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def start_memory_tracking(frames=10):
+    """Start tracemalloc (no-op if already tracing)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return True
+
+
+def stop_memory_tracking():
+    """Stop tracemalloc and drop the stored baseline"""
+    global _baseline
+    with _memory_lock:
+        _baseline = None
+        tracemalloc.stop()
+
+
+def _format_stats(stats, limit):
+    return [
+        {
+            'location': str(stat.traceback[0]) if stat.traceback else '?',
+            'size_kb': round(stat.size / 1024, 1),
+            'size_diff_kb': round(getattr(stat, 'size_diff', 0) / 1024, 1),
+            'count': stat.count,
+            'count_diff': getattr(stat, 'count_diff', 0),
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def memory_snapshot(limit=25, group_by='lineno'):
+    """
+    Take a tracemalloc snapshot, store it as the diff baseline and
+    return the top allocation sites
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('Memory tracking is not running')
+    with _memory_lock:
+        snapshot = tracemalloc.take_snapshot()
+        _baseline = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'traced_kb': round(current / 1024, 1),
+        'peak_kb': round(peak / 1024, 1),
+        'top': _format_stats(snapshot.statistics(group_by), limit),
+    }
+
+
+def memory_diff(limit=25, group_by='lineno'):
+    """
+    Compare a new snapshot against the stored baseline
+
+    The new snapshot becomes the baseline for the next diff.
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('Memory tracking is not running')
+    with _memory_lock:
+        if _baseline is None:
+            raise RuntimeError('Take a snapshot before requesting a diff')
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(_baseline, group_by)
+        _baseline = snapshot
+    return {'top': _format_stats(stats, limit)}
@@ -1,44 +1,319 @@
-def campaign_prompt(product, audience, platform):
-    return f"""
-You are a Chief Marketing Officer with expertise in creating data-driven marketing strategies.
+"""
+Prompt templates
+Every prompt is a named, versioned template registered here. Rendering
+estimates the prompt's tokens and keeps the user's fields within a budget:
+each field has its own cap and shrink policy, and when all fields together
+exceed PROMPT_INPUT_TOKENS, the largest ones are cut first. The rendered
+prompt is a str that also carries its template id ('campaign@1'), its
+estimated tokens and the fields that were cut. Generation routes store the
+template id with the history entry and the llm.generate span, and LLM
+latency metrics are labelled with it, so versions can be compared:
 
-Generate a comprehensive marketing campaign strategy with the following components:
+    python -m backend.prompts list    # registered templates, active versions, field caps
 
-1. Campaign Objectives - Clear, measurable goals for this campaign
-2. Audience Psychology - Deep insights into the target audience's motivations and pain points
-3. Content Ideas - 5 unique content ideas tailored to the platform
-4. Ad Copy Variations - 3 compelling ad copy variations with different angles
-5. Call-to-Action Strategy - Specific CTAs optimized for conversions on the platform
+Shrink policies:
 
-Product/Service: {product}
-Target Audience: {audience}
-Marketing Platform: {platform}
+- truncate: keep the beginning, cut at a word boundary
+- extract: keep whole sentences, the first of each paragraph first, in
+  their original order (an extractive summary, no extra LLM call)
 
-Please provide a detailed, actionable strategy that considers platform-specific best practices.
+Token counts are estimates (CHARS_PER_TOKEN); Groq reports the real usage.
 """
 
+import os
+import re
+import argparse
+from backend.metrics import prompt_truncations_total
 
-def sales_prompt(product, persona):
-    return f"""
-You are a senior enterprise sales leader with experience in closing high-value deals.
+# Estimated tokens for all of a prompt's user fields together
+PROMPT_INPUT_TOKENS = int(os.getenv('PROMPT_INPUT_TOKENS', '1500'))
+
+# Pinned template versions, e.g. "campaign=1,pitch=2" (default: the latest of each)
+PROMPT_TEMPLATE_VERSIONS = os.getenv('PROMPT_TEMPLATE_VERSIONS', '')
+
+# Average characters per token of English text for the Llama 3 tokenizer
+CHARS_PER_TOKEN = 4
+
+# Fewest tokens a field is cut to, however tight the budget
+MIN_FIELD_TOKENS = 8
+
+TRUNCATION_MARK = ' [...]'
+
+# Numbered sections requested by the campaign and pitch prompts: (key, title, description).
+# Results are split on these headings (backend/sections.py) so one section can be regenerated.
+CAMPAIGN_SECTIONS = (
+    ('objectives', 'Campaign Objectives', 'Clear, measurable goals for this campaign'),
+    ('audience_psychology', 'Audience Psychology',
+     "Deep insights into the target audience's motivations and pain points"),
+    ('content_ideas', 'Content Ideas', '5 unique content ideas tailored to the platform'),
+    ('ad_copy', 'Ad Copy Variations', '3 compelling ad copy variations with different angles'),
+    ('cta_strategy', 'Call-to-Action Strategy', 'Specific CTAs optimized for conversions on the platform'),
+)
+
+PITCH_SECTIONS = (
+    ('elevator_pitch', '30-Second Elevator Pitch', 'A concise, engaging pitch for initial contact'),
+    ('value_proposition', 'Value Proposition', 'Clear statement of business value and benefits'),
+    ('differentiators', 'Key Differentiators', '4-5 key advantages versus competitive alternatives'),
+    ('pain_points', 'Pain Point Alignment', 'How the solution addresses specific customer pain points'),
+    ('closing_cta', 'Closing Call-To-Action', 'Next steps to move the deal forward (demo, meeting, trial)'),
+)
+
+CAMPAIGN_ROLE = 'You are a Chief Marketing Officer with expertise in creating data-driven marketing strategies.'
+PITCH_ROLE = 'You are a senior enterprise sales leader with experience in closing high-value deals.'
+
+
+def _numbered(sections):
+    return '\n'.join(f'{number}. {title} - {description}'
+                     for number, (_, title, description) in enumerate(sections, 1))
+
+
+def _section_request(sections, key):
+    for number, (section_key, title, description) in enumerate(sections, 1):
+        if section_key == key:
+            return f'{number}. {title} - {description}'
+    raise ValueError(f'Unknown section: {key}')
+
+
+def estimate_tokens(text):
+    """Estimated token count of text (rounded up)"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate(text, tokens):
+    """Beginning of text within tokens, cut at a word boundary"""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:max(limit - len(TRUNCATION_MARK), 0)]
+    space = cut.rfind(' ')
+    if space > len(cut) * 0.8:
+        cut = cut[:space]
+    return cut.rstrip() + TRUNCATION_MARK
+
+
+_PARAGRAPHS = re.compile(r'\n\s*\n')
+_SENTENCES = re.compile(r'(?<=[.!?])\s+')
+
+
+def extract(text, tokens):
+    """
+    Whole sentences of text within tokens
+
+    Sentences are taken in rounds, the first sentence of every paragraph,
+    then the second, and so on, and kept in their original order. Falls
+    back to truncate() when not even one sentence fits.
+    """
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    paragraphs = [_SENTENCES.split(' '.join(p.split())) for p in _PARAGRAPHS.split(text.strip()) if p.strip()]
+    room = limit - len(TRUNCATION_MARK)
+    chosen = set()
+    for depth in range(max(len(p) for p in paragraphs)):
+        for index, sentences in enumerate(paragraphs):
+            # Each sentence costs its length plus a separator
+            if depth < len(sentences) and len(sentences[depth]) + 2 <= room:
+                chosen.add((index, depth))
+                room -= len(sentences[depth]) + 2
+    if not chosen:
+        return truncate(text, tokens)
+    kept = [' '.join(s for depth, s in enumerate(sentences) if (index, depth) in chosen)
+            for index, sentences in enumerate(paragraphs)]
+    return '\n\n'.join(p for p in kept if p) + TRUNCATION_MARK
+
+
+SHRINK_POLICIES = {'truncate': truncate, 'extract': extract}
+
+
+class RenderedPrompt(str):
+    """Prompt text, plus the template it came from and what rendering cut"""
+
+    def __new__(cls, text, template_id, truncated=()):
+        prompt = super().__new__(cls, text)
+        prompt.template_id = template_id
+        prompt.tokens = estimate_tokens(text)
+        prompt.truncated = tuple(truncated)
+        return prompt
+
+
+class PromptTemplate:
+    """
+    A named, versioned prompt
+
+    Args:
+        text: str.format() template
+        fields: {field: (token cap, shrink policy)}; a cap of None marks
+                text built by the app (section context), never cut
+    """
+
+    def __init__(self, name, version, text, fields):
+        for cap, policy in fields.values():
+            if cap is not None and policy not in SHRINK_POLICIES:
+                raise ValueError(f'Unknown shrink policy: {policy}')
+        self.name = name
+        self.version = version
+        self.text = text
+        self.fields = fields
+
+    @property
+    def id(self):
+        return f'{self.name}@{self.version}'
+
+    def render(self, values, budget=None):
+        """
+        Fill in the fields, shrinking them to their caps and the budget
+
+        Args:
+            values: {field: value}
+            budget: Estimated tokens for all fields (default PROMPT_INPUT_TOKENS)
+
+        Returns:
+            RenderedPrompt
+        """
+        values = {name: str(values[name]) for name in self.fields}
+        allowance = _allocate(
+            {name: estimate_tokens(value) for name, value in values.items()},
+            {name: cap for name, (cap, _) in self.fields.items()},
+            PROMPT_INPUT_TOKENS if budget is None else budget
+        )
+        truncated = []
+        for name, tokens in allowance.items():
+            if estimate_tokens(values[name]) > tokens:
+                values[name] = SHRINK_POLICIES[self.fields[name][1]](values[name], tokens)
+                truncated.append(name)
+                prompt_truncations_total.inc(template=self.id, field=name)
+        return RenderedPrompt(self.text.format(**values), self.id, truncated)
+
+
+def _allocate(sizes, caps, budget):
+    """
+    Token allowance of each cappable field
+
+    Fields are held to their caps. Fields under an even share of what is
+    left of the budget keep everything; the rest split the remainder.
+    """
+    wanted = {name: min(size, caps[name]) for name, size in sizes.items() if caps[name] is not None}
+    remaining = budget - sum(size for name, size in sizes.items() if caps[name] is None)
+    allowance = {}
+    pending = sorted(wanted, key=wanted.get)
+    while pending:
+        share = max(remaining // len(pending), MIN_FIELD_TOKENS)
+        if wanted[pending[0]] > share:
+            allowance.update((name, share) for name in pending)
+            break
+        name = pending.pop(0)
+        allowance[name] = wanted[name]
+        remaining -= wanted[name]
+    return allowance
+
+
+# name -> {version: PromptTemplate}
+TEMPLATES = {}
+
+
+def _parse_pins(spec):
+    pins = {}
+    for item in spec.split(','):
+        name, _, version = item.partition('=')
+        if name.strip() and version.strip().isdigit():
+            pins[name.strip()] = int(version)
+    return pins
+
+
+_pinned = _parse_pins(PROMPT_TEMPLATE_VERSIONS)
+
+
+def register(template):
+    TEMPLATES.setdefault(template.name, {})[template.version] = template
+    return template
+
+
+def get_template(name, version=None):
+    """
+    Get a template, by default the pinned or latest version
+
+    Raises:
+        ValueError: unknown template name or version
+    """
+    versions = TEMPLATES.get(name)
+    if not versions:
+        raise ValueError(f'Unknown prompt template: {name}')
+    version = version or _pinned.get(name) or max(versions)
+    if version not in versions:
+        raise ValueError(f'Unknown prompt template version: {name}@{version}')
+    return versions[version]
+
+
+def render(name, values, version=None, budget=None):
+    """Render the active (or given) version of a template; see PromptTemplate.render"""
+    return get_template(name, version).render(values, budget)
+
+
+# ==================== TEMPLATES ====================
+
+register(PromptTemplate('campaign', 1, f"""
+{CAMPAIGN_ROLE}
+
+Generate a comprehensive marketing campaign strategy with the following components:
+
+{_numbered(CAMPAIGN_SECTIONS)}
+
+Product/Service: {{product}}
+Target Audience: {{audience}}
+Marketing Platform: {{platform}}
+
+Please provide a detailed, actionable strategy that considers platform-specific best practices.
+""", {'product': (800, 'extract'), 'audience': (300, 'extract'), 'platform': (60, 'truncate')}))
+
+register(PromptTemplate('pitch', 1, f"""
+{PITCH_ROLE}
 
 Create a comprehensive sales pitch with the following components:
 
-1. 30-Second Elevator Pitch - A concise, engaging pitch for initial contact
-2. Value Proposition - Clear statement of business value and benefits
-3. Key Differentiators - 4-5 key advantages versus competitive alternatives
-4. Pain Point Alignment - How the solution addresses specific customer pain points
-5. Closing Call-To-Action - Next steps to move the deal forward (demo, meeting, trial)
+{_numbered(PITCH_SECTIONS)}
 
-Product/Solution: {product}
-Customer Persona: {persona}
+Product/Solution: {{product}}
+Customer Persona: {{persona}}
 
 Ensure the pitch is personalized, compelling, and focused on the customer's specific needs and situation.
-"""
+""", {'product': (800, 'extract'), 'persona': (400, 'extract')}))
 
+register(PromptTemplate('campaign_section', 1, f"""
+{CAMPAIGN_ROLE}
 
-def lead_scoring_prompt(name, budget, need, urgency):
-    return f"""
+Rewrite one section of an existing marketing campaign strategy:
+
+{{section}}
+
+Product/Service: {{product}}
+Target Audience: {{audience}}
+Marketing Platform: {{platform}}
+
+The rest of the strategy, for consistency (do not repeat it):
+{{context}}
+
+Reply with the new section content only, without its heading. Make it fresh, detailed and actionable.
+""", {'section': (None, None), 'product': (800, 'extract'), 'audience': (300, 'extract'),
+      'platform': (60, 'truncate'), 'context': (None, None)}))
+
+register(PromptTemplate('pitch_section', 1, f"""
+{PITCH_ROLE}
+
+Rewrite one section of an existing sales pitch:
+
+{{section}}
+
+Product/Solution: {{product}}
+Customer Persona: {{persona}}
+
+The rest of the pitch, for consistency (do not repeat it):
+{{context}}
+
+Reply with the new section content only, without its heading. Keep it personalized and compelling.
+""", {'section': (None, None), 'product': (800, 'extract'), 'persona': (400, 'extract'),
+      'context': (None, None)}))
+
+register(PromptTemplate('lead_score', 1, """
 You are a sales intelligence analyst expert in lead qualification and scoring.
 
 Evaluate this lead across multiple qualification dimensions and provide:
@@ -70,4 +345,53 @@ Lead Information:
 - Urgency Level: {urgency}
 
 Provide a comprehensive qualification analysis that helps prioritize sales efforts.
-"""
+
+End your answer with the scores as a JSON code block, with integers from 0 to 100 and nothing after it:
+```json
+{{"score": 0, "conversion_probability": 0, "readiness": "hot|warm|lukewarm|cold", "budget": 0, "authority": 0, "need": 0, "urgency": 0}}
+```
+""", {'name': (40, 'truncate'), 'budget': (150, 'truncate'), 'need': (600, 'extract'),
+      'urgency': (150, 'truncate')}))
+
+
+def campaign_prompt(product, audience, platform):
+    return render('campaign', {'product': product, 'audience': audience, 'platform': platform})
+
+
+def sales_prompt(product, persona):
+    return render('pitch', {'product': product, 'persona': persona})
+
+
+def campaign_section_prompt(product, audience, platform, key, context):
+    return render('campaign_section', {'section': _section_request(CAMPAIGN_SECTIONS, key), 'product': product,
+                                       'audience': audience, 'platform': platform, 'context': context})
+
+
+def sales_section_prompt(product, persona, key, context):
+    return render('pitch_section', {'section': _section_request(PITCH_SECTIONS, key), 'product': product,
+                                    'persona': persona, 'context': context})
+
+
+def lead_scoring_prompt(name, budget, need, urgency):
+    return render('lead_score', {'name': name, 'budget': budget, 'need': need, 'urgency': urgency})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prompt template registry')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='Registered templates, active versions and field caps')
+    parser.parse_args()
+
+    print(f'Input budget: {PROMPT_INPUT_TOKENS} tokens per prompt')
+    for name in sorted(TEMPLATES):
+        active = get_template(name)
+        for version in sorted(TEMPLATES[name]):
+            template = TEMPLATES[name][version]
+            fields = ', '.join(f'{field} ({cap} {policy})' if cap else field
+                               for field, (cap, policy) in template.fields.items())
+            marker = '*' if template is active else ' '
+            print(f'{marker} {template.id:<20} ~{estimate_tokens(template.text)} tokens  {fields}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+"""
+Per-user and per-IP generation quotas
+Every LLM request is checked against two limits, for both the user and
+the client IP:
+
+- a sliding-window request rate (QUOTA_*_RATE_LIMIT requests per
+  QUOTA_RATE_WINDOW seconds)
+- a daily token budget (UTC day), charged with the prompt and completion
+  token counts Groq returns for each completion
+
+The counters live in memory in each worker. Every QUOTA_SYNC_INTERVAL
+seconds they are reconciled with SQLite (rate_limit_counters): local
+increments are added to the shared rows and the shared totals are read
+back. A worker also reconciles a user's or IP's counters the first time it
+sees them in a window. Once a counter passes QUOTA_SYNC_MARGIN of its
+limit, each check reconciles first. Near a limit, all workers therefore
+decide on the same shared count. The only overshoot is requests a worker
+accepted below the margin that it has not synced yet. A budget is checked
+before the call and charged after it, so the last request of the day can
+overshoot by one completion.
+
+Requests answered without an LLM call (pre-scored leads) still use a
+rate slot but need no token budget.
+
+Admins override a user's limits (user_quotas table) through /admin/quotas.
+"""
+
+import os
+import time
+import atexit
+import threading
+from datetime import datetime
+from backend.database import get_db
+from backend.metrics import quota_throttled_total
+from backend.throttle import sliding_window_retry_after
+
+# Generation requests per user / per IP per window (0 disables the limit)
+QUOTA_USER_RATE_LIMIT = int(os.getenv('QUOTA_USER_RATE_LIMIT', '10'))
+QUOTA_IP_RATE_LIMIT = int(os.getenv('QUOTA_IP_RATE_LIMIT', '30'))
+
+# Sliding window for the request rates, in seconds
+QUOTA_RATE_WINDOW = int(os.getenv('QUOTA_RATE_WINDOW', '60'))
+
+# LLM tokens (prompt + completion) per user / per IP per UTC day (0 disables the budget)
+QUOTA_USER_DAILY_TOKENS = int(os.getenv('QUOTA_USER_DAILY_TOKENS', '200000'))
+QUOTA_IP_DAILY_TOKENS = int(os.getenv('QUOTA_IP_DAILY_TOKENS', '1000000'))
+
+# Seconds between reconciliations of this worker's counters with the database
+QUOTA_SYNC_INTERVAL = float(os.getenv('QUOTA_SYNC_INTERVAL', '5'))
+
+# Share of a limit after which every check reconciles first
+QUOTA_SYNC_MARGIN = float(os.getenv('QUOTA_SYNC_MARGIN', '0.8'))
+
+RATE_COUNTER = 'quota-rate'
+TOKEN_COUNTER = 'quota-tokens'
+
+
+class QuotaExceeded(Exception):
+    """Raised when a user or IP is over its request rate or token budget"""
+
+    def __init__(self, scope, kind, retry_after, headers):
+        label = 'Too many requests' if kind == 'rate' else 'Daily token budget used up'
+        super().__init__(f'{label}, try again in {retry_after} seconds')
+        self.scope = scope
+        self.kind = kind
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+class ReconciledCounter:
+    """
+    Integer counters keyed by (key, period), kept in memory per worker
+
+    get() is the shared total as of the last sync plus this worker's
+    increments since then. sync() adds the increments to the shared rows in
+    rate_limit_counters and reads the totals back.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._shared = {}
+        self._pending = {}
+
+    def _check_fork(self):
+        # Counts inherited through a fork were synced (or are owed) by the parent
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._shared.clear()
+            self._pending.clear()
+
+    def get(self, key, period):
+        with self._lock:
+            self._check_fork()
+            entry = (key, period)
+            return self._shared.get(entry, 0) + self._pending.get(entry, 0)
+
+    def known(self, key, period):
+        """True once the entry's shared total has been loaded (or it was counted here)"""
+        with self._lock:
+            self._check_fork()
+            return (key, period) in self._shared or (key, period) in self._pending
+
+    def add(self, key, period, amount=1):
+        with self._lock:
+            self._check_fork()
+            entry = (key, period)
+            self._pending[entry] = self._pending.get(entry, 0) + amount
+
+    def sync(self, entries=None, oldest_period=None):
+        """
+        Reconcile with the database
+
+        Args:
+            entries: (key, period) pairs to reconcile (default: every known entry)
+            oldest_period: Forget in-memory entries of earlier periods
+        """
+        with self._lock:
+            self._check_fork()
+            if oldest_period is not None:
+                for entry in [e for e in self._shared if e[1] < oldest_period and e not in self._pending]:
+                    del self._shared[entry]
+            if entries is None:
+                entries = set(self._shared) | set(self._pending)
+            entries = set(entries)
+            pending = {e: self._pending.pop(e) for e in entries if e in self._pending}
+            # Count the increments as shared while they are written
+            for entry, amount in pending.items():
+                self._shared[entry] = self._shared.get(entry, 0) + amount
+
+        totals = {}
+        try:
+            with get_db('quota_sync') as conn:
+                for (key, period), amount in pending.items():
+                    conn.execute('''
+                        INSERT INTO rate_limit_counters (bucket, window_id, count) VALUES (?, ?, ?)
+                        ON CONFLICT (bucket, window_id) DO UPDATE SET count = count + excluded.count
+                    ''', (f'{self.name}:{key}', period, amount))
+                conn.commit()
+                for key, period in entries:
+                    row = conn.execute('''
+                        SELECT count FROM rate_limit_counters WHERE bucket = ? AND window_id = ?
+                    ''', (f'{self.name}:{key}', period)).fetchone()
+                    totals[(key, period)] = row['count'] if row else 0
+        except Exception:
+            # Keep the increments for the next attempt
+            with self._lock:
+                for entry, amount in pending.items():
+                    self._shared[entry] = self._shared.get(entry, 0) - amount
+                    self._pending[entry] = self._pending.get(entry, 0) + amount
+            raise
+
+        with self._lock:
+            self._shared.update(totals)
+
+    def forget(self, key):
+        """Drop a key from memory (after its rows were deleted)"""
+        with self._lock:
+            for table in (self._shared, self._pending):
+                for entry in [e for e in table if e[0] == key]:
+                    del table[entry]
+
+
+class QuotaGrant:
+    """A request that passed the quota check; charge() records its token usage"""
+
+    def __init__(self, limiter, subjects, day):
+        self.limiter = limiter
+        self.subjects = subjects
+        self.day = day
+
+    def charge(self, prompt_tokens, completion_tokens):
+        """Add a completion's tokens to the day's usage of every subject"""
+        tokens = (prompt_tokens or 0) + (completion_tokens or 0)
+        for key in self.subjects:
+            self.limiter.tokens.add(key, self.day, tokens)
+
+
+def _utc_day(now):
+    return int(now // 86400)
+
+
+class QuotaLimiter:
+    """Request rates and token budgets for users and IPs, shared across workers"""
+
+    def __init__(self):
+        self.rates = ReconciledCounter(RATE_COUNTER)
+        self.tokens = ReconciledCounter(TOKEN_COUNTER)
+        self._overrides = {}
+        self._last_sync = 0.0
+        self._decision_lock = threading.Lock()
+        self._syncer_pid = None
+        self._syncer_lock = threading.Lock()
+
+    def limits(self, key):
+        """(requests per window, tokens per day) for 'user:<id>' or 'ip:<address>'"""
+        if key.startswith('ip:'):
+            return QUOTA_IP_RATE_LIMIT, QUOTA_IP_DAILY_TOKENS
+        rate_limit, daily_tokens = self._overrides.get(key, (None, None))
+        return (QUOTA_USER_RATE_LIMIT if rate_limit is None else rate_limit,
+                QUOTA_USER_DAILY_TOKENS if daily_tokens is None else daily_tokens)
+
+    def _usage(self, key, now):
+        """(sliding-window request count, current window count, carried share, tokens used today)"""
+        window = int(now // QUOTA_RATE_WINDOW)
+        elapsed = (now % QUOTA_RATE_WINDOW) / QUOTA_RATE_WINDOW
+        count = self.rates.get(key, window)
+        carried = self.rates.get(key, window - 1) * (1 - elapsed)
+        return count + carried, count, carried, self.tokens.get(key, _utc_day(now))
+
+    def _needs_sync(self, key, now):
+        """True if the key's counters are unknown here or close to a limit"""
+        window = int(now // QUOTA_RATE_WINDOW)
+        if not (self.rates.known(key, window) and self.rates.known(key, window - 1)
+                and self.tokens.known(key, _utc_day(now))):
+            return True
+        rate_limit, daily_tokens = self.limits(key)
+        rate, _, _, used = self._usage(key, now)
+        return bool((rate_limit and rate + 1 >= rate_limit * QUOTA_SYNC_MARGIN)
+                    or (daily_tokens and used >= daily_tokens * QUOTA_SYNC_MARGIN))
+
+    def _entries(self, keys, now):
+        window = int(now // QUOTA_RATE_WINDOW)
+        return ([(key, window) for key in keys] + [(key, window - 1) for key in keys],
+                [(key, _utc_day(now)) for key in keys])
+
+    def _headers(self, key, now):
+        rate_limit, daily_tokens = self.limits(key)
+        rate, _, _, used = self._usage(key, now)
+        headers = {}
+        if rate_limit:
+            headers['X-RateLimit-Limit'] = str(rate_limit)
+            headers['X-RateLimit-Remaining'] = str(max(0, int(rate_limit - rate)))
+            headers['X-RateLimit-Reset'] = str(int(QUOTA_RATE_WINDOW - now % QUOTA_RATE_WINDOW))
+        if daily_tokens:
+            headers['X-Token-Budget-Limit'] = str(daily_tokens)
+            headers['X-Token-Budget-Remaining'] = str(max(0, daily_tokens - used))
+            headers['X-Token-Budget-Reset'] = str(int(86400 - now % 86400))
+        return headers
+
+    def check(self, user_id, ip_address, tokens=True):
+        """
+        Count a generation request against the user's and the IP's quotas
+
+        Args:
+            user_id: Logged-in user id
+            ip_address: Client IP (may be None)
+            tokens: Also require token budget left (False for requests
+                answered without an LLM call, which only use a rate slot)
+
+        Returns:
+            QuotaGrant to charge the completion's tokens to
+
+        Raises:
+            QuotaExceeded: a rate or budget is used up (headers describe the quota)
+        """
+        self._ensure_syncer()
+        now = time.time()
+        keys = [f'user:{user_id}'] + ([f'ip:{ip_address}'] if ip_address else [])
+
+        try:
+            if now - self._last_sync >= QUOTA_SYNC_INTERVAL:
+                self.sync()
+            stale = [key for key in keys if self._needs_sync(key, now)]
+            if stale:
+                rate_entries, token_entries = self._entries(stale, now)
+                self.rates.sync(rate_entries)
+                self.tokens.sync(token_entries)
+        except Exception as e:
+            # Decide on this worker's counts; the increments are kept for the next sync
+            print(f"Quota sync error: {str(e)}")
+
+        with self._decision_lock:
+            for key in keys:
+                rate_limit, daily_tokens = self.limits(key)
+                rate, count, carried, used = self._usage(key, now)
+                scope = key.split(':', 1)[0]
+                if rate_limit and rate + 1 > rate_limit:
+                    elapsed = (now % QUOTA_RATE_WINDOW) / QUOTA_RATE_WINDOW
+                    retry_after = max(1, sliding_window_retry_after(
+                        count + 1, carried, rate_limit, QUOTA_RATE_WINDOW, elapsed))
+                    quota_throttled_total.inc(scope=scope, kind='rate')
+                    raise QuotaExceeded(scope, 'rate', retry_after, self._headers(key, now))
+                if tokens and daily_tokens and used >= daily_tokens:
+                    quota_throttled_total.inc(scope=scope, kind='tokens')
+                    raise QuotaExceeded(scope, 'tokens', int(86400 - now % 86400) + 1, self._headers(key, now))
+
+            window = int(now // QUOTA_RATE_WINDOW)
+            for key in keys:
+                self.rates.add(key, window)
+        return QuotaGrant(self, keys, _utc_day(now))
+
+    def sync(self):
+        """Reconcile every counter of this worker and reload the admin overrides"""
+        now = time.time()
+        self._last_sync = now
+        self.rates.sync(oldest_period=int(now // QUOTA_RATE_WINDOW) - 1)
+        self.tokens.sync(oldest_period=_utc_day(now))
+        with get_db('quota_overrides') as conn:
+            rows = conn.execute('SELECT user_id, rate_limit, daily_tokens FROM user_quotas').fetchall()
+        self._overrides = {f"user:{row['user_id']}": (row['rate_limit'], row['daily_tokens']) for row in rows}
+
+    def prune(self):
+        """Delete shared counter rows that can no longer affect a decision"""
+        now = time.time()
+        with get_db('quota_prune') as conn:
+            conn.execute('DELETE FROM rate_limit_counters WHERE bucket LIKE ? AND window_id < ?',
+                         (f'{RATE_COUNTER}:%', int(now // QUOTA_RATE_WINDOW) - 1))
+            conn.execute('DELETE FROM rate_limit_counters WHERE bucket LIKE ? AND window_id < ?',
+                         (f'{TOKEN_COUNTER}:%', _utc_day(now) - 7))
+            conn.commit()
+
+    def _sync_loop(self):
+        last_prune = 0.0
+        while True:
+            time.sleep(QUOTA_SYNC_INTERVAL)
+            try:
+                if time.time() - self._last_sync >= QUOTA_SYNC_INTERVAL:
+                    self.sync()
+                if time.time() - last_prune > 3600:
+                    last_prune = time.time()
+                    self.prune()
+            except Exception as e:
+                print(f"Quota sync error: {str(e)}")
+
+    def _ensure_syncer(self):
+        """Start the reconciliation thread once per process (after any fork)"""
+        if self._syncer_pid == os.getpid():
+            return
+        with self._syncer_lock:
+            if self._syncer_pid == os.getpid():
+                return
+            self._syncer_pid = os.getpid()
+            threading.Thread(target=self._sync_loop, name='quota-sync', daemon=True).start()
+            # Flush this worker's last increments on a clean shutdown
+            atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        try:
+            self.rates.sync()
+            self.tokens.sync()
+        except Exception as e:
+            print(f"Quota sync error: {str(e)}")
+
+
+limiter = QuotaLimiter()
+
+
+def check_quota(user_id, ip_address, tokens=True):
+    """Count a generation request against the shared limiter (see QuotaLimiter.check)"""
+    return limiter.check(user_id, ip_address, tokens)
+
+
+# ==================== ADMIN ====================
+
+def get_quotas(user_ids=None, limit=50):
+    """
+    Limits and today's usage per user
+
+    Args:
+        user_ids: Users to report (default: users with an override or usage today)
+        limit: Most users returned (heaviest token users first)
+
+    Returns:
+        List of dicts with user_id, name, email, rate_limit, daily_tokens,
+        tokens_used_today, requests_in_window and overridden
+    """
+    limiter.sync()
+    now = time.time()
+    day = _utc_day(now)
+    with get_db('quota_report') as conn:
+        if user_ids is None:
+            rows = conn.execute('''
+                SELECT id FROM users WHERE id IN (
+                    SELECT user_id FROM user_quotas
+                    UNION
+                    SELECT CAST(substr(bucket, ?) AS INTEGER) FROM rate_limit_counters
+                    WHERE bucket LIKE ? AND window_id = ?
+                )
+            ''', (len(f'{TOKEN_COUNTER}:user:') + 1, f'{TOKEN_COUNTER}:user:%', day)).fetchall()
+            user_ids = [row['id'] for row in rows]
+        placeholders = ','.join('?' * len(user_ids)) or 'NULL'
+        users = {row['id']: dict(row) for row in conn.execute(
+            f'SELECT id, name, email FROM users WHERE id IN ({placeholders})', list(user_ids))}
+
+    # Load the shared totals of users this worker has not seen yet
+    rate_entries, token_entries = limiter._entries([f'user:{user_id}' for user_id in users], now)
+    limiter.rates.sync(rate_entries)
+    limiter.tokens.sync(token_entries)
+
+    report = []
+    for user_id, user in users.items():
+        key = f'user:{user_id}'
+        rate_limit, daily_tokens = limiter.limits(key)
+        rate, _, _, used = limiter._usage(key, now)
+        report.append({
+            'user_id': user_id,
+            'name': user['name'],
+            'email': user['email'],
+            'rate_limit': rate_limit,
+            'daily_tokens': daily_tokens,
+            'tokens_used_today': used,
+            'requests_in_window': round(rate, 2),
+            'overridden': key in limiter._overrides,
+        })
+    report.sort(key=lambda r: r['tokens_used_today'], reverse=True)
+    return report[:limit]
+
+
+def set_user_quota(user_id, daily_tokens=None, rate_limit=None, updated_by=None):
+    """
+    Override a user's limits (None keeps the configured default)
+
+    Other workers pick the change up at their next sync.
+    """
+    with get_db('quota_override') as conn:
+        if daily_tokens is None and rate_limit is None:
+            conn.execute('DELETE FROM user_quotas WHERE user_id = ?', (user_id,))
+        else:
+            conn.execute('''
+                INSERT INTO user_quotas (user_id, daily_tokens, rate_limit, updated_at, updated_by)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET daily_tokens = excluded.daily_tokens,
+                    rate_limit = excluded.rate_limit, updated_at = excluded.updated_at,
+                    updated_by = excluded.updated_by
+            ''', (user_id, daily_tokens, rate_limit, datetime.utcnow().isoformat(), updated_by))
+        conn.commit()
+    limiter.sync()
+
+
+def reset_user_usage(user_id):
+    """Clear a user's request and token counters (every worker converges at its next sync)"""
+    key = f'user:{user_id}'
+    with get_db('quota_reset') as conn:
+        conn.execute('DELETE FROM rate_limit_counters WHERE bucket IN (?, ?)',
+                     (f'{RATE_COUNTER}:{key}', f'{TOKEN_COUNTER}:{key}'))
+        conn.commit()
+    limiter.rates.forget(key)
+    limiter.tokens.forget(key)
@@ -0,0 +1,215 @@
+"""
+Section-level storage for campaign and pitch results
+Campaign and pitch prompts ask for five numbered sections. split_sections()
+finds them in the result, and log_user_activity(sections=...) stores each
+one in history_sections next to the history entry. A single section can
+then be read, or regenerated with the others as compact context. A
+regenerated result is logged as a new history entry; history items never
+change after they are written.
+"""
+
+import os
+import re
+import json
+from backend.database import get_db
+from backend.prompts import (
+    CAMPAIGN_SECTIONS,
+    PITCH_SECTIONS,
+    campaign_section_prompt,
+    sales_section_prompt
+)
+
+# History action type -> section layout, input fields and the single-section prompt
+SECTIONED_ACTIONS = {
+    'campaign_generated': {
+        'sections': CAMPAIGN_SECTIONS,
+        'fields': ('product', 'audience', 'platform'),
+        'prompt': campaign_section_prompt,
+    },
+    'pitch_generated': {
+        'sections': PITCH_SECTIONS,
+        'fields': ('product', 'persona'),
+        'prompt': sales_section_prompt,
+    },
+}
+
+# Text before the first section heading
+INTRO_KEY = 'intro'
+
+# Completion cap for one regenerated section (a full result gets 2000)
+SECTION_MAX_TOKENS = int(os.getenv('SECTION_MAX_TOKENS', '600'))
+
+# Characters of each other section sent as context when regenerating one
+SECTION_CONTEXT_CHARS = 300
+
+# Headings look like "## 1. Title", "**1) Title**" or "### Title"
+_HEADING = re.compile(r'^[ \t]*(?:#{1,6}[ \t]*|\*\*[ \t]*)?(?:(\d{1,2})[ \t]*[.):][ \t]*)?(.+)$', re.MULTILINE)
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def _title_words(title):
+    return {word for word in _WORD.findall(title.lower()) if len(word) > 2}
+
+
+def _find_heading(text, position, number, title):
+    """(start, end) of a section's heading line after position, or None"""
+    words = _title_words(title)
+    marked = None
+    for match in _HEADING.finditer(text, position):
+        line = match.group(0).strip()
+        found = len(words & set(_WORD.findall(match.group(2).lower())))
+        if len(line) > 120 or found * 2 < len(words):
+            continue
+        styled = line.startswith(('#', '**')) or match.group(2).startswith('**')
+        # Plain "4. Ad copy ideas" list items inside a section need the full title
+        if match.group(1) == str(number) and (styled or found == len(words)):
+            return match.start(), match.end()
+        # An unnumbered "## Title" only counts if no numbered heading follows
+        if marked is None and not match.group(1) and styled:
+            marked = (match.start(), match.end())
+    return marked
+
+
+def split_sections(text, sections):
+    """
+    Split a result into its requested sections
+
+    Args:
+        text: Generated result
+        sections: CAMPAIGN_SECTIONS or PITCH_SECTIONS
+
+    Returns:
+        List of (key, heading, body) in order, starting with INTRO_KEY when
+        there is text before the first heading, or None if any section is
+        missing. Concatenating heading + body of every part gives back text.
+    """
+    if not text:
+        return None
+    starts = []
+    position = 0
+    for number, (key, title, _) in enumerate(sections, 1):
+        found = _find_heading(text, position, number, title)
+        if not found:
+            return None
+        starts.append((key,) + found)
+        position = found[1]
+
+    parts = []
+    if text[:starts[0][1]].strip():
+        parts.append((INTRO_KEY, '', text[:starts[0][1]]))
+    for index, (key, start, heading_end) in enumerate(starts):
+        end = starts[index + 1][1] if index + 1 < len(starts) else len(text)
+        parts.append((key, text[start:heading_end], text[heading_end:end]))
+    return parts
+
+
+def join_sections(parts):
+    return ''.join(heading + body for _, heading, body in parts)
+
+
+def section_title(heading):
+    """Display title of a heading line ('## 1. **Content Ideas**' -> 'Content Ideas')"""
+    return re.sub(r'^[#*\s]*(?:\d{1,2}\s*[.):]\s*)?', '', heading).strip(' *#:')
+
+
+def splice_section(parts, key, body):
+    """
+    Replace one section's body
+
+    Returns:
+        New parts list (the heading line is kept)
+    """
+    spliced = []
+    for part_key, heading, old_body in parts:
+        if part_key == key:
+            trailing = old_body[len(old_body.rstrip()):] or '\n\n'
+            old_body = '\n\n' + body.strip() + trailing
+        spliced.append((part_key, heading, old_body))
+    return spliced
+
+
+def strip_repeated_heading(body, heading):
+    """Drop a copy of the section heading the model may have put first anyway"""
+    first, _, rest = body.lstrip().partition('\n')
+    if first and section_title(first).lower() == section_title(heading).lower():
+        return rest
+    return body
+
+
+def store_sections(cursor, history_id, parts):
+    """Write a result's sections for a history entry (on the caller's transaction)"""
+    cursor.executemany('''
+        INSERT INTO history_sections (history_id, position, section_key, heading, body)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(history_id, position, key, heading, body) for position, (key, heading, body) in enumerate(parts)])
+
+
+def get_history_sections(user_id, history_id):
+    """
+    Get a history item with its sections
+
+    Results stored before sections existed (or that could not be split
+    then) are split on read.
+
+    Returns:
+        Dictionary with action_type, page_title, metadata and parts (list of
+        (key, heading, body), or None if the result has no sections), or
+        None if the item does not exist
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT action_type, page_title, metadata FROM user_history WHERE id = ? AND user_id = ?
+        ''', (history_id, user_id))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        cursor.execute('''
+            SELECT section_key, heading, body FROM history_sections
+            WHERE history_id = ? ORDER BY position
+        ''', (history_id,))
+        parts = [tuple(part) for part in cursor.fetchall()]
+    try:
+        metadata = json.loads(row['metadata'] or '{}')
+    except ValueError:
+        metadata = {}
+    spec = SECTIONED_ACTIONS.get(row['action_type'])
+    if not parts and spec:
+        parts = split_sections(metadata.get('result'), spec['sections'])
+    return {'action_type': row['action_type'], 'page_title': row['page_title'], 'metadata': metadata,
+            'parts': parts or None}
+
+
+def section_outline(parts):
+    """Listing of a result's sections without their bodies"""
+    return [{'key': key, 'title': section_title(heading) if heading else 'Introduction', 'chars': len(body.strip())}
+            for key, heading, body in parts]
+
+
+def section_context(parts, key):
+    """The other sections, each cut to SECTION_CONTEXT_CHARS, as prompt context"""
+    lines = []
+    for part_key, heading, body in parts:
+        if part_key in (key, INTRO_KEY):
+            continue
+        text = ' '.join(body.split())
+        if len(text) > SECTION_CONTEXT_CHARS:
+            text = text[:SECTION_CONTEXT_CHARS].rsplit(' ', 1)[0] + ' …'
+        lines.append(f'- {section_title(heading)}: {text}')
+    return '\n'.join(lines)
+
+
+def section_prompt(action_type, metadata, parts, key):
+    """
+    Prompt that regenerates one section of a stored result
+
+    Raises:
+        ValueError: the action type has no sections or the key is unknown
+    """
+    spec = SECTIONED_ACTIONS.get(action_type)
+    if not spec:
+        raise ValueError(f'{action_type} results have no sections')
+    if key not in {part_key for part_key, _, _ in parts} or key == INTRO_KEY:
+        raise ValueError(f'Unknown section: {key}')
+    values = [metadata.get(field, '') for field in spec['fields']]
+    return spec['prompt'](*values, key, section_context(parts, key))
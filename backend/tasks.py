@@ -0,0 +1,134 @@
+"""
+Post-response background tasks
+Bookkeeping (history logging, metrics, ...) that should not delay the HTTP
+response is queued with run_after_response(). Inside a request the tasks are
+handed to a small thread pool once the response has been sent; outside a
+request they are submitted straight away. Failed tasks are retried with
+exponential backoff and logged when they finally give up.
+"""
+
+import os
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, has_request_context
+
+# Worker threads per process for deferred tasks
+TASK_WORKERS = int(os.getenv('TASK_WORKERS', '2'))
+
+# Attempts per task before it is reported as failed
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', '3'))
+
+# Base delay in seconds between attempts (doubled after every failure)
+TASK_RETRY_DELAY = float(os.getenv('TASK_RETRY_DELAY', '0.5'))
+
+# Run tasks inline on the calling thread (for tests and debugging)
+TASKS_SYNC = os.getenv('TASKS_SYNC', '').lower() in ('1', 'true', 'yes')
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_pending = set()
+
+stats = {'submitted': 0, 'succeeded': 0, 'retried': 0, 'failed': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(outcome):
+    # += on a shared dict is not atomic across pool threads
+    with _stats_lock:
+        stats[outcome] += 1
+
+
+def set_sync_mode(enabled):
+    """Run deferred tasks inline (True) or on the background pool (False)"""
+    global TASKS_SYNC
+    TASKS_SYNC = enabled
+
+
+def _get_executor():
+    """Create the thread pool lazily, once per process (safe after fork)"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=TASK_WORKERS, thread_name_prefix='post-response')
+                _executor_pid = pid
+                _pending.clear()
+    return _executor
+
+
+def _run_with_retries(func, args, kwargs, name):
+    """Run a task, retrying with backoff; returns True on success"""
+    for attempt in range(1, TASK_MAX_ATTEMPTS + 1):
+        try:
+            func(*args, **kwargs)
+            _count('succeeded')
+            return True
+        except Exception as e:
+            if attempt < TASK_MAX_ATTEMPTS:
+                _count('retried')
+                print(f"Task {name} failed (attempt {attempt}/{TASK_MAX_ATTEMPTS}): {str(e)}; retrying")
+                time.sleep(TASK_RETRY_DELAY * (2 ** (attempt - 1)))
+            else:
+                _count('failed')
+                print(f"ERROR: task {name} failed after {TASK_MAX_ATTEMPTS} attempts: {str(e)}")
+                traceback.print_exc()
+    return False
+
+
+def submit(func, *args, **kwargs):
+    """Run a task on the background pool right away (inline in sync mode)"""
+    name = getattr(func, '__name__', repr(func))
+    _count('submitted')
+
+    if TASKS_SYNC:
+        _run_with_retries(func, args, kwargs, name)
+        return None
+
+    future = _get_executor().submit(_run_with_retries, func, args, kwargs, name)
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+    return future
+
+
+def run_after_response(func, *args, **kwargs):
+    """
+    Schedule a task to run once the current response has been sent
+
+    Arguments must be plain values captured now - the task runs outside the
+    request context, so it cannot read request, session or g.
+    """
+    if TASKS_SYNC or not has_request_context():
+        return submit(func, *args, **kwargs)
+
+    if 'post_response_tasks' not in g:
+        g.post_response_tasks = []
+    g.post_response_tasks.append((func, args, kwargs))
+    return None
+
+
+def init_app(app):
+    """Hand queued tasks to the pool when each response is closed"""
+
+    @app.after_request
+    def _schedule_post_response_tasks(response):
+        queued = g.pop('post_response_tasks', None)
+        if queued:
+            def _submit_all():
+                for func, args, kwargs in queued:
+                    submit(func, *args, **kwargs)
+            response.call_on_close(_submit_all)
+        return response
+
+
+def wait_for_tasks(timeout=None):
+    """Block until all submitted tasks have finished (used by tests and shutdown)"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _pending:
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,135 @@
+"""
+Simple rate limiting
+Token buckets keyed by an arbitrary string (session id, user id, ...) for
+in-process limits, and database-backed window counters for limits that
+must hold across all workers (login attempts).
+"""
+
+import threading
+import time
+from backend.database import get_db
+
+
+class TokenBucket:
+    """
+    Token bucket limiter for many keys
+
+    Each key holds up to `capacity` tokens and regains `rate` tokens per
+    second. Buckets idle long enough to be full again are discarded so the
+    table cannot grow without bound.
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._last_sweep = time.monotonic()
+
+    def take(self, key, tokens=1):
+        """
+        Take up to `tokens` tokens for key
+
+        Returns:
+            Number of tokens granted (0 when throttled)
+        """
+        now = time.monotonic()
+        with self._lock:
+            available, updated = self._buckets.get(key, (self.capacity, now))
+            available = min(self.capacity, available + (now - updated) * self.rate)
+            granted = int(min(tokens, available))
+            self._buckets[key] = (available - granted, now)
+            self._sweep(now)
+            return granted
+
+    def _sweep(self, now):
+        """Forget buckets that have refilled completely"""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        refill_time = self.capacity / self.rate if self.rate else float('inf')
+        stale = [k for k, (_, updated) in self._buckets.items() if now - updated > refill_time]
+        for key in stale:
+            del self._buckets[key]
+
+
+def sliding_window_retry_after(count, carried, limit, window, elapsed):
+    """
+    Seconds until a sliding-window count is under the limit again (0 if it is now)
+
+    Args:
+        count: Events in the current fixed window
+        carried: Previous window's count weighted by its remaining overlap
+        limit: Events allowed per sliding window
+        window: Window length in seconds
+        elapsed: Fraction of the current fixed window that has passed
+    """
+    if count + carried < limit:
+        return 0
+    if count >= limit:
+        # Wait for the window to roll over and the old events to decay
+        return int(window * (1 - elapsed)) + 1
+    # The previous window's share decays linearly over the current window
+    needed = (count + carried - limit) / (carried / (1 - elapsed)) if carried else 0
+    return int(needed * window) + 1
+
+
+class SharedWindowCounter:
+    """
+    Sliding-window event counter shared by all workers through SQLite
+
+    Events are counted in fixed windows of `window` seconds; the current
+    rate is the current window's count plus the previous window's count
+    weighted by how much of it still overlaps the sliding window.
+    """
+
+    def __init__(self, name, limit, window):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self._last_sweep = 0.0
+
+    def _windows(self, key, now):
+        bucket = f'{self.name}:{key}'
+        current = int(now // self.window)
+        return bucket, current, (now % self.window) / self.window
+
+    def _weighted(self, conn, bucket, current, elapsed):
+        rows = conn.execute('''
+            SELECT window_id, count FROM rate_limit_counters WHERE bucket = ? AND window_id IN (?, ?)
+        ''', (bucket, current - 1, current)).fetchall()
+        counts = {row['window_id']: row['count'] for row in rows}
+        return counts.get(current, 0), counts.get(current - 1, 0) * (1 - elapsed)
+
+    def retry_after(self, key):
+        """
+        Seconds until key is under the limit again (0 if it is now)
+        """
+        now = time.time()
+        bucket, current, elapsed = self._windows(key, now)
+        with get_db('rate_limit_check') as conn:
+            count, carried = self._weighted(conn, bucket, current, elapsed)
+        return sliding_window_retry_after(count, carried, self.limit, self.window, elapsed)
+
+    def hit(self, key):
+        """Record one event for key"""
+        now = time.time()
+        bucket, current, _ = self._windows(key, now)
+        with get_db('rate_limit_hit') as conn:
+            conn.execute('''
+                INSERT INTO rate_limit_counters (bucket, window_id, count) VALUES (?, ?, 1)
+                ON CONFLICT (bucket, window_id) DO UPDATE SET count = count + 1
+            ''', (bucket, current))
+            if now - self._last_sweep > 60:
+                self._last_sweep = now
+                conn.execute('''
+                    DELETE FROM rate_limit_counters WHERE bucket LIKE ? AND window_id < ?
+                ''', (f'{self.name}:%', current - 1))
+            conn.commit()
+
+    def reset(self, key):
+        """Forget all events for key"""
+        bucket = f'{self.name}:{key}'
+        with get_db('rate_limit_reset') as conn:
+            conn.execute('DELETE FROM rate_limit_counters WHERE bucket = ?', (bucket,))
+            conn.commit()
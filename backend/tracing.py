@@ -0,0 +1,294 @@
+"""
+Per-request span tracing
+Every request gets a request id (taken from an incoming X-Request-ID header
+or generated) that is returned in the response headers and added to log
+records. Database calls, LLM calls, template renders and history logging
+open spans on the current request's trace; requests slower than
+TRACE_SLOW_MS have their whole span tree appended to TRACE_LOG as one JSON
+line. Those lines can be converted to the Chrome trace event format
+(viewable in Perfetto or chrome://tracing):
+
+    python -m backend.tracing export --output slow.trace.json
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+import argparse
+from contextvars import ContextVar
+from contextlib import contextmanager
+
+# Requests slower than this many milliseconds are written to TRACE_LOG
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '2000'))
+
+# Append-only JSON lines file of slow request traces
+TRACE_LOG = os.getenv(
+    'TRACE_LOG',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs', 'slow_traces.jsonl')
+)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+_current_trace = ContextVar('marketmind_trace', default=None)
+_current_span = ContextVar('marketmind_span', default=None)
+_log_lock = threading.Lock()
+_listeners = []
+_valid_request_id = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class Trace:
+    """Spans recorded during one request"""
+
+    def __init__(self, request_id, name):
+        self.request_id = request_id
+        self.name = name
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.attrs = {}
+
+    def open_span(self, name, parent_id, attrs):
+        span = {
+            'id': len(self.spans) + 1,
+            'parent_id': parent_id,
+            'name': name,
+            'start_ms': (time.perf_counter() - self.start) * 1000,
+            'duration_ms': None,
+            'attrs': attrs,
+        }
+        self.spans.append(span)
+        return span
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+def current_request_id():
+    """Request id of the trace active in this context, or None"""
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+def start_span(name, **attrs):
+    """
+    Open a span on the active trace (no-op without one)
+
+    Returns:
+        Handle to pass to end_span()
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    parent = _current_span.get()
+    span = trace.open_span(name, parent['id'] if parent else None, attrs)
+    return span, _current_span.set(span)
+
+
+def end_span(handle, **attrs):
+    """Close a span opened with start_span()"""
+    if handle is None:
+        return
+    span, token = handle
+    trace = _current_trace.get()
+    span['duration_ms'] = (time.perf_counter() - trace.start) * 1000 - span['start_ms'] if trace else 0
+    span['attrs'].update(attrs)
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Closed from a different context (e.g. signal handlers); fall back to the parent
+        _current_span.set(None)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Record the with-block as a span on the current request's trace"""
+    handle = start_span(name, **attrs)
+    try:
+        yield
+    except Exception as e:
+        if handle is not None:
+            handle[0]['attrs']['error'] = type(e).__name__
+        raise
+    finally:
+        end_span(handle)
+
+
+def annotate_trace(**attrs):
+    """Add attributes to the current trace's record (no-op without one)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def add_trace_listener(callback):
+    """Call callback(record) with every finished trace record"""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def begin_trace(name, request_id=None):
+    """Start a trace in the current context (one per request)"""
+    if not request_id or not _valid_request_id.match(request_id):
+        request_id = uuid.uuid4().hex
+    trace = Trace(request_id, name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def finish_trace(**attrs):
+    """
+    Close the current trace and log it if it was slow
+
+    Returns:
+        The finished trace record (dict) or None without an active trace
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    _current_trace.set(None)
+    _current_span.set(None)
+
+    record = {
+        'request_id': trace.request_id,
+        'name': trace.name,
+        'timestamp': trace.wall_start,
+        'duration_ms': round(trace.elapsed_ms(), 3),
+        'attrs': dict(trace.attrs, **attrs),
+        'spans': trace.spans,
+    }
+    if record['duration_ms'] >= TRACE_SLOW_MS:
+        write_slow_trace(record)
+    for callback in _listeners:
+        try:
+            callback(record)
+        except Exception as e:
+            print(f"Trace listener error: {str(e)}")
+    return record
+
+
+def write_slow_trace(record):
+    """Append a trace record to TRACE_LOG"""
+    try:
+        os.makedirs(os.path.dirname(TRACE_LOG), exist_ok=True)
+        line = json.dumps(record, default=str)
+        with _log_lock:
+            with open(TRACE_LOG, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+    except Exception as e:
+        print(f"Trace log error: {str(e)}")
+
+
+def read_slow_traces(path=None, request_id=None):
+    """Read trace records from a trace log (optionally one request id)"""
+    records = []
+    with open(path or TRACE_LOG, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if request_id is None or record['request_id'] == request_id:
+                records.append(record)
+    return records
+
+
+def to_chrome_trace(records):
+    """
+    Convert trace records to the Chrome trace event format
+
+    Each request becomes its own thread row so concurrent slow requests can
+    be compared side by side.
+    """
+    events = []
+    for tid, record in enumerate(records, start=1):
+        base_us = record['timestamp'] * 1_000_000
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                       'args': {'name': f"{record['name']} {record['request_id']}"}})
+        events.append({'name': record['name'], 'cat': 'request', 'ph': 'X', 'pid': 1, 'tid': tid,
+                       'ts': base_us, 'dur': record['duration_ms'] * 1000,
+                       'args': dict(record.get('attrs', {}), request_id=record['request_id'])})
+        for s in record['spans']:
+            events.append({'name': s['name'], 'cat': s['name'].split('.', 1)[0], 'ph': 'X',
+                           'pid': 1, 'tid': tid, 'ts': base_us + s['start_ms'] * 1000,
+                           'dur': (s['duration_ms'] or 0) * 1000, 'args': s['attrs']})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+# ==================== FLASK INTEGRATION ====================
+
+class RequestIdFilter(logging.Filter):
+    """Adds request_id to log records ('-' outside a request)"""
+
+    def filter(self, record):
+        record.request_id = current_request_id() or '-'
+        return True
+
+
+def init_app(app):
+    """Trace every request and expose its id in headers and logs"""
+    from flask import g, request
+    from flask import before_render_template, template_rendered
+    from flask.logging import default_handler
+
+    default_handler.addFilter(RequestIdFilter())
+    default_handler.setFormatter(logging.Formatter(
+        '[%(asctime)s] %(levelname)s [%(request_id)s] %(module)s: %(message)s'))
+
+    @app.before_request
+    def _trace_begin():
+        trace = begin_trace(f'{request.method} {request.path}', request.headers.get(REQUEST_ID_HEADER))
+        g.request_id = trace.request_id
+
+    @app.after_request
+    def _trace_request_id_header(response):
+        if 'request_id' in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+            g.trace_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _trace_finish(exc):
+        record = finish_trace(
+            endpoint=request.endpoint,
+            status=g.get('trace_status', 500),
+            error=type(exc).__name__ if exc else None,
+        )
+        if record and record['duration_ms'] >= TRACE_SLOW_MS:
+            app.logger.warning('Slow request %s took %.0f ms (trace written to %s)',
+                               record['name'], record['duration_ms'], TRACE_LOG)
+
+    def _template_started(sender, template, context, **extra):
+        g.setdefault('trace_template_spans', []).append(
+            start_span('template.render', template=template.name))
+
+    def _template_finished(sender, template, context, **extra):
+        handles = g.get('trace_template_spans')
+        if handles:
+            end_span(handles.pop())
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export slow request traces')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='Convert the trace log to Chrome trace event JSON')
+    export.add_argument('--input', default=TRACE_LOG)
+    export.add_argument('--output', default='slow_traces.trace.json')
+    export.add_argument('--request-id')
+    args = parser.parse_args()
+
+    records = read_slow_traces(args.input, args.request_id)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(to_chrome_trace(records), f)
+    print(f"Exported {len(records)} trace(s) to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Page visit tracking
+Counts visits in memory per (visitor, page, minute) and flushes them to the
+database as aggregate rows from a background thread, so rendering a page
+never waits on a database write. A configurable sample of raw visits is
+also kept as individual 'visit' rows in user_history.
+"""
+
+import os
+import random
+import threading
+import time
+import json
+import atexit
+from datetime import datetime
+from backend.database import get_db
+
+# Seconds between background flushes of the in-memory counters
+VISIT_FLUSH_INTERVAL = float(os.getenv('VISIT_FLUSH_INTERVAL', '30'))
+
+# Fraction (0.0 - 1.0) of logged-in visits also stored as raw history rows
+VISIT_SAMPLE_RATE = float(os.getenv('VISIT_SAMPLE_RATE', '0.0'))
+
+# Upper bound on buffered raw visit events between flushes
+VISIT_MAX_SAMPLES = int(os.getenv('VISIT_MAX_SAMPLES', '1000'))
+
+
+class VisitTracker:
+    """In-memory visit counter with periodic aggregate flushes"""
+
+    def __init__(self, flush_interval=VISIT_FLUSH_INTERVAL, sample_rate=VISIT_SAMPLE_RATE,
+                 max_samples=VISIT_MAX_SAMPLES):
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._samples = []
+        self._thread = None
+        self._pid = None
+
+    def record(self, page_url, page_title, user_id=None, session_id=None,
+               ip_address=None, user_agent=None):
+        """
+        Count a page visit (no database I/O)
+
+        Args:
+            page_url: URL of the page
+            page_title: Title of the page
+            user_id: Logged-in user ID, if any
+            session_id: Anonymous session identifier, used when not logged in
+            ip_address: Visitor IP, only kept for sampled raw events
+            user_agent: Visitor user agent, only kept for sampled raw events
+        """
+        minute = datetime.utcnow().strftime('%Y-%m-%dT%H:%M')
+        key = (user_id or 0, '' if user_id else (session_id or ''), page_url, minute)
+        sampled = bool(user_id) and self.sample_rate > 0 and random.random() < self.sample_rate
+
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if sampled and len(self._samples) < self.max_samples:
+                self._samples.append((
+                    user_id, page_url, page_title, 'visit',
+                    json.dumps({'sampled': True, 'sample_rate': self.sample_rate}),
+                    datetime.utcnow().isoformat(), ip_address, user_agent
+                ))
+
+        self._ensure_flusher()
+
+    def flush(self):
+        """
+        Write buffered counters and sampled events to the database
+
+        Returns:
+            Number of aggregate rows written
+        """
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            samples, self._samples = self._samples, []
+
+        if not counts and not samples:
+            return 0
+
+        try:
+            with get_db() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO page_visit_counts (user_id, session_id, page_url, minute, visit_count)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, session_id, page_url, minute)
+                    DO UPDATE SET visit_count = visit_count + excluded.visit_count
+                ''', [key + (count,) for key, count in counts.items()])
+                if samples:
+                    cursor.executemany('''
+                        INSERT INTO user_history
+                        (user_id, page_url, page_title, action_type, metadata, timestamp, ip_address, user_agent)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', samples)
+                conn.commit()
+            return len(counts)
+        except Exception as e:
+            print(f"Visit flush error: {str(e)}")
+            # Put the counts and samples back so the next flush retries them
+            with self._lock:
+                for key, count in counts.items():
+                    self._counts[key] = self._counts.get(key, 0) + count
+                self._samples = (samples + self._samples)[:self.max_samples]
+            return 0
+
+    def _ensure_flusher(self):
+        """Start the background flush thread once per process (safe after fork)"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='visit-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+tracker = VisitTracker()
+atexit.register(tracker.flush)
+
+
+def record_visit(page_url, page_title, user_id=None, session_id=None, ip_address=None, user_agent=None):
+    """Count a page visit on the shared tracker"""
+    tracker.record(page_url, page_title, user_id=user_id, session_id=session_id,
+                   ip_address=ip_address, user_agent=user_agent)
+
+
+def flush_visits():
+    """Flush the shared tracker immediately"""
+    return tracker.flush()
+
+
+def get_page_visit_counts(user_id, since=None):
+    """
+    Get a user's aggregated visit counts per page
+
+    Args:
+        user_id: User ID
+        since: Optional datetime; only count minutes at or after it
+
+    Returns:
+        Dict of page_url -> visit count
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if since:
+            cursor.execute('''
+                SELECT page_url, SUM(visit_count) AS visits FROM page_visit_counts
+                WHERE user_id = ? AND minute >= ?
+                GROUP BY page_url
+            ''', (user_id, since.strftime('%Y-%m-%dT%H:%M')))
+        else:
+            cursor.execute('''
+                SELECT page_url, SUM(visit_count) AS visits FROM page_visit_counts
+                WHERE user_id = ?
+                GROUP BY page_url
+            ''', (user_id,))
+        return {row['page_url']: row['visits'] for row in cursor.fetchall()}
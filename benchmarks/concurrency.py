@@ -0,0 +1,176 @@
+"""
+Concurrent generation benchmark: sync workers vs. the async serving mode
+Starts the fake Groq server in its own process. Then, one at a time, it
+starts a single-process gunicorn gthread server (app:app) and a
+single-process uvicorn server (asgi:app), and sends each the same burst of
+concurrent /api/generate-pitch requests. Reports how many LLM calls were in
+flight at once, the wall time for the burst, and the server's peak resident
+memory:
+
+    python -m benchmarks.concurrency --requests 200 --latency 1 --threads 8
+
+Both servers run one process, so memory is comparable.
+"""
+
+import os
+import sys
+import time
+import json
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from benchmarks.startup import ROOT
+
+SECRET_KEY = 'benchmark-secret'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_kb(pid):
+    """Peak resident memory (VmHWM) of a process and its children, in KiB"""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return total
+
+
+def _session_cookie(database_path):
+    """Create a benchmark user and a signed session cookie for it (in a child interpreter)"""
+    script = (
+        'import app\n'
+        'from backend.database import create_user\n'
+        'user_id = create_user("Bench", "bench@example.com", "x")\n'
+        'serializer = app.app.session_interface.get_signing_serializer(app.app)\n'
+        'print(app.app.config["SESSION_COOKIE_NAME"] + "=" + serializer.dumps({"logged_in_user_id": user_id}))\n'
+    )
+    env = dict(os.environ, DATABASE_PATH=database_path, SECRET_KEY=SECRET_KEY)
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True,
+                            text=True, env=env, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server did not start on port {port}')
+
+
+def _fake_groq_stats(base_url, reset=False):
+    import httpx
+    if reset:
+        return httpx.post(f'{base_url}/reset').json()
+    return httpx.get(f'{base_url}/stats').json()
+
+
+async def _burst(port, cookie, count):
+    import httpx
+    limits = httpx.Limits(max_connections=count, max_keepalive_connections=count)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=600,
+                                 headers={'Cookie': cookie}) as client:
+        async def one():
+            try:
+                resp = await client.post('/api/generate-pitch', json={'product': 'Widget', 'persona': 'CTO'})
+                return resp.status_code
+            except Exception:
+                return 'error'
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*[one() for _ in range(count)])
+        return time.perf_counter() - start, statuses
+
+
+def run_mode(mode, fake_url, cookie, database_path, requests, threads):
+    """
+    Serve one burst with the given mode ('sync' or 'async')
+
+    Returns:
+        Dict with peak_in_flight, wall_s, ok, failed and peak_rss_mb
+    """
+    port = free_port()
+    if mode == 'sync':
+        command = [sys.executable, '-m', 'gunicorn', '-w', '1', '-k', 'gthread', '--threads', str(threads),
+                   '--timeout', '600', '-b', f'127.0.0.1:{port}', 'app:app']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', '--workers', '1', '--no-access-log',
+                   '--host', '127.0.0.1', '--port', str(port), 'asgi:app']
+    env = dict(os.environ, DATABASE_PATH=database_path, SECRET_KEY=SECRET_KEY, GROQ_API_KEY='benchmark',
+               GROQ_BASE_URL=fake_url, OUTBOX_AUTOSTART='false')
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        _fake_groq_stats(fake_url, reset=True)
+        wall, statuses = asyncio.run(_burst(port, cookie, requests))
+        return {
+            'mode': mode,
+            'peak_in_flight': _fake_groq_stats(fake_url)['peak_in_flight'],
+            'wall_s': round(wall, 2),
+            'ok': statuses.count(200),
+            'failed': len(statuses) - statuses.count(200),
+            'peak_rss_mb': round(peak_rss_kb(server.pid) / 1024, 1),
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare in-flight LLM capacity of sync and async serving')
+    parser.add_argument('--requests', type=int, default=200, help='Concurrent generation requests')
+    parser.add_argument('--latency', type=float, default=1.0, help='Fake Groq seconds per completion')
+    parser.add_argument('--threads', type=int, default=8, help='gthread threads for the sync server')
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    fake_port = free_port()
+    fake = subprocess.Popen([sys.executable, '-m', 'benchmarks.fake_groq', '--port', str(fake_port),
+                             '--latency', str(args.latency)], cwd=ROOT, stdout=subprocess.DEVNULL)
+    results = []
+    try:
+        wait_for_port(fake_port)
+        with tempfile.TemporaryDirectory() as tmp:
+            database_path = os.path.join(tmp, 'concurrency.db')
+            cookie = _session_cookie(database_path)
+            for mode in args.modes.split(','):
+                results.append(run_mode(mode, f'http://127.0.0.1:{fake_port}', cookie, database_path,
+                                        args.requests, args.threads))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.requests} concurrent requests, {args.latency}s fake LLM latency, one server process\n")
+    print(f"{'mode':<8}{'in flight':>10}{'wall s':>9}{'ok':>6}{'failed':>8}{'peak RSS MB':>13}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['peak_in_flight']:>10}{r['wall_s']:>9}{r['ok']:>6}{r['failed']:>8}{r['peak_rss_mb']:>13}")
+
+
+if __name__ == '__main__':
+    main()
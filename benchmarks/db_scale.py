@@ -0,0 +1,489 @@
+"""
+Database and history layer benchmarks at scale
+Generates synthetic databases with N user_history rows, then times the
+history and user functions on each one. The data has realistic users,
+page visits, clicks and generation rows with multi-KB results, plus the
+legacy campaign/pitch/lead tables. Reports p50/p95 latency, rows per
+second and peak resident memory per operation and size. With a baseline,
+the run fails when an operation gets slower than the allowed regression:
+
+    python -m benchmarks.db_scale run --sizes 10k,100k,1M --output results/db-HEAD.json
+    python -m benchmarks.db_scale run --sizes 10k,100k --baseline results/db-main.json --max-regression 0.3
+    python -m benchmarks.db_scale generate --rows 10M --db /data/history-10M.db
+
+Generated databases are kept in --data-dir (a temporary directory by
+default) and reused by later runs. Each operation runs in a fresh
+interpreter, so its peak memory is its own.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import resource
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+from benchmarks.startup import ROOT
+
+DEFAULT_SIZES = '10k,100k,1M'
+
+# Bumped when generated data changes shape; older files are regenerated
+DATA_VERSION = 2
+
+# Fail a run when an operation's p50 grows by more than this fraction over the baseline
+MAX_REGRESSION = float(os.getenv('DB_BENCH_MAX_REGRESSION', '0.3'))
+
+# Smaller differences are noise, whatever the ratio
+MIN_DELTA_MS = float(os.getenv('DB_BENCH_MIN_DELTA_MS', '1.0'))
+MIN_DELTA_RSS_MB = 5.0
+
+# Average history rows per user
+ROWS_PER_USER = 200
+
+# Days of history spread over the generated rows
+HISTORY_DAYS = 180
+
+# Fraction of history rows that are generations carrying a full result
+GENERATION_SHARE = 0.1
+
+# Legacy campaign/pitch/lead rows, as a fraction of history rows
+LEGACY_SHARE = 0.05
+
+# Operation -> (default repeats, whether it modifies the data)
+OPERATIONS = {
+    'log_user_activity': (200, True),
+    'get_user_history': (100, False),
+    'get_grouped_user_history': (50, False),
+    'get_user_by_email': (500, False),
+    'get_grouped_history': (3, False),
+    'get_top_leads': (100, False),
+    'delete_old_history': (50, True),
+}
+
+PAGES = [('/', 'Home'), ('/campaign', 'Campaign Generator'), ('/pitch', 'Pitch Generator'),
+         ('/lead-score', 'Lead Scorer'), ('/history', 'History')]
+
+
+def _lead_scores(rng):
+    from backend.leads import validate_lead_score
+    return validate_lead_score({'score': rng.randint(0, 100), 'conversion_probability': rng.randint(0, 100),
+                                'budget': rng.randint(0, 100), 'authority': rng.randint(0, 100),
+                                'need': rng.randint(0, 100), 'urgency': rng.randint(0, 100)})
+
+
+GENERATIONS = [
+    ('/campaign', 'Campaign Generator', 'campaign_generated',
+     lambda rng: {'product': f'Product {rng.randint(1, 500)}', 'audience': rng.choice(['SMBs', 'CTOs', 'Students']),
+                  'platform': rng.choice(['LinkedIn', 'Twitter', 'Email'])}),
+    ('/pitch', 'Pitch Generator', 'pitch_generated',
+     lambda rng: {'product': f'Product {rng.randint(1, 500)}', 'persona': rng.choice(['CFO', 'Founder', 'Buyer'])}),
+    ('/lead-score', 'Lead Scorer', 'lead_scored',
+     lambda rng: {'name': f'Lead {rng.randint(1, 5000)}', 'budget': '$50k', 'need': 'Automation',
+                  'urgency': rng.choice(['Low', 'Medium', 'High']), 'scores': _lead_scores(rng)}),
+]
+
+# One precomputed hash: hashing millions of passwords would dominate generation
+PASSWORD_HASH = 'scrypt:32768:8:1$benchmark$' + '0' * 128
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36'
+
+_LOREM = ('Our analysis shows strong product-market fit in the mid-market segment. Focus the campaign on '
+          'measurable outcomes, a clear call to action and social proof from similar customers. ').split()
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1M' -> 1000000"""
+    text = text.strip()
+    multiplier = {'k': 1_000, 'K': 1_000, 'm': 1_000_000, 'M': 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if multiplier > 1 else text) * multiplier)
+
+
+def format_size(rows):
+    for suffix, unit in (('M', 1_000_000), ('k', 1_000)):
+        if rows >= unit and rows % unit == 0:
+            return f'{rows // unit}{suffix}'
+    return str(rows)
+
+
+# ==================== DATA GENERATION ====================
+
+def _results(rng, count=64):
+    """A pool of multi-KB generation results (reused; SQLite stores each copy)"""
+    texts = []
+    for _ in range(count):
+        paragraphs = []
+        for _ in range(rng.randint(4, 12)):
+            paragraphs.append(' '.join(rng.choice(_LOREM) for _ in range(rng.randint(40, 90))))
+        texts.append('\n\n'.join(paragraphs))
+    return texts
+
+
+def _history_rows(rng, rows, users, start, results):
+    """Yield user_history tuples in time order, users drawn with a Zipf-like skew"""
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, users + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+    user_ids = list(range(1, users + 1))
+    step = HISTORY_DAYS * 86400 / max(rows, 1)
+
+    batch = 10_000
+    for offset in range(0, rows, batch):
+        chosen = rng.choices(user_ids, cum_weights=cum_weights, k=min(batch, rows - offset))
+        for i, user_id in enumerate(chosen):
+            timestamp = (start + timedelta(seconds=(offset + i) * step)).isoformat()
+            roll = rng.random()
+            if roll < GENERATION_SHARE:
+                url, title, action, fields = rng.choice(GENERATIONS)
+                metadata = json.dumps(dict(fields(rng), result=rng.choice(results)))
+            elif roll < 0.55:
+                url, title = rng.choice(PAGES)
+                action, metadata = 'visit', None
+            elif roll < 0.95:
+                url, title = rng.choice(PAGES)
+                action = rng.choice(['click', 'click', 'form_input', 'submit', 'search'])
+                metadata = json.dumps({'element': 'button', 'text': 'Generate'})
+            else:
+                url, title, action, metadata = '/login', 'User Login', 'login', None
+            yield (user_id, url, title, action, metadata, timestamp, '10.0.0.1', USER_AGENT)
+
+
+def generate(path, rows, seed=0):
+    """
+    Create a database with `rows` user_history rows (plus users and legacy tables)
+
+    Triggers and indexes on user_history are dropped for the bulk load and
+    recreated afterwards by init_database(), which is much faster than
+    maintaining them row by row.
+
+    Returns:
+        Seconds taken
+    """
+    from backend import database
+
+    start_time = time.perf_counter()
+    if os.path.exists(path):
+        os.remove(path)
+    database.DATABASE_PATH = path
+    database.init_database()
+
+    rng = random.Random(seed)
+    users = max(10, rows // ROWS_PER_USER)
+    now = datetime.utcnow()
+    results = _results(rng)
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    dropped = conn.execute('''
+        SELECT type, name FROM sqlite_master
+        WHERE tbl_name = 'user_history' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    ''').fetchall()
+    for kind, name in dropped:
+        conn.execute(f'DROP {kind.upper()} {name}')
+
+    created = now.isoformat()
+    conn.executemany(
+        'INSERT INTO users (id, name, email, password_hash, is_verified, created_at, updated_at) '
+        'VALUES (?, ?, ?, ?, 1, ?, ?)',
+        ((i, f'User {i}', f'user{i}@example.com', PASSWORD_HASH, created, created)
+         for i in range(1, users + 1)))
+
+    insert = ('INSERT INTO user_history (user_id, page_url, page_title, action_type, metadata, timestamp, '
+              'ip_address, user_agent) VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+    conn.executemany(insert, _history_rows(rng, rows, users, now - timedelta(days=HISTORY_DAYS), results))
+    conn.execute('''
+        INSERT INTO history_versions (user_id, version)
+        SELECT user_id, COUNT(*) FROM user_history GROUP BY user_id
+    ''')
+
+    # Legacy tables read by get_grouped_history(); older databases still carry them
+    legacy = max(3, int(rows * LEGACY_SHARE)) // 3
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS campaign_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, product TEXT, audience TEXT, platform TEXT,
+            result TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE IF NOT EXISTS pitch_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, product TEXT, persona TEXT,
+            result TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE IF NOT EXISTS lead_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, budget TEXT, need TEXT, urgency TEXT,
+            result TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+    ''')
+
+    def legacy_time(i):
+        return (now - timedelta(days=HISTORY_DAYS * i / legacy)).strftime('%Y-%m-%d %H:%M:%S')
+
+    conn.executemany('INSERT INTO campaign_history (product, audience, platform, result, timestamp) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     ((f'Product {i}', 'SMBs', 'LinkedIn', rng.choice(results), legacy_time(i)) for i in range(legacy)))
+    conn.executemany('INSERT INTO pitch_history (product, persona, result, timestamp) VALUES (?, ?, ?, ?)',
+                     ((f'Product {i}', 'CFO', rng.choice(results), legacy_time(i)) for i in range(legacy)))
+    conn.executemany('INSERT INTO lead_history (name, budget, need, urgency, result, timestamp) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     ((f'Lead {i}', '$50k', 'CRM', 'High', rng.choice(results), legacy_time(i)) for i in range(legacy)))
+
+    conn.execute('CREATE TABLE bench_meta (key TEXT PRIMARY KEY, value TEXT)')
+    conn.executemany('INSERT INTO bench_meta VALUES (?, ?)', [
+        ('rows', str(rows)), ('users', str(users)), ('seed', str(seed)), ('version', str(DATA_VERSION))])
+    conn.commit()
+    conn.close()
+
+    # Recreate the dropped indexes and triggers, then gather planner statistics
+    database.init_database()
+    conn = sqlite3.connect(path)
+    conn.execute('ANALYZE')
+    conn.close()
+    return time.perf_counter() - start_time
+
+
+def _meta(path):
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            return dict(conn.execute('SELECT key, value FROM bench_meta').fetchall())
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return {}
+
+
+def ensure_database(data_dir, rows, seed=0):
+    """
+    Path of a generated database with `rows` rows, generating it if missing
+
+    Returns:
+        (path, seconds spent generating or 0.0 if reused)
+    """
+    path = os.path.join(data_dir, f'history-{format_size(rows)}.db')
+    meta = _meta(path)
+    if meta.get('rows') == str(rows) and meta.get('seed') == str(seed) and meta.get('version') == str(DATA_VERSION):
+        return path, 0.0
+    os.makedirs(data_dir, exist_ok=True)
+    return path, generate(path, rows, seed)
+
+
+# ==================== MEASUREMENT ====================
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def measure(path, operation, repeat=None, seed=0):
+    """
+    Time one operation against a generated database (call in a fresh process)
+
+    Returns:
+        Dict with runs, p50_ms, p95_ms, mean_ms, rows_per_s and peak_rss_mb
+    """
+    from backend import database, history
+
+    database.DATABASE_PATH = path
+    meta = _meta(path)
+    users = int(meta['users'])
+    repeat = repeat or OPERATIONS[operation][0]
+    rng = random.Random(seed)
+
+    # Users by activity rank: user 1 is the heaviest (Zipf), so sample across the range
+    def some_user():
+        return rng.randint(1, users)
+
+    if operation == 'log_user_activity':
+        def call():
+            history.log_user_activity(some_user(), '/campaign', 'Campaign Generator', 'click',
+                                      {'element': 'button', 'text': 'Generate'}, '10.0.0.1', USER_AGENT)
+            return 1
+    elif operation == 'get_user_history':
+        def call():
+            return len(history.get_user_history(some_user(), limit=100))
+    elif operation == 'get_grouped_user_history':
+        def call():
+            return sum(len(group) for group in history.get_grouped_user_history(some_user()).values())
+    elif operation == 'get_user_by_email':
+        def call():
+            return 1 if database.get_user_by_email(f'user{some_user()}@example.com') else 0
+    elif operation == 'get_grouped_history':
+        def call():
+            return sum(len(group) for group in database.get_grouped_history().values())
+    elif operation == 'get_top_leads':
+        from backend import leads
+
+        def call():
+            return len(leads.get_top_leads(some_user(), limit=20)['items'])
+    elif operation == 'delete_old_history':
+        conn = sqlite3.connect(path)
+        # Stored columns only (table_info leaves out the generated metadata columns)
+        columns = ', '.join(row[1] for row in conn.execute('PRAGMA table_info(user_history)'))
+        deleted = []
+
+        def call():
+            user_id = some_user()
+            # Keep what is about to be deleted (a superset, by a second) so it can be restored
+            cutoff = (datetime.utcnow() + timedelta(seconds=1) - timedelta(days=30)).isoformat()
+            deleted.extend(conn.execute(
+                f'SELECT {columns} FROM user_history WHERE user_id = ? AND timestamp < ?', (user_id, cutoff)).fetchall())
+            start = time.perf_counter()
+            count = history.delete_old_history(user_id, days=30)
+            return count, time.perf_counter() - start
+    else:
+        raise ValueError(f'Unknown operation: {operation}')
+
+    # One untimed call warms the page cache and imports; data-changing calls are not repeated
+    if not OPERATIONS[operation][1]:
+        call()
+
+    timings, rows = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = call()
+        if isinstance(count, tuple):
+            count, elapsed = count
+        else:
+            elapsed = time.perf_counter() - start
+        rows += count
+        timings.append(elapsed)
+
+    if operation == 'delete_old_history':
+        # Put the pruned rows back (same ids) so the database can be reused
+        placeholders = ', '.join('?' * len(columns.split(', ')))
+        conn.executemany(f'INSERT OR IGNORE INTO user_history ({columns}) VALUES ({placeholders})', deleted)
+        conn.commit()
+        conn.close()
+
+    total = sum(timings)
+    timings_ms = sorted(t * 1000 for t in timings)
+    return {
+        'runs': repeat,
+        'p50_ms': round(statistics.median(timings_ms), 3),
+        'p95_ms': round(timings_ms[max(0, -(-len(timings_ms) * 95 // 100) - 1)], 3),
+        'mean_ms': round(total * 1000 / repeat, 3),
+        'rows_per_s': round(rows / total) if total else 0,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _measure_in_child(path, operation, repeat, seed):
+    command = [sys.executable, '-m', 'benchmarks.db_scale', 'measure', '--db', path, '--op', operation,
+               '--seed', str(seed)]
+    if repeat:
+        command += ['--repeat', str(repeat)]
+    env = dict(os.environ, DATABASE_PATH=path)
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(sizes, operations=None, data_dir=None, repeat=None, seed=0, progress=print):
+    """
+    Generate (or reuse) a database per size and measure every operation on it
+
+    Data-changing operations run last, so reads see the generated data.
+
+    Returns:
+        Result document: {'sizes': {'10k': {operation: stats}}, 'generate_s': {...}, ...}
+    """
+    operations = operations or list(OPERATIONS)
+    operations = sorted(operations, key=lambda op: OPERATIONS[op][1])
+    data_dir = data_dir or tempfile.mkdtemp(prefix='db-bench-')
+    result = {'sizes': {}, 'generate_s': {}, 'sqlite_version': sqlite3.sqlite_version,
+              'started_at': datetime.utcnow().isoformat(timespec='seconds')}
+    for rows in sizes:
+        label = format_size(rows)
+        path, generate_s = ensure_database(data_dir, rows, seed)
+        result['generate_s'][label] = round(generate_s, 2)
+        progress(f'{label}: database ready ({generate_s:.1f}s generating)')
+        result['sizes'][label] = {}
+        for operation in operations:
+            stats = _measure_in_child(path, operation, repeat, seed)
+            result['sizes'][label][operation] = stats
+            progress(f"{label:>6} {operation:<26} p50 {stats['p50_ms']:>9.3f} ms  p95 {stats['p95_ms']:>9.3f} ms  "
+                     f"{stats['rows_per_s']:>10} rows/s  {stats['peak_rss_mb']:>7} MB")
+    return result
+
+
+def find_regressions(baseline, current, max_regression=MAX_REGRESSION, min_delta_ms=MIN_DELTA_MS):
+    """
+    Operations that got slower (p50) or bigger (peak RSS) than the baseline allows
+
+    Returns:
+        List of human-readable regression descriptions (empty if none)
+    """
+    regressions = []
+    for size, operations in current['sizes'].items():
+        for operation, stats in operations.items():
+            before = baseline.get('sizes', {}).get(size, {}).get(operation)
+            if not before:
+                continue
+            for key, min_delta in (('p50_ms', min_delta_ms), ('peak_rss_mb', MIN_DELTA_RSS_MB)):
+                old, new = before[key], stats[key]
+                if new > old * (1 + max_regression) and new - old > min_delta:
+                    regressions.append(f'{size} {operation}: {key} {old} -> {new} '
+                                       f'(+{(new - old) / old * 100:.0f}%, limit +{max_regression * 100:.0f}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Database and history layer benchmarks at scale')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='Measure every operation at several table sizes')
+    run_parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated row counts (10k,1M,...)')
+    run_parser.add_argument('--ops', default=','.join(OPERATIONS), help='Comma-separated operations')
+    run_parser.add_argument('--repeat', type=int, default=None, help='Calls per operation (default per operation)')
+    run_parser.add_argument('--data-dir', default=None, help='Where generated databases are kept and reused')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', help='Write the result JSON here')
+    run_parser.add_argument('--baseline', help='Fail when slower than this earlier result file')
+    run_parser.add_argument('--max-regression', type=float, default=MAX_REGRESSION,
+                            help='Allowed fractional growth of p50 and peak RSS over the baseline')
+
+    generate_parser = sub.add_parser('generate', help='Generate one synthetic database')
+    generate_parser.add_argument('--rows', required=True, help='History rows (10k, 1M, ...)')
+    generate_parser.add_argument('--db', required=True)
+    generate_parser.add_argument('--seed', type=int, default=0)
+
+    measure_parser = sub.add_parser('measure', help='Time one operation (used by run, in a fresh process)')
+    measure_parser.add_argument('--db', required=True)
+    measure_parser.add_argument('--op', required=True, choices=list(OPERATIONS))
+    measure_parser.add_argument('--repeat', type=int, default=None)
+    measure_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        rows = parse_size(args.rows)
+        seconds = generate(args.db, rows, args.seed)
+        print(f'{rows} rows in {seconds:.1f}s ({rows / seconds:.0f} rows/s), '
+              f'{os.path.getsize(args.db) / 1024 / 1024:.0f} MB')
+        return
+    if args.command == 'measure':
+        print(json.dumps(measure(args.db, args.op, args.repeat, args.seed)))
+        return
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    result = run(sizes, args.ops.split(','), args.data_dir, args.repeat, args.seed)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(baseline, result, args.max_regression)
+        if regressions:
+            print('\nRegressions over the baseline:')
+            for line in regressions:
+                print(f'  {line}')
+            sys.exit(1)
+        print('\nNo regressions over the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Fake Groq API for benchmarks
+A small asyncio HTTP server that answers the OpenAI-compatible chat
+completions endpoint after a simulated delay, so load tests measure our own
+serving capacity instead of Groq's. It counts requests in flight and the
+peak concurrency it has seen:
+
+    python -m benchmarks.fake_groq --port 8900 --latency 1.5
+    python -m benchmarks.fake_groq --latency lognormal:0.4,0.5 --completion-tokens 400 \
+        --token-rate 800 --error-rate 0.02
+    GROQ_API_KEY=fake GROQ_BASE_URL=http://127.0.0.1:8900 gunicorn app:app
+
+The latency is a number of seconds or a distribution (see sample_latency).
+Streaming the completion adds completion_tokens / token_rate seconds.
+With error_rate set, that fraction of calls fails with a 429, 500 or 503.
+
+With --replay, prompts carrying a [[replay:<prompt hash>]] marker (see
+benchmarks/replay.py) are answered after the latency and with the
+completion length recorded for that hash in a traffic capture:
+
+    python -m benchmarks.fake_groq --replay logs/traffic.jsonl
+
+GET /stats returns the counters, POST /reset clears them.
+"""
+
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+
+# Status codes for injected errors (the Groq SDK retries all of them)
+ERROR_STATUSES = (429, 500, 503)
+
+_REASONS = {200: 'OK', 404: 'Not Found', 429: 'Too Many Requests', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+
+def sample_latency(spec, rng=random):
+    """
+    Draw one latency in seconds
+
+    Args:
+        spec: seconds (1.5) or a distribution: 'fixed:1.5', 'uniform:0.5,2',
+              'exponential:1' (mean), 'lognormal:1,0.5' (median, sigma)
+        rng: random.Random to draw from
+    """
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    kind, _, params = str(spec).partition(':')
+    if not params:
+        return float(kind)
+    values = [float(v) for v in params.split(',')]
+    if kind == 'fixed':
+        return values[0]
+    if kind == 'uniform':
+        return rng.uniform(values[0], values[1])
+    if kind == 'exponential':
+        return rng.expovariate(1 / values[0])
+    if kind == 'lognormal':
+        return values[0] * rng.lognormvariate(0, values[1])
+    raise ValueError(f'Unknown latency distribution: {spec}')
+
+COMPLETIONS_PATH = '/openai/v1/chat/completions'
+
+REPLAY_MARKER = re.compile(rb'\[\[replay:([0-9a-f]+)\]\]')
+
+
+def replay_plan(entries):
+    """
+    Recorded LLM calls of a traffic capture, keyed by prompt hash
+
+    Returns:
+        {prompt_hash: [(latency_s, completion_tokens), ...]} in capture order
+    """
+    plan = {}
+    for entry in entries:
+        for call in entry.get('l', []):
+            if call.get('h') and call.get('ok'):
+                plan.setdefault(call['h'], []).append((call.get('d', 0) / 1000, call.get('ct', 0)))
+    return plan
+
+
+def filler_text(tokens):
+    """A completion roughly `tokens` tokens long"""
+    return ' '.join(['Fake completion.'] + ['lorem'] * max(tokens - 3, 0))
+
+
+class FakeGroqServer:
+    """Simulated chat completions server (run() blocks; start() runs it on a thread)"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=1.0, completion='Fake completion.',
+                 completion_tokens=50, token_rate=0, error_rate=0.0, seed=None, replay=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.completion = completion
+        self.completion_tokens = completion_tokens
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.replay = replay or {}
+        self._replay_calls = {}
+        self.stats = {}
+        self.reset()
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+
+    def reset(self):
+        self.stats = {'requests': 0, 'completed': 0, 'cancelled': 0, 'errors': 0, 'in_flight': 0,
+                      'peak_in_flight': 0, 'replayed': 0}
+        self._replay_calls = {}
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def _replayed(self, request_body):
+        """(latency_s, completion_tokens) recorded for the prompt's replay marker, or None"""
+        match = REPLAY_MARKER.search(request_body)
+        calls = self.replay.get(match.group(1).decode()) if match else None
+        if not calls:
+            return None
+        # Repeats of a prompt cycle through its recorded calls
+        index = self._replay_calls.get(match.group(1), 0)
+        self._replay_calls[match.group(1)] = index + 1
+        return calls[index % len(calls)]
+
+    def _completion_body(self, completion=None, completion_tokens=None):
+        completion = self.completion if completion is None else completion
+        completion_tokens = self.completion_tokens if completion_tokens is None else completion_tokens
+        return {
+            'id': f'chatcmpl-fake-{self.stats["requests"]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': 'llama-3.1-8b-instant',
+            'system_fingerprint': 'fake',
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': completion},
+                'finish_reason': 'stop',
+                'logprobs': None,
+            }],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': completion_tokens,
+                      'total_tokens': 100 + completion_tokens,
+                      'prompt_time': 0.0, 'completion_time': 0.0, 'total_time': 0.0, 'queue_time': 0.0},
+        }
+
+    def _delay(self):
+        delay = sample_latency(self.latency, self.rng)
+        if self.token_rate:
+            delay += self.completion_tokens / self.token_rate
+        return delay
+
+    async def _complete(self, request_body=b''):
+        """(status, body) of one simulated completion"""
+        self.stats['requests'] += 1
+        self.stats['in_flight'] += 1
+        self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+        try:
+            replayed = self._replayed(request_body)
+            if replayed:
+                latency, completion_tokens = replayed
+                await asyncio.sleep(latency)
+                self.stats['replayed'] += 1
+                self.stats['completed'] += 1
+                return 200, self._completion_body(filler_text(completion_tokens), completion_tokens)
+            if self.error_rate and self.rng.random() < self.error_rate:
+                # Providers fail fast: no generation time before the error
+                await asyncio.sleep(min(self._delay(), 0.05))
+                self.stats['errors'] += 1
+                status = self.rng.choice(ERROR_STATUSES)
+                return status, {'error': {'message': 'Injected failure', 'type': 'fake_error'}}
+            await asyncio.sleep(self._delay())
+            self.stats['completed'] += 1
+            return 200, self._completion_body()
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            raise
+        finally:
+            self.stats['in_flight'] -= 1
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                length = 0
+                body = b''
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'content-length':
+                        length = int(value.strip())
+                if length:
+                    body = await reader.readexactly(length)
+
+                if method == 'POST' and path == COMPLETIONS_PATH:
+                    # Cancel the simulated generation if the caller hangs up
+                    completion = asyncio.ensure_future(self._complete(body))
+                    closed = asyncio.ensure_future(reader.read())
+                    await asyncio.wait({completion, closed}, return_when=asyncio.FIRST_COMPLETED)
+                    if not completion.done():
+                        completion.cancel()
+                        return
+                    closed.cancel()
+                    await asyncio.wait({closed})
+                    status, body = completion.result()
+                elif path == '/stats':
+                    status, body = 200, self.stats
+                elif method == 'POST' and path == '/reset':
+                    self.reset()
+                    status, body = 200, self.stats
+                else:
+                    status, body = 404, {'error': {'message': 'not found'}}
+
+                payload = json.dumps(body).encode('utf-8')
+                extra = 'Retry-After: 0\r\n' if status == 429 else ''
+                writer.write(
+                    f'HTTP/1.1 {status} {_REASONS.get(status, "Error")}\r\nContent-Type: application/json\r\n'
+                    f'{extra}Content-Length: {len(payload)}\r\n\r\n'.encode('latin-1') + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except asyncio.CancelledError:
+            pass
+
+    def start(self):
+        """Serve on a daemon thread; returns once the port is bound"""
+        threading.Thread(target=self.run, name='fake-groq', daemon=True).start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop and self._server:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated fake Groq chat completions server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', default='1.0',
+                        help='Seconds before the first token, or a distribution (e.g. lognormal:1,0.5)')
+    parser.add_argument('--completion-tokens', type=int, default=50, help='Tokens per completion')
+    parser.add_argument('--token-rate', type=float, default=0, help='Tokens per second (0: instant)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls that fail')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--replay', help='Traffic capture whose LLM latencies and lengths to reproduce')
+    args = parser.parse_args()
+
+    sample_latency(args.latency)  # Fail fast on a malformed distribution
+    plan = None
+    if args.replay:
+        from backend.capture import read_capture
+        plan = replay_plan(read_capture(args.replay))
+    server = FakeGroqServer(args.host, args.port, args.latency, filler_text(args.completion_tokens),
+                            args.completion_tokens, args.token_rate, args.error_rate, args.seed, plan)
+    print(f'Fake Groq listening on {args.host}:{args.port} ({args.latency}s per completion)', flush=True)
+    server.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+"""
+Load test: a realistic mix of users against a local server and fake Groq
+Starts the fake Groq server and the app on a throwaway database. The app
+runs under gunicorn, or under uvicorn for the async mode. Then it runs
+virtual users. Each one signs up, logs in and keeps browsing: page views,
+generations, history reads and tracker events, with random think time in
+between. Throughput and p50/p95/p99 latency per endpoint go to a JSON file
+that can be compared across commits:
+
+    python -m benchmarks.loadtest run --users 200 --duration 60 --output results/HEAD.json
+    python -m benchmarks.loadtest run --mode async --latency lognormal:1,0.5 --error-rate 0.02
+    python -m benchmarks.loadtest compare results/main.json results/HEAD.json
+
+Every virtual user comes from 127.0.0.1, so the server runs with
+generation quotas and the login IP limit switched off. Signup emails are
+queued but not sent. --env overrides any of this.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from benchmarks.startup import ROOT
+from benchmarks.concurrency import SECRET_KEY, free_port, wait_for_port, peak_rss_kb
+
+RESULT_VERSION = 1
+
+# Relative weight of each kind of user action
+DEFAULT_MIX = {
+    'page_view': 35,
+    'history_read': 25,
+    'track_event': 20,
+    'generation': 15,
+    'relogin': 5,
+}
+
+PAGES = ['/', '/campaign', '/pitch', '/lead-score', '/history']
+
+HISTORY_READS = ['/api/history', '/api/history/summaries', '/api/history/grouped']
+
+GENERATIONS = [
+    ('/api/generate-campaign', {'product': 'Smart Widget', 'audience': 'SMB owners', 'platform': 'LinkedIn'}),
+    ('/api/generate-pitch', {'product': 'Smart Widget', 'persona': 'CTO of a logistics company'}),
+    ('/api/score-lead', {'name': 'Acme Corp', 'budget': '$50k', 'need': 'Fleet tracking', 'urgency': 'This quarter'}),
+]
+
+PASSWORD = 'Load-test9'
+
+# Server settings for a single-IP load test: no quotas, no login IP limit, and
+# verification emails queued (so signup succeeds) but never sent
+SERVER_ENV = {
+    'QUOTA_USER_RATE_LIMIT': '0',
+    'QUOTA_IP_RATE_LIMIT': '0',
+    'QUOTA_USER_DAILY_TOKENS': '0',
+    'QUOTA_IP_DAILY_TOKENS': '0',
+    'LOGIN_IP_LIMIT': '1000000',
+    'OUTBOX_AUTOSTART': 'false',
+    'GMAIL_ADDRESS': 'loadtest@example.com',
+    'GMAIL_APP_PASSWORD': 'loadtest',
+}
+
+
+# ==================== RECORDING ====================
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    """Latency samples and outcomes per endpoint ('GET /api/history')"""
+
+    def __init__(self):
+        self.samples = {}
+        self.started = None
+        self.finished = None
+
+    def record(self, name, status, elapsed):
+        now = time.monotonic()
+        self.started = min(self.started or now - elapsed, now - elapsed)
+        self.finished = max(self.finished or now, now)
+        self.samples.setdefault(name, []).append((status, elapsed))
+
+    def summary(self):
+        """
+        Throughput and latency per endpoint
+
+        Returns:
+            Dict with duration_s, requests, throughput_rps, errors, rejected and endpoints
+        """
+        duration = (self.finished - self.started) if self.samples else 0.0
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            latencies = sorted(elapsed * 1000 for _, elapsed in samples)
+            endpoints[name] = {
+                'count': len(samples),
+                'throughput_rps': round(len(samples) / duration, 2) if duration else 0.0,
+                # 4xx: the app refused (throttles, validation); 5xx/transport failures are errors
+                'rejected': sum(1 for status, _ in samples if isinstance(status, int) and 400 <= status < 500),
+                'errors': sum(1 for status, _ in samples if not isinstance(status, int) or status >= 500),
+                'p50_ms': round(percentile(latencies, 50), 1),
+                'p95_ms': round(percentile(latencies, 95), 1),
+                'p99_ms': round(percentile(latencies, 99), 1),
+                'max_ms': round(latencies[-1], 1),
+                'mean_ms': round(sum(latencies) / len(latencies), 1),
+            }
+        requests = sum(e['count'] for e in endpoints.values())
+        return {
+            'duration_s': round(duration, 2),
+            'requests': requests,
+            'throughput_rps': round(requests / duration, 2) if duration else 0.0,
+            'errors': sum(e['errors'] for e in endpoints.values()),
+            'rejected': sum(e['rejected'] for e in endpoints.values()),
+            'endpoints': endpoints,
+        }
+
+
+# ==================== VIRTUAL USERS ====================
+
+async def _request(client, recorder, method, path, **kwargs):
+    start = time.monotonic()
+    try:
+        resp = await client.request(method, path, **kwargs)
+        status = resp.status_code
+    except Exception as e:
+        resp, status = None, type(e).__name__
+    recorder.record(f'{method} {path}', status, time.monotonic() - start)
+    return resp
+
+
+async def virtual_user(client, recorder, index, deadline, mix, think, rng):
+    """One user: sign up, log in, then act until the deadline"""
+    email = f'load-{index}-{rng.getrandbits(32):08x}@example.com'
+    credentials = {'email': email, 'password': PASSWORD}
+
+    await _request(client, recorder, 'GET', '/signup')
+    await _request(client, recorder, 'POST', '/signup', json={
+        'name': f'Load User {index}', 'password_confirm': PASSWORD, **credentials})
+    await _request(client, recorder, 'POST', '/login', json=credentials)
+
+    actions, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        if think:
+            await asyncio.sleep(min(rng.expovariate(1 / think), max(deadline - time.monotonic(), 0)))
+            if time.monotonic() >= deadline:
+                break
+        action = rng.choices(actions, weights)[0]
+        if action == 'page_view':
+            page = rng.choice(PAGES)
+            await _request(client, recorder, 'GET', page)
+        elif action == 'history_read':
+            await _request(client, recorder, 'GET', rng.choice(HISTORY_READS))
+        elif action == 'track_event':
+            events = [{'action_type': 'click', 'page_url': rng.choice(PAGES), 'page_title': 'Load test',
+                       'metadata': {'element': 'button', 'text': 'Generate'}}
+                      for _ in range(rng.randint(1, 5))]
+            await _request(client, recorder, 'POST', '/api/history/log-action', json={'events': events})
+        elif action == 'generation':
+            path, payload = rng.choice(GENERATIONS)
+            await _request(client, recorder, 'POST', path, json=payload)
+        elif action == 'relogin':
+            await _request(client, recorder, 'GET', '/logout')
+            await _request(client, recorder, 'POST', '/login', json=credentials)
+
+
+async def run_users(base_url, users, duration, mix=None, think=1.0, ramp=0.0, seed=None, transport=None):
+    """
+    Drive `users` virtual users against base_url for `duration` seconds
+
+    Args:
+        ramp: seconds over which user start times are spread
+        transport: optional httpx transport (tests pass an ASGI transport)
+
+    Returns:
+        The Recorder with every sample
+    """
+    import httpx
+    recorder = Recorder()
+    rng = random.Random(seed)
+    deadline = time.monotonic() + ramp + duration
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=users)
+
+    async def one(index, user_rng):
+        if ramp:
+            await asyncio.sleep(ramp * index / users)
+        async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits, transport=transport) as client:
+            await virtual_user(client, recorder, index, deadline, mix or DEFAULT_MIX, think, user_rng)
+
+    await asyncio.gather(*[one(i, random.Random(rng.getrandbits(64))) for i in range(users)])
+    return recorder
+
+
+# ==================== SERVERS ====================
+
+def server_command(mode, port, workers, threads):
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '--preload', '-w', str(workers), '-k', 'gthread',
+                '--threads', str(threads), '--timeout', '600', '-b', f'127.0.0.1:{port}', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--no-access-log',
+            '--host', '127.0.0.1', '--port', str(port), 'asgi:app']
+
+
+def _git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run(args):
+    """Start fake Groq and the app, run the load, and return the result document"""
+    fake_port = free_port()
+    fake_command = [sys.executable, '-m', 'benchmarks.fake_groq', '--port', str(fake_port),
+                    '--latency', args.latency, '--completion-tokens', str(args.completion_tokens),
+                    '--token-rate', str(args.token_rate), '--error-rate', str(args.error_rate)]
+    if args.seed is not None:
+        fake_command += ['--seed', str(args.seed)]
+    fake = subprocess.Popen(fake_command, cwd=ROOT, stdout=subprocess.DEVNULL)
+    fake_url = f'http://127.0.0.1:{fake_port}'
+    server = None
+    try:
+        wait_for_port(fake_port)
+        with tempfile.TemporaryDirectory() as tmp:
+            port = free_port()
+            env = dict(os.environ, **SERVER_ENV)
+            env.update(dict(item.split('=', 1) for item in args.env))
+            env.update(DATABASE_PATH=os.path.join(tmp, 'loadtest.db'), SECRET_KEY=SECRET_KEY,
+                       GROQ_API_KEY='loadtest', GROQ_BASE_URL=fake_url)
+            server = subprocess.Popen(server_command(args.mode, port, args.workers, args.threads), cwd=ROOT,
+                                      env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            wait_for_port(port)
+
+            mix = dict(DEFAULT_MIX, **{k: int(v) for k, v in (item.split('=') for item in args.mix)})
+            recorder = asyncio.run(run_users(f'http://127.0.0.1:{port}', args.users, args.duration, mix,
+                                             args.think, args.ramp, args.seed))
+            rss_mb = round(peak_rss_kb(server.pid) / 1024, 1)
+
+            import httpx
+            fake_stats = httpx.get(f'{fake_url}/stats').json()
+    finally:
+        if server:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        fake.terminate()
+        fake.wait()
+
+    commit, dirty = _git_revision()
+    return {
+        'version': RESULT_VERSION,
+        'commit': commit,
+        'dirty': dirty,
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {
+            'mode': args.mode, 'workers': args.workers, 'threads': args.threads, 'users': args.users,
+            'duration_s': args.duration, 'ramp_s': args.ramp, 'think_s': args.think, 'mix': mix,
+            'latency': args.latency, 'completion_tokens': args.completion_tokens,
+            'token_rate': args.token_rate, 'error_rate': args.error_rate, 'seed': args.seed,
+        },
+        **recorder.summary(),
+        'server_peak_rss_mb': rss_mb,
+        'fake_groq': fake_stats,
+    }
+
+
+# ==================== REPORTING ====================
+
+def print_result(result):
+    config = result['config']
+    print(f"{result['commit'] or '?'}{' (dirty)' if result['dirty'] else ''}: {config['users']} users, "
+          f"{config['mode']} x{config['workers']}, {result['duration_s']}s, "
+          f"{result['throughput_rps']} req/s, {result['errors']} errors, {result['rejected']} rejected\n")
+    print(f"{'endpoint':<36}{'count':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, e in result['endpoints'].items():
+        print(f"{name:<36}{e['count']:>7}{e['throughput_rps']:>8}{e['p50_ms']:>9}{e['p95_ms']:>9}"
+              f"{e['p99_ms']:>9}{e['errors']:>8}")
+
+
+def compare(baseline, candidate):
+    """
+    Per-endpoint change between two result files
+
+    Returns:
+        List of dicts: endpoint, p50/p95/p99 before and after, and throughput change in percent
+    """
+    rows = []
+    for name in sorted(set(baseline['endpoints']) | set(candidate['endpoints'])):
+        before = baseline['endpoints'].get(name)
+        after = candidate['endpoints'].get(name)
+        row = {'endpoint': name}
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            row[key] = (before and before[key], after and after[key])
+        rows.append(row)
+    rows.append({'endpoint': 'total', 'p50_ms': (None, None), 'p95_ms': (None, None), 'p99_ms': (None, None),
+                 'throughput_rps': (baseline['throughput_rps'], candidate['throughput_rps'])})
+    return rows
+
+
+def _delta(before, after):
+    if before is None or after is None:
+        return f"{before if before is not None else '-'} -> {after if after is not None else '-'}"
+    change = f'{(after - before) / before * 100:+.0f}%' if before else ''
+    return f'{before} -> {after} {change}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test with a realistic user mix and a fake Groq API')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='Run a load test and write a result file')
+    run_parser.add_argument('--users', type=int, default=50, help='Concurrent virtual users')
+    run_parser.add_argument('--duration', type=float, default=30, help='Seconds of load after ramp-up')
+    run_parser.add_argument('--ramp', type=float, default=5, help='Seconds over which users start')
+    run_parser.add_argument('--think', type=float, default=1.0, help='Mean seconds between a user\'s actions')
+    run_parser.add_argument('--mix', action='append', default=[], metavar='ACTION=WEIGHT',
+                            help=f'Override an action weight ({", ".join(DEFAULT_MIX)})')
+    run_parser.add_argument('--mode', choices=('sync', 'async'), default='sync')
+    run_parser.add_argument('--workers', type=int, default=2)
+    run_parser.add_argument('--threads', type=int, default=8, help='gthread threads per worker (sync mode)')
+    run_parser.add_argument('--latency', default='lognormal:1,0.5', help='Fake Groq latency (see fake_groq)')
+    run_parser.add_argument('--completion-tokens', type=int, default=300)
+    run_parser.add_argument('--token-rate', type=float, default=0, help='Fake Groq tokens per second')
+    run_parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of failed LLM calls')
+    run_parser.add_argument('--seed', type=int, default=None)
+    run_parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                            help='Extra server environment variable')
+    run_parser.add_argument('--output', help='Write the result JSON here')
+
+    compare_parser = sub.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        result = run(args)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+        print_result(result)
+        return
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = json.load(f)
+    print(f"{(baseline['commit'] or '?')[:10]} -> {(candidate['commit'] or '?')[:10]}\n")
+    print(f"{'endpoint':<36}{'p50 ms':>24}{'p95 ms':>24}{'p99 ms':>24}{'req/s':>24}")
+    for row in compare(baseline, candidate):
+        print(f"{row['endpoint']:<36}" + ''.join(
+            f'{_delta(*row[key]):>24}' for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""
+Replay captured production traffic against a local server
+Reads a traffic capture written with TRAFFIC_CAPTURE=true (see
+backend/capture.py). It starts the fake Groq server with the capture as its
+replay plan, so every LLM call takes the recorded time and returns the
+recorded number of tokens. Then it starts the app on a throwaway database,
+creates one account per captured user, and sends each captured request at
+its recorded offset divided by --speed. Repeated runs with different worker
+counts show how many workers the recorded traffic needs:
+
+    python -m benchmarks.replay run logs/traffic.jsonl --speed 4 --workers 1,2,4 \
+        --output results/replay.json
+
+The requests are rebuilt from what the capture keeps:
+- JSON fields get filler text of the recorded length.
+- A [[replay:<prompt hash>]] marker goes into the first field of requests
+  that called the LLM, so prompts that repeated in production repeat here.
+- Leads the local pre-scorer answered get cold lead text, so they skip
+  the LLM again.
+- Route parameters become 1.
+- Logins use the replayed account's password.
+- Each user keeps ETags like a browser, so conditional reads can hit.
+
+For each worker count the result has per-route latency (replayed next to
+recorded) and throughput. It also has the share of 304 responses and the
+LLM cache hit rate: the recorded LLM calls the app answered without calling
+Groq. The LLM latencies are not scaled by --speed; only arrivals get
+denser. The server runs with SERVER_ENV from benchmarks/loadtest.py.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from backend.capture import read_capture
+from benchmarks.startup import ROOT
+from benchmarks.concurrency import SECRET_KEY, free_port, wait_for_port, peak_rss_kb
+from benchmarks.loadtest import PASSWORD, SERVER_ENV, Recorder, percentile, server_command, _git_revision
+
+RESULT_VERSION = 1
+
+_ROUTE_PARAM = re.compile(r'<(?:[^:<>]+:)?[^<>]+>')
+
+
+# ==================== REQUEST SYNTHESIS ====================
+
+def user_email(pseudonym):
+    return f'replay-{pseudonym}@example.com'
+
+
+def route_path(route):
+    """Concrete path for a route template ('/api/history/item/<int:history_id>' -> '/api/history/item/1')"""
+    return _ROUTE_PARAM.sub('1', route)
+
+
+# Lead text below any sensible LEAD_PRESCORE_THRESHOLD (backend/prescore.py)
+COLD_LEAD = {'budget': 'none', 'need': 'just browsing', 'urgency': 'no rush'}
+
+
+def _filler(seed, length):
+    """Deterministic text of exactly `length` characters"""
+    text = ''
+    while len(text) < length:
+        text += hashlib.sha256(f'{seed}:{len(text)}'.encode()).hexdigest()
+    return text[:length]
+
+
+def _events(length):
+    """A tracker batch whose JSON is about `length` characters long"""
+    event = {'action_type': 'click', 'page_url': '/', 'page_title': 'Replay',
+             'metadata': {'element': 'button'}}
+    count = max(1, length // (len(json.dumps(event)) + 2))
+    return [event] * count
+
+
+def synthesize_body(entry):
+    """
+    JSON body with the recorded field lengths (None for requests without one)
+
+    Requests that called the LLM carry the replay marker of their first
+    prompt hash; the filler is derived from the hash, so equal prompts in the
+    capture are equal here. Passwords are valid and emails unique per request.
+    Leads answered by the local pre-scorer get text it answers locally again.
+    """
+    fields = entry.get('f')
+    if fields is None:
+        return None
+    calls = [call for call in entry.get('l', []) if call.get('h')]
+    marker = f'[[replay:{calls[0]["h"]}]] ' if calls else ''
+    cold = entry['r'] == 'POST /api/score-lead' and entry.get('s') == 200 and not calls
+    body = {}
+    for name, length in fields.items():
+        if cold and name in COLD_LEAD:
+            body[name] = (COLD_LEAD[name] + ' ' + _filler(name, length))[:max(length, len(COLD_LEAD[name]))]
+        elif name == 'events':
+            body[name] = _events(length)
+        elif name in ('password', 'password_confirm'):
+            body[name] = PASSWORD
+        elif name == 'email':
+            body[name] = _filler(f'{name}:{entry["t"]}', max(length - 12, 8)) + '@example.com'
+        elif name == 'metadata':
+            body[name] = {'text': _filler(name, max(length - 12, 0))}
+        else:
+            body[name] = marker + _filler(marker + name, max(length - len(marker), 0))
+            marker = ''
+    return body
+
+
+# ==================== REPLAY ====================
+
+def expected_llm_calls(entries):
+    return sum(len(entry.get('l', [])) for entry in entries)
+
+
+def _create_users(database_path, pseudonyms):
+    """Create one account per captured user (in a child interpreter); returns {pseudonym: cookie}"""
+    script = (
+        'import sys, json\n'
+        'import app\n'
+        'from backend.database import create_user\n'
+        'from backend.passwords import hash_password\n'
+        f'password_hash = hash_password({PASSWORD!r})\n'
+        'serializer = app.app.session_interface.get_signing_serializer(app.app)\n'
+        'cookies = {}\n'
+        'for pseudonym in json.loads(sys.stdin.read()):\n'
+        '    user_id = create_user("Replay " + pseudonym, "replay-" + pseudonym + "@example.com", password_hash)\n'
+        '    cookies[pseudonym] = serializer.dumps({"logged_in_user_id": user_id})\n'
+        'print(json.dumps({"name": app.app.config["SESSION_COOKIE_NAME"], "cookies": cookies}))\n'
+    )
+    env = dict(os.environ, DATABASE_PATH=database_path, SECRET_KEY=SECRET_KEY)
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True,
+                            env=env, input=json.dumps(sorted(pseudonyms)), check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+async def replay_entries(base_url, entries, speed=1.0, sessions=None, transport=None):
+    """
+    Send the captured requests at their recorded offsets divided by speed
+
+    Captured users keep their signed session throughout. Anonymous requests
+    and logins go out without cookies, so a replayed login or logout never
+    signs out requests still in flight.
+
+    Args:
+        sessions: {'name': cookie name, 'cookies': {pseudonym: signed session}}
+        transport: optional httpx transport (tests pass an ASGI transport)
+
+    Returns:
+        (Recorder keyed by captured route, outcome dict with not_modified
+        {route: 304 responses} and llm_expected: recorded LLM calls of the
+        requests that succeeded)
+    """
+    import httpx
+    from http.cookiejar import CookieJar, DefaultCookiePolicy
+    recorder = Recorder()
+    outcome = {'not_modified': {}, 'llm_expected': 0}
+    clients = {}
+    etags = {}
+
+    def client_for(pseudonym):
+        if pseudonym not in clients:
+            if sessions and pseudonym in sessions['cookies']:
+                cookies = {sessions['name']: sessions['cookies'][pseudonym]}
+            else:
+                # Stores no cookies: each anonymous request is a new visitor
+                cookies = CookieJar(DefaultCookiePolicy(allowed_domains=[]))
+            clients[pseudonym] = httpx.AsyncClient(base_url=base_url, timeout=300, cookies=cookies,
+                                                   transport=transport)
+            etags[pseudonym] = {}
+        return clients[pseudonym]
+
+    async def send(entry, delay):
+        await asyncio.sleep(delay)
+        method, route = entry['r'].split(' ', 1)
+        path = route_path(route)
+        pseudonym = entry.get('u')
+        body = synthesize_body(entry)
+        if route == '/login' and method == 'POST' and pseudonym:
+            body = {'email': user_email(pseudonym), 'password': PASSWORD}
+            pseudonym = None
+        client = client_for(pseudonym)
+        headers = {}
+        if method == 'GET' and path in etags[pseudonym]:
+            headers['If-None-Match'] = etags[pseudonym][path]
+
+        start = time.monotonic()
+        try:
+            resp = await client.request(method, path, json=body, headers=headers)
+            status = resp.status_code
+            if pseudonym and resp.headers.get('etag'):
+                etags[pseudonym][path] = resp.headers['etag']
+        except Exception as e:
+            status = type(e).__name__
+        recorder.record(entry['r'], status, time.monotonic() - start)
+        if status == 304:
+            outcome['not_modified'][entry['r']] = outcome['not_modified'].get(entry['r'], 0) + 1
+        if isinstance(status, int) and status < 400:
+            outcome['llm_expected'] += len(entry.get('l', []))
+
+    if entries:
+        t0 = entries[0]['t']
+        try:
+            await asyncio.gather(*[send(entry, (entry['t'] - t0) / speed) for entry in entries])
+        finally:
+            for client in clients.values():
+                await client.aclose()
+    return recorder, outcome
+
+
+def recorded_summary(entries):
+    """Per-route latency and 304 counts as captured in production"""
+    routes = {}
+    for entry in entries:
+        routes.setdefault(entry['r'], []).append(entry)
+    summary = {}
+    for route, items in sorted(routes.items()):
+        latencies = sorted(item['d'] for item in items)
+        summary[route] = {
+            'count': len(items),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'not_modified': sum(1 for item in items if item.get('s') == 304),
+        }
+    return summary
+
+
+def replay_result(entries, recorder, outcome, llm_calls):
+    """
+    Replayed latencies next to the recorded ones, plus cache hit rates
+
+    Args:
+        outcome: second value returned by replay_entries()
+        llm_calls: completions the fake Groq server answered during the replay
+    """
+    summary = recorder.summary()
+    recorded = recorded_summary(entries)
+    not_modified = outcome['not_modified']
+    for route, stats in summary['endpoints'].items():
+        stats['recorded'] = recorded.get(route)
+        stats['not_modified'] = not_modified.get(route, 0)
+    # Only successful requests count: a rejected generation never reaches the LLM
+    expected = outcome['llm_expected']
+    summary['not_modified_rate'] = round(sum(not_modified.values()) / summary['requests'], 3) if summary['requests'] else 0.0
+    summary['llm'] = {
+        'recorded_calls': expected_llm_calls(entries),
+        'expected_calls': expected,
+        'calls': llm_calls,
+        'cache_hit_rate': round(max(expected - llm_calls, 0) / expected, 3) if expected else 0.0,
+    }
+    return summary
+
+
+def _run_once(path, entries, mode, workers, threads, speed, extra_env):
+    fake_port = free_port()
+    fake = subprocess.Popen([sys.executable, '-m', 'benchmarks.fake_groq', '--port', str(fake_port),
+                             '--replay', path], cwd=ROOT, stdout=subprocess.DEVNULL)
+    fake_url = f'http://127.0.0.1:{fake_port}'
+    server = None
+    try:
+        wait_for_port(fake_port)
+        with tempfile.TemporaryDirectory() as tmp:
+            database_path = os.path.join(tmp, 'replay.db')
+            sessions = _create_users(database_path, {entry['u'] for entry in entries if entry.get('u')})
+            port = free_port()
+            env = dict(os.environ, **SERVER_ENV)
+            env.update(extra_env)
+            env.update(DATABASE_PATH=database_path, SECRET_KEY=SECRET_KEY, GROQ_API_KEY='replay',
+                       GROQ_BASE_URL=fake_url, TRAFFIC_CAPTURE='false')
+            server = subprocess.Popen(server_command(mode, port, workers, threads), cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            wait_for_port(port)
+
+            recorder, outcome = asyncio.run(replay_entries(f'http://127.0.0.1:{port}', entries, speed, sessions))
+            rss_mb = round(peak_rss_kb(server.pid) / 1024, 1)
+
+            import httpx
+            fake_stats = httpx.get(f'{fake_url}/stats').json()
+    finally:
+        if server:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        fake.terminate()
+        fake.wait()
+
+    result = replay_result(entries, recorder, outcome, fake_stats['requests'])
+    result.update(workers=workers, server_peak_rss_mb=rss_mb, fake_groq=fake_stats)
+    return result
+
+
+def run(args):
+    """Replay the capture once per worker count and return the result document"""
+    entries = read_capture(args.capture)
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        raise SystemExit(f'No captured requests in {args.capture}')
+    extra_env = dict(item.split('=', 1) for item in args.env)
+    runs = [_run_once(args.capture, entries, args.mode, workers, args.threads, args.speed, extra_env)
+            for workers in (int(w) for w in args.workers.split(','))]
+
+    commit, dirty = _git_revision()
+    return {
+        'version': RESULT_VERSION,
+        'commit': commit,
+        'dirty': dirty,
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {
+            'capture': os.path.abspath(args.capture), 'requests': len(entries), 'speed': args.speed,
+            'mode': args.mode, 'threads': args.threads,
+            'recorded_duration_s': round(entries[-1]['t'] - entries[0]['t'], 1),
+        },
+        'runs': runs,
+    }
+
+
+# ==================== REPORTING ====================
+
+def print_result(result):
+    config = result['config']
+    print(f"{config['requests']} requests recorded over {config['recorded_duration_s']}s, "
+          f"replayed at {config['speed']}x ({config['mode']})\n")
+    print(f"{'workers':>7}{'req/s':>9}{'p95 ms':>9}{'errors':>8}{'rejected':>10}{'304 rate':>10}"
+          f"{'LLM hit':>9}{'RSS MB':>9}")
+    for run_result in result['runs']:
+        slowest = max((e['p95_ms'] for e in run_result['endpoints'].values()), default=0)
+        print(f"{run_result['workers']:>7}{run_result['throughput_rps']:>9}{slowest:>9}"
+              f"{run_result['errors']:>8}{run_result['rejected']:>10}{run_result['not_modified_rate']:>10.1%}"
+              f"{run_result['llm']['cache_hit_rate']:>9.1%}{run_result['server_peak_rss_mb']:>9}")
+
+    last = result['runs'][-1]
+    print(f"\n{last['workers']} workers, p95 ms replayed / recorded:")
+    for name, e in last['endpoints'].items():
+        recorded = e['recorded']['p95_ms'] if e['recorded'] else '-'
+        print(f"{name:<44}{e['count']:>7}{e['p95_ms']:>10} / {recorded}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a traffic capture against a local server')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='Replay a capture and write a result file')
+    run_parser.add_argument('capture', help='Capture file (TRAFFIC_CAPTURE_PATH)')
+    run_parser.add_argument('--speed', type=float, default=1.0, help='Replay N times faster than recorded')
+    run_parser.add_argument('--workers', default='2', help='Comma-separated worker counts to try')
+    run_parser.add_argument('--mode', choices=('sync', 'async'), default='sync')
+    run_parser.add_argument('--threads', type=int, default=8, help='gthread threads per worker (sync mode)')
+    run_parser.add_argument('--limit', type=int, help='Replay only the first N requests')
+    run_parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                            help='Extra server environment variable')
+    run_parser.add_argument('--output', help='Write the result JSON here')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    print_result(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Cold-start benchmark
+Starts fresh interpreters that import app.py and serve one request, and
+reports the median import time, time to first response and the slowest
+imports (from python -X importtime):
+
+    python -m benchmarks.startup --runs 5 --top 15
+
+Each run uses a throwaway database so schema creation is included.
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in the child interpreter; prints timings as JSON
+_CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'groq_loaded': 'groq' in sys.modules,
+}))
+'''
+
+
+def _child_env(database_path):
+    env = dict(os.environ)
+    env['DATABASE_PATH'] = database_path
+    return env
+
+
+def measure_startup():
+    """
+    Time one cold start in a fresh interpreter
+
+    Returns:
+        Dict with import_ms, first_request_ms and groq_loaded
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        result = subprocess.run(
+            [sys.executable, '-c', _CHILD], cwd=ROOT, capture_output=True, text=True,
+            env=_child_env(os.path.join(tmp, 'startup.db')), check=True
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile(module='app', top=15):
+    """
+    Cumulative import times of a module from python -X importtime
+
+    Returns:
+        List of (module name, cumulative microseconds), slowest first
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+            capture_output=True, text=True, env=_child_env(os.path.join(tmp, 'startup.db')), check=True
+        )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace('import time:', '|', 1).split('|')]
+        rows.append((name, int(cumulative_us)))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app cold-start time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure_startup() for _ in range(args.runs)]
+    print(f"import app:     median {statistics.median(r['import_ms'] for r in runs):7.1f} ms")
+    print(f"first request:  median {statistics.median(r['first_request_ms'] for r in runs):7.1f} ms")
+    print(f"groq imported at startup: {any(r['groq_loaded'] for r in runs)}")
+    print(f"\nSlowest imports (cumulative):")
+    for name, cumulative_us in import_profile(top=args.top):
+        print(f"{cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
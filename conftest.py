@@ -0,0 +1,70 @@
+"""
+Shared test fixtures
+Each test gets its own SQLite file and quota limiter: `db` creates them,
+`client` is an anonymous Flask test client on it and `user_client` is
+signed in as user 1.
+Test files extend these (fake LLM, throttles, extra users) by overriding
+the fixture with one that requests it.
+"""
+
+import os
+import tempfile
+
+# Keep anything that connects before the `db` fixture away from marketmind.db
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'marketmind_test.db'))
+
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def fallback_db():
+    """Schema for the DATABASE_PATH above: visits and quota counts flushed at exit land there"""
+    from backend import database
+    database.init_database()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    from backend import database
+    from backend import quotas
+    monkeypatch.setattr(database, 'DATABASE_PATH', str(tmp_path / 'marketmind_test.db'))
+    database.init_database()
+    # Fresh quota counts, and no sync thread that would write them into a later test's database
+    limiter = quotas.QuotaLimiter()
+    monkeypatch.setattr(limiter, '_ensure_syncer', lambda: None)
+    monkeypatch.setattr(quotas, 'limiter', limiter)
+    return database
+
+
+@pytest.fixture
+def limiter(db):
+    from backend import quotas
+    return quotas.limiter
+
+
+@pytest.fixture
+def login():
+    """login(client, user_id) signs a test client in and returns it"""
+    def sign_in(client, user_id=1):
+        with client.session_transaction() as sess:
+            sess['logged_in_user_id'] = user_id
+        return client
+    return sign_in
+
+
+@pytest.fixture
+def client(db):
+    import app as app_module
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def user_client(client, login):
+    return login(client, 1)
+
+
+@pytest.fixture
+def sync_tasks(monkeypatch):
+    """Run deferred work (history logging, emails) inline"""
+    from backend import tasks
+    monkeypatch.setattr(tasks, 'TASKS_SYNC', True)
@@ -1,13 +1,21 @@
 /**
  * History Tracker - Automatically logs user actions to backend
  * Tracks: clicks, searches, form submissions, and more
- * Sends data via fetch API - no page reloads needed
+ * Events are buffered and sent in batches to /api/history/log-action,
+ * flushed by size, by interval, and via sendBeacon when the page is hidden
  */
 
 class HistoryTracker {
     constructor() {
         this.debounceDelay = 500; // Prevent duplicate logs within 500ms
+        this.inputDebounceDelay = 1000; // Log typing once it pauses for 1s
+        this.maxBatchSize = 20; // Flush as soon as this many events are queued
+        this.flushInterval = 10000; // Flush queued events every 10s
+        this.endpoint = '/api/history/log-action';
         this.lastLoggedActions = new Map();
+        this.inputTimers = new Map(); // key -> { timer, fn } of typing not yet logged
+        this.draining = false;
+        this.queue = [];
         this.init();
     }
 
@@ -23,6 +31,13 @@ class HistoryTracker {
         searchInputs.forEach(input => {
             input.addEventListener('input', (e) => this.trackSearch(e));
         });
+
+        // Periodic flush, plus a final beacon when the page is hidden or unloaded
+        setInterval(() => this.flush(), this.flushInterval);
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') this.flush(true);
+        });
+        window.addEventListener('pagehide', () => this.flush(true));
     }
 
     /**
@@ -66,21 +81,52 @@ class HistoryTracker {
     }
 
     /**
-     * Track search queries
+     * Run fn once typing in a field has paused (trailing debounce per key)
      */
-    trackSearch(event) {
-        const searchTerm = event.target.value.trim();
-        if (!searchTerm || searchTerm.length < 2) return;
+    debounceInput(key, fn) {
+        const pending = this.inputTimers.get(key);
+        if (pending) clearTimeout(pending.timer);
+        const timer = setTimeout(() => {
+            this.inputTimers.delete(key);
+            fn();
+        }, this.inputDebounceDelay);
+        this.inputTimers.set(key, { timer: timer, fn: fn });
+    }
 
-        const key = `search_${searchTerm.slice(0, 20)}`;
-        if (!this.shouldLog(key)) return;
+    /**
+     * Run every debounced input callback now (the page is being hidden)
+     */
+    runPendingInput() {
+        const pending = [...this.inputTimers.values()];
+        this.inputTimers.clear();
+        // Queue them all for the one beacon instead of flushing mid-way by size
+        this.draining = true;
+        try {
+            pending.forEach(({ timer, fn }) => {
+                clearTimeout(timer);
+                fn();
+            });
+        } finally {
+            this.draining = false;
+        }
+    }
 
-        this.logAction({
-            action_type: 'search',
-            metadata: {
-                search_term: searchTerm,
-                search_source: event.target.placeholder || 'search'
-            }
+    /**
+     * Track search queries
+     */
+    trackSearch(event) {
+        const target = event.target;
+        this.debounceInput(`search_${target.id || target.name || 'search'}`, () => {
+            const searchTerm = target.value.trim();
+            if (!searchTerm || searchTerm.length < 2) return;
+
+            this.logAction({
+                action_type: 'search',
+                metadata: {
+                    search_term: searchTerm.slice(0, 200),
+                    search_source: target.placeholder || 'search'
+                }
+            });
         });
     }
 
@@ -91,16 +137,15 @@ class HistoryTracker {
         const input = event.target;
         if (!input.name && !input.id) return;
 
-        const key = `input_${input.name || input.id}`;
-        if (!this.shouldLog(key)) return;
-
-        this.logAction({
-            action_type: 'form_input',
-            metadata: {
-                field_name: input.name,
-                field_type: input.type,
-                field_id: input.id
-            }
+        this.debounceInput(`input_${input.name || input.id}`, () => {
+            this.logAction({
+                action_type: 'form_input',
+                metadata: {
+                    field_name: input.name,
+                    field_type: input.type,
+                    field_id: input.id
+                }
+            });
         });
     }
 
@@ -144,22 +189,45 @@ class HistoryTracker {
     }
 
     /**
-     * Send action to backend API
+     * Queue an action for the next batch
      */
     logAction(data) {
-        const payload = {
+        this.queue.push({
             action_type: data.action_type,
             page_url: window.location.pathname,
             page_title: document.title,
             metadata: data.metadata
-        };
+        });
+
+        if (this.queue.length >= this.maxBatchSize && !this.draining) {
+            this.flush();
+        }
+    }
+
+    /**
+     * Send queued actions to the backend in one request
+     * @param {boolean} unloading - use sendBeacon so the request survives page unload
+     */
+    flush(unloading = false) {
+        // The last search or field edit may still be waiting on its debounce timer
+        if (unloading) this.runPendingInput();
+        if (!this.queue.length) return;
+
+        const events = this.queue.splice(0, this.queue.length);
+        const body = JSON.stringify({ events: events });
+
+        if (unloading && navigator.sendBeacon) {
+            navigator.sendBeacon(this.endpoint, new Blob([body], { type: 'application/json' }));
+            return;
+        }
 
-        fetch('/api/history/log-action', {
+        fetch(this.endpoint, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify(payload)
+            body: body,
+            keepalive: unloading
         }).catch(err => {
             // Fail silently - don't interrupt user experience
             console.debug('History log failed:', err);
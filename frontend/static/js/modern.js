@@ -64,19 +64,9 @@ document.addEventListener('DOMContentLoaded', function(){
     t.textContent = message; t.classList.add('show'); setTimeout(()=> t.classList.remove('show'), 3500);
   }
 
-  // Parse numeric score from text and update gauge
-  function updateGaugeFromText(text){
-    const m = text.match(/(\d{1,3})\s*\/?\s*100|(\d{1,3})(?!.*%)/);
-    let num = null;
-    if(m){
-      num = m[1] ? parseInt(m[1]) : (m[2] ? parseInt(m[2]) : null);
-    }
-    if(num===null){
-      // try percent
-      const p = text.match(/(\d{1,3})%/);
-      if(p) num = parseInt(p[1]);
-    }
-    if(num===null) return;
+  // Update the gauge from the structured score returned by /api/score-lead
+  function updateLeadGauge(num){
+    if(typeof num !== 'number') return;
     num = Math.max(0, Math.min(100, num));
     const gauge = document.getElementById('leadGauge');
     const valueEl = document.getElementById('leadScoreValue');
@@ -92,18 +82,13 @@ document.addEventListener('DOMContentLoaded', function(){
       gauge.style.background = color;
     }
   }
+  window.updateLeadGauge = updateLeadGauge;
 
-  // Listen for successful AJAX responses to update gauge
-  // We will monkey-patch fetch to intercept responses from /api/score-lead and update UI
+  // Listen for successful AJAX responses to show a toast
   const originalFetch = window.fetch;
   window.fetch = async function(resource, init){
     const res = await originalFetch(resource, init);
     try{
-      if(resource && resource.toString().includes('/api/score-lead')){
-        const clone = res.clone();
-        const data = await clone.json();
-        if(data && data.result){ updateGaugeFromText(data.result); }
-      }
       if(resource && resource.toString().includes('/api/generate-campaign')){
         const clone = res.clone();
         const data = await clone.json();
@@ -0,0 +1,197 @@
+"""
+Tests for the async (ASGI) serving mode
+Run with: python -m pytest test_asgi.py
+"""
+
+import json
+import asyncio
+
+import httpx
+import pytest
+
+import asgi
+from backend import history
+from backend import live
+from backend import quotas
+from benchmarks.fake_groq import FakeGroqServer
+
+CAMPAIGN = {'product': 'Widget', 'audience': 'SMBs', 'platform': 'LinkedIn'}
+
+
+@pytest.fixture(scope='module')
+def groq_server():
+    server = FakeGroqServer(latency=0.2).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def fake_groq(groq_server, monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    monkeypatch.setenv('GROQ_BASE_URL', groq_server.base_url)
+    groq_server.latency = 0.2
+    groq_server.reset()
+    return groq_server
+
+
+@pytest.fixture
+def user_id(db, sync_tasks, monkeypatch):
+    monkeypatch.setattr(quotas, 'QUOTA_USER_RATE_LIMIT', 0)
+    monkeypatch.setattr(quotas, 'QUOTA_IP_RATE_LIMIT', 0)
+    return db.create_user('Ann', 'ann@example.com', 'x')
+
+
+def _cookies(user_id):
+    serializer = asgi.flask_app.session_interface.get_signing_serializer(asgi.flask_app)
+    return {asgi.flask_app.config['SESSION_COOKIE_NAME']: serializer.dumps({'logged_in_user_id': user_id})}
+
+
+async def _post_all(path, payload, cookies, count=1):
+    transport = httpx.ASGITransport(app=asgi.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test', cookies=cookies) as client:
+        return await asyncio.gather(*[client.post(path, json=payload) for _ in range(count)])
+
+
+def test_generation_runs_on_async_client_and_logs_history(fake_groq, user_id):
+    [resp] = asyncio.run(_post_all('/api/generate-campaign', CAMPAIGN, _cookies(user_id)))
+    assert resp.status_code == 200
+    assert resp.json() == {'success': True, 'result': 'Fake completion.'}
+    assert resp.headers['X-Request-ID']
+
+    [item] = history.get_user_history(user_id)
+    assert item['action_type'] == 'campaign_generated'
+    assert json.loads(item['metadata']) == dict(CAMPAIGN, result='Fake completion.', template='campaign@1')
+
+
+def test_generation_validates_like_the_sync_routes(fake_groq, user_id):
+    [anonymous] = asyncio.run(_post_all('/api/generate-pitch', {'product': 'x', 'persona': 'y'}, {}))
+    assert anonymous.status_code == 401
+    [missing] = asyncio.run(_post_all('/api/score-lead', {'name': 'Acme'}, _cookies(user_id)))
+    assert missing.status_code == 400 and missing.json() == {'error': 'Missing required fields'}
+    assert fake_groq.stats['requests'] == 0
+
+
+def test_oversize_body_is_rejected_with_413(fake_groq, user_id, monkeypatch):
+    monkeypatch.setattr(asgi, 'ASYNC_MAX_BODY', 100)
+    big = dict(CAMPAIGN, product='x' * 200)
+    [generation] = asyncio.run(_post_all('/api/generate-campaign', big, _cookies(user_id)))
+    assert generation.status_code == 413 and generation.json() == {'error': 'Request body too large'}
+    [bridged] = asyncio.run(_post_all('/api/history/log-action', big, _cookies(user_id)))
+    assert bridged.status_code == 413
+    assert fake_groq.stats['requests'] == 0
+
+
+def test_one_process_holds_many_llm_calls_in_flight(fake_groq, user_id):
+    fake_groq.latency = 1.0
+    responses = asyncio.run(_post_all('/api/generate-pitch', {'product': 'x', 'persona': 'y'},
+                                      _cookies(user_id), count=100))
+    assert all(resp.status_code == 200 for resp in responses)
+    assert fake_groq.stats['peak_in_flight'] == 100
+
+
+def test_quota_is_enforced_in_async_mode(fake_groq, user_id, monkeypatch):
+    monkeypatch.setattr(quotas, 'QUOTA_USER_RATE_LIMIT', 1)
+    statuses = sorted(resp.status_code for resp in asyncio.run(
+        _post_all('/api/generate-campaign', CAMPAIGN, _cookies(user_id), count=2)))
+    assert statuses == [200, 429]
+    assert fake_groq.stats['requests'] == 1
+
+
+def test_client_disconnect_cancels_the_llm_call(fake_groq, user_id):
+    fake_groq.latency = 30
+    sent = []
+    cookie = '; '.join(f'{k}={v}' for k, v in _cookies(user_id).items())
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/generate-campaign', 'query_string': b'',
+             'headers': [(b'cookie', cookie.encode()), (b'content-type', b'application/json')],
+             'client': ('127.0.0.1', 5000)}
+    messages = [{'type': 'http.request', 'body': json.dumps(CAMPAIGN).encode()}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # The client hangs up while the LLM call is in flight
+        while not fake_groq.stats['in_flight']:
+            await asyncio.sleep(0.01)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    async def scenario():
+        await asyncio.wait_for(asgi.app(scope, receive, send), timeout=5)
+        for _ in range(100):
+            if fake_groq.stats['cancelled']:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert sent == []
+    assert fake_groq.stats['cancelled'] == 1 and fake_groq.stats['completed'] == 0
+    assert history.get_user_history(user_id) == []
+
+
+def test_other_routes_are_served_by_flask(user_id):
+    async def scenario():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            page = await client.get('/login')
+        async with httpx.AsyncClient(transport=transport, base_url='http://test',
+                                     cookies=_cookies(user_id)) as client:
+            logged = await client.post('/api/history/log-action',
+                                       json={'action_type': 'click', 'page_url': '/campaign'})
+            listed = await client.get('/api/history/summaries')
+            return page, logged, listed
+
+    page, logged, listed = asyncio.run(scenario())
+    assert page.status_code == 200 and 'text/html' in page.headers['content-type']
+    assert logged.status_code == 200
+    assert listed.status_code == 200
+
+
+def test_open_history_streams_leave_the_flask_pool_free(user_id, monkeypatch):
+    monkeypatch.setattr(asgi, 'ASYNC_WSGI_WORKERS', 2)
+    monkeypatch.setattr(asgi, '_executors', {})
+    monkeypatch.setattr(live, 'hub', live.HistoryHub(poll_interval=0.05))
+    cookie = '; '.join(f'{k}={v}' for k, v in _cookies(user_id).items())
+    scope = {'type': 'http', 'method': 'GET', 'path': '/api/history/stream', 'query_string': b'',
+             'headers': [(b'cookie', cookie.encode())], 'client': ('127.0.0.1', 5000)}
+
+    async def scenario():
+        hang_up = asyncio.Event()
+        streams = []
+
+        async def receive():
+            await hang_up.wait()
+            return {'type': 'http.disconnect'}
+
+        async def open_stream():
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+            streams.append(sent)
+            await asgi.app(scope, receive, send)
+
+        tasks = [asyncio.ensure_future(open_stream()) for _ in range(4)]
+        while live.hub.subscriber_count() < 4:
+            await asyncio.sleep(0.01)
+
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', cookies=_cookies(user_id)) as client:
+            listed = await asyncio.wait_for(client.get('/api/history/summaries'), timeout=5)
+
+        history.log_user_activity(user_id, '/pitch', 'Pitch', 'pitch_generated', metadata={'product': 'Widget'})
+        while not all(b'event: history' in m.get('body', b'') for sent in streams for m in sent[-1:]):
+            await asyncio.sleep(0.01)
+
+        # Streams end on disconnect, not at the next heartbeat
+        hang_up.set()
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+        return listed, streams
+
+    listed, streams = asyncio.run(scenario())
+    assert listed.status_code == 200
+    for sent in streams:
+        assert sent[0]['status'] == 200 and (b'content-type', b'text/event-stream; charset=utf-8') in sent[0]['headers']
+        assert sent[1]['body'] == b'retry: 3000\n\n'
+    assert live.hub.subscriber_count() == 0
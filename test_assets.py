@@ -0,0 +1,112 @@
+"""
+Tests for the static asset pipeline
+Run with: python -m pytest test_assets.py
+"""
+
+import gzip
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from backend import assets
+
+
+@pytest.fixture
+def dist(db, tmp_path, monkeypatch):
+    dist_dir = tmp_path / 'dist'
+    monkeypatch.setattr(assets, 'DIST_DIR', str(dist_dir))
+    monkeypatch.setattr(assets, 'MANIFEST_PATH', str(dist_dir / 'manifest.json'))
+    assets.reload_manifest()
+    yield dist_dir
+    assets.reload_manifest()
+
+
+@pytest.fixture
+def client(client, dist):
+    return client
+
+
+def test_minify_css_keeps_strings_and_selectors():
+    source = '/* header */\na:hover ,  .x > b {\n  content: "  /* not a comment */ ";\n  color : red ;\n}\n'
+    assert assets.minify_css(source) == 'a:hover,.x>b{content:"  /* not a comment */ ";color :red}'
+
+
+def test_minify_js_keeps_strings_regexes_and_line_breaks():
+    source = (
+        '// leading comment\n'
+        'const url = "http://example.com"; /* inline */\n'
+        '    const re = /\\/\\*[^/]*\\*\\//g;\n'
+        '\n'
+        'const t = `a // b\n  ${url}`\n'
+        'const half = 4 / 2\n'
+    )
+    assert assets.minify_js(source) == (
+        'const url = "http://example.com";\n'
+        'const re = /\\/\\*[^/]*\\*\\//g;\n'
+        'const t = `a // b\n  ${url}`\n'
+        'const half = 4 / 2'
+    )
+
+
+@pytest.mark.skipif(not shutil.which('node'), reason='node is not installed')
+def test_js_bundle_is_valid_javascript(tmp_path):
+    path = tmp_path / 'app.js'
+    path.write_text(assets.bundle_source('app.js'), encoding='utf-8')
+    subprocess.run(['node', '--check', str(path)], check=True)
+
+
+def test_build_writes_fingerprinted_and_compressed_files(dist):
+    manifest = assets.build(str(dist))
+    assert set(manifest) == set(assets.BUNDLES)
+    css = manifest['app.css']
+    assert css.startswith('app.') and css.endswith('.css') and css != 'app.css'
+    data = (dist / css).read_bytes()
+    assert gzip.decompress((dist / (css + '.gz')).read_bytes()) == data
+    assert json.loads((dist / 'manifest.json').read_text()) == manifest
+
+    # A rebuild of unchanged sources keeps the names; files two builds old are removed
+    (dist / 'app.0000000000.css').write_bytes(b'old')
+    assert assets.build(str(dist)) == manifest
+    assert not (dist / 'app.0000000000.css').exists()
+
+
+def test_templates_use_sources_until_built(client):
+    page = client.get('/login').get_data(as_text=True)
+    assert '/static/css/modern.css' in page
+
+    manifest = assets.build(assets.DIST_DIR)
+    page = client.get('/login').get_data(as_text=True)
+    assert f"/static/dist/{manifest['auth.css']}" in page
+    assert '/static/css/modern.css' not in page
+
+
+def test_dist_negotiates_encoding_and_caches_forever(client):
+    name = assets.build(assets.DIST_DIR)['app.css']
+
+    plain = client.get(f'/static/dist/{name}', headers={'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200 and plain.mimetype == 'text/css'
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    cache = plain.headers['Cache-Control']
+    assert 'immutable' in cache and f'max-age={assets.ASSET_MAX_AGE}' in cache and 'public' in cache
+
+    gz = client.get(f'/static/dist/{name}', headers={'Accept-Encoding': 'gzip'})
+    assert gz.headers['Content-Encoding'] == 'gzip' and gz.mimetype == 'text/css'
+    assert gzip.decompress(gz.data) == plain.data
+
+    if assets.brotli is not None:
+        br = client.get(f'/static/dist/{name}', headers={'Accept-Encoding': 'gzip, br'})
+        assert br.headers['Content-Encoding'] == 'br'
+        assert assets.brotli.decompress(br.data) == plain.data
+
+    assert client.get(f'/static/dist/{name}.gz').status_code == 404
+    assert client.get('/static/dist/manifest.json').status_code == 404
+
+
+def test_size_report_counts_fewer_requests_and_bytes():
+    [app_pages, auth_pages] = assets.size_report()
+    assert app_pages['requests_before'] == 6 and app_pages['requests_after'] == 3
+    assert app_pages['bytes_gzip'] < app_pages['bytes_minified'] < app_pages['bytes_before']
+    assert auth_pages['requests_after'] == 1
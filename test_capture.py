@@ -0,0 +1,129 @@
+"""
+Tests for traffic capture and replay
+Run with: python -m pytest test_capture.py
+"""
+
+import os
+import asyncio
+
+import httpx
+import pytest
+
+import asgi
+from backend import capture
+from backend import database
+from backend import quotas
+from benchmarks import replay
+from benchmarks.fake_groq import FakeGroqServer, replay_plan
+
+CAMPAIGN = {'product': 'Secret Widget', 'audience': 'SMBs', 'platform': 'LinkedIn'}
+
+
+@pytest.fixture
+def groq_server(monkeypatch):
+    server = FakeGroqServer(latency=0.01).start()
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    monkeypatch.setenv('GROQ_BASE_URL', server.base_url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def capturing(groq_server, db, sync_tasks, tmp_path, monkeypatch):
+    monkeypatch.setattr(quotas, 'QUOTA_USER_RATE_LIMIT', 0)
+    monkeypatch.setattr(quotas, 'QUOTA_IP_RATE_LIMIT', 0)
+    monkeypatch.setattr(capture, 'TRAFFIC_CAPTURE', True)
+    monkeypatch.setattr(capture, 'TRAFFIC_CAPTURE_PATH', str(tmp_path / 'traffic.jsonl'))
+    monkeypatch.setattr(capture, '_buffer', [])
+    return groq_server
+
+
+def _cookies(user_id):
+    serializer = asgi.flask_app.session_interface.get_signing_serializer(asgi.flask_app)
+    return {asgi.flask_app.config['SESSION_COOKIE_NAME']: serializer.dumps({'logged_in_user_id': user_id})}
+
+
+async def _browse(cookies):
+    transport = httpx.ASGITransport(app=asgi.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test', cookies=cookies) as client:
+        for payload in (CAMPAIGN, CAMPAIGN, dict(CAMPAIGN, product='Other')):
+            assert (await client.post('/api/generate-campaign', json=payload)).status_code == 200
+        await client.get('/api/history')
+        await client.get('/api/history/item/12345')
+
+
+def _capture_session():
+    user_id = database.create_user('Ann', 'ann@example.com', 'x')
+    asyncio.run(_browse(_cookies(user_id)))
+    capture.flush()
+    return user_id, capture.read_capture(capture.TRAFFIC_CAPTURE_PATH)
+
+
+def test_capture_is_anonymized_and_compact(capturing):
+    user_id, entries = _capture_session()
+    routes = [entry['r'] for entry in entries]
+    assert routes == ['POST /api/generate-campaign'] * 3 + [
+        'GET /api/history', 'GET /api/history/item/<int:history_id>']
+
+    generation = entries[0]
+    assert generation['m'] == 'async' and generation['s'] == 200
+    assert generation['f'] == {'product': 13, 'audience': 4, 'platform': 8}
+    [call] = generation['l']
+    assert call['ct'] == 50 and call['ok'] and len(call['h']) == 16
+    assert {entry['u'] for entry in entries} == {capture.user_pseudonym(user_id)}
+
+    with open(capture.TRAFFIC_CAPTURE_PATH) as f:
+        raw = f.read()
+    assert 'Secret Widget' not in raw and 'ann@example.com' not in raw
+
+    stats = capture.summarize(entries)
+    assert stats['llm_calls'] == 3 and stats['repeated_prompts'] == 1
+    assert stats['routes']['POST /api/generate-campaign'] == 3
+
+
+def test_capture_is_off_by_default(capturing, monkeypatch):
+    monkeypatch.setattr(capture, 'TRAFFIC_CAPTURE', False)
+    user_id = database.create_user('Ann', 'ann@example.com', 'x')
+    asyncio.run(_browse(_cookies(user_id)))
+    capture.flush()
+    assert not os.path.exists(capture.TRAFFIC_CAPTURE_PATH)
+
+
+def test_sampling_keeps_or_drops_whole_users(monkeypatch):
+    monkeypatch.setattr(capture, 'TRAFFIC_CAPTURE_SAMPLE', 0.5)
+    pseudonyms = [capture.user_pseudonym(i) for i in range(1, 401)]
+    kept = [p for p in pseudonyms if capture._sampled(p)]
+    assert 120 < len(kept) < 280
+    assert all(capture._sampled(p) for p in kept)
+
+
+def test_synthesized_bodies_repeat_for_repeated_prompts():
+    entry = {'r': 'POST /api/generate-pitch', 'f': {'product': 40, 'persona': 20}, 'l': [{'h': 'ab12'}]}
+    body = replay.synthesize_body(entry)
+    assert body['product'].startswith('[[replay:ab12]] ') and len(body['product']) == 40
+    assert len(body['persona']) == 20 and 'replay' not in body['persona']
+    assert replay.synthesize_body(entry) == body
+    assert replay.synthesize_body({'r': 'GET /'}) is None
+    assert replay.route_path('/api/history/item/<int:history_id>') == '/api/history/item/1'
+
+
+def test_replay_reproduces_recorded_llm_calls(capturing, monkeypatch):
+    _, entries = _capture_session()
+    monkeypatch.setattr(capture, 'TRAFFIC_CAPTURE', False)
+
+    capturing.replay = replay_plan(entries)
+    capturing.reset()
+    user_id = database.create_user('Replay', 'replay@example.com', 'x')
+    sessions = {'name': asgi.flask_app.config['SESSION_COOKIE_NAME'],
+                'cookies': {entries[0]['u']: _cookies(user_id).popitem()[1]}}
+    transport = httpx.ASGITransport(app=asgi.app)
+    recorder, outcome = asyncio.run(
+        replay.replay_entries('http://test', entries, speed=100, sessions=sessions, transport=transport))
+    result = replay.replay_result(entries, recorder, outcome, capturing.stats['requests'])
+
+    assert capturing.stats['replayed'] == replay.expected_llm_calls(entries) == 3
+    assert result['llm'] == {'recorded_calls': 3, 'expected_calls': 3, 'calls': 3, 'cache_hit_rate': 0.0}
+    generations = result['endpoints']['POST /api/generate-campaign']
+    assert generations['count'] == 3 and generations['errors'] == 0
+    assert generations['recorded']['count'] == 3
+    assert result['endpoints']['GET /api/history/item/<int:history_id>']['rejected'] == 1
@@ -0,0 +1,85 @@
+"""
+Tests for the database scale benchmarks (generator, measurements, regression gate)
+Run with: python -m pytest test_db_scale.py
+"""
+
+import sqlite3
+
+import pytest
+
+from backend import database
+from benchmarks import db_scale
+
+
+@pytest.fixture
+def bench_db(tmp_path, monkeypatch):
+    # generate() and measure() point the database module at the benchmark file
+    monkeypatch.setattr(database, 'DATABASE_PATH', database.DATABASE_PATH)
+    path = str(tmp_path / 'bench.db')
+    db_scale.generate(path, 2000, seed=1)
+    return path
+
+
+def _count(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_sizes_round_trip():
+    assert db_scale.parse_size('10k') == 10_000
+    assert db_scale.parse_size('2.5M') == 2_500_000
+    assert db_scale.parse_size('1234') == 1234
+    assert db_scale.format_size(10_000_000) == '10M'
+    assert db_scale.format_size(1234) == '1234'
+
+
+def test_generate_builds_realistic_data_with_indexes_and_triggers(bench_db):
+    assert _count(bench_db, 'SELECT COUNT(*) FROM user_history') == 2000
+    assert _count(bench_db, 'SELECT COUNT(*) FROM users') == 10
+    assert _count(bench_db, 'SELECT COUNT(*) FROM campaign_history') > 0
+    # Generations carry multi-KB results
+    assert _count(bench_db, '''
+        SELECT MIN(length(metadata)) FROM user_history WHERE action_type = 'campaign_generated'
+    ''') > 1000
+    # Indexes and triggers dropped for the bulk load are back
+    assert _count(bench_db, "SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_user_timestamp_id'") == 1
+    assert _count(bench_db, "SELECT COUNT(*) FROM sqlite_master WHERE name = 'trg_history_version_insert'") == 1
+    assert _count(bench_db, 'SELECT SUM(version) FROM history_versions') == 2000
+
+
+@pytest.mark.parametrize('operation', list(db_scale.OPERATIONS))
+def test_measure_reports_latency_throughput_and_memory(bench_db, operation):
+    stats = db_scale.measure(bench_db, operation, repeat=5)
+    assert stats['runs'] == 5
+    assert 0 < stats['p50_ms'] <= stats['p95_ms']
+    assert stats['rows_per_s'] > 0 and stats['peak_rss_mb'] > 0
+
+
+def test_delete_benchmark_restores_pruned_rows(bench_db):
+    before = _count(bench_db, 'SELECT COUNT(*) FROM user_history')
+    stats = db_scale.measure(bench_db, 'delete_old_history', repeat=5)
+    assert stats['rows_per_s'] > 0
+    assert _count(bench_db, 'SELECT COUNT(*) FROM user_history') == before
+
+
+def test_ensure_database_reuses_a_matching_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE_PATH', database.DATABASE_PATH)
+    path, seconds = db_scale.ensure_database(str(tmp_path), 1000)
+    assert seconds > 0 and path.endswith('history-1k.db')
+    assert db_scale.ensure_database(str(tmp_path), 1000) == (path, 0.0)
+
+
+def test_regressions_respect_ratio_and_noise_floor():
+    def result(p50, rss):
+        return {'sizes': {'10k': {'get_user_history': {'p50_ms': p50, 'peak_rss_mb': rss}}}}
+
+    assert db_scale.find_regressions(result(10, 50), result(12, 52), max_regression=0.3) == []
+    [slower] = db_scale.find_regressions(result(10, 50), result(14, 50), max_regression=0.3)
+    assert '10k get_user_history: p50_ms 10 -> 14' in slower
+    # +100% but only 0.5 ms: below the noise floor
+    assert db_scale.find_regressions(result(0.5, 50), result(1.0, 50), max_regression=0.3) == []
+    [bigger] = db_scale.find_regressions(result(10, 50), result(10, 90), max_regression=0.3)
+    assert 'peak_rss_mb' in bigger
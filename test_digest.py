@@ -0,0 +1,110 @@
+"""
+Tests for precompiled email templates and the weekly digest job
+Run with: python -m pytest test_digest.py
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import database
+from backend import digest
+from backend import email_utils
+from backend import history
+from backend import outbox
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    monkeypatch.setattr(outbox, 'OUTBOX_AUTOSTART', False)
+    return db
+
+
+def _this_week():
+    year, week, _ = datetime.utcnow().isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def _add_users(count, active=True):
+    ids = []
+    for i in range(count):
+        user_id = database.create_user(f'User {i}', f'user{i}@example.com', 'x')
+        if active:
+            history.log_user_activity(user_id, '/campaign', 'Campaign', 'campaign_generated',
+                                      metadata={'product': f'Widget {i}', 'result': 'r'})
+        ids.append(user_id)
+    return ids
+
+
+def _outbox_rows():
+    with database.get_db() as conn:
+        return [dict(r) for r in conn.execute('SELECT to_email, dedupe_key, html_body FROM email_outbox ORDER BY id')]
+
+
+def test_templates_are_compiled_once(monkeypatch):
+    email_utils.render_email('verification.html', user_name='Ann', verification_link='http://x')
+
+    def no_disk_access(*args):
+        raise AssertionError('template loaded from disk')
+
+    monkeypatch.setattr(email_utils._email_env.loader, 'get_source', no_disk_access)
+    html = email_utils.render_email('password_reset.html', user_name='<Ann>', reset_link='http://x/reset/t')
+    assert 'http://x/reset/t' in html and '&lt;Ann&gt;' in html
+
+
+def test_period_bounds():
+    period, start, end = digest.period_bounds(today=datetime(2026, 10, 19).date())
+    assert period == '2026-W42'
+    assert (start, end) == (datetime(2026, 10, 12), datetime(2026, 10, 19))
+
+
+def test_digest_queues_active_users_only(db):
+    _add_users(3)
+    database.create_user('Idle', 'idle@example.com', 'x')
+
+    result = digest.run_digest(_this_week())
+    assert result['queued'] == 3 and result['skipped'] == 1 and result['finished']
+    rows = _outbox_rows()
+    assert [r['to_email'] for r in rows] == [f'user{i}@example.com' for i in range(3)]
+    assert 'Widget 0' in rows[0]['html_body'] and 'Campaigns generated' in rows[0]['html_body']
+
+    assert digest.run_digest(_this_week())['queued'] == 0
+
+
+def test_crashed_run_resumes_without_double_sending(db, monkeypatch):
+    ids = _add_users(5)
+    render = digest.render_digest
+
+    def flaky_render(user, *args):
+        if user['id'] == ids[3]:
+            raise RuntimeError('worker died')
+        return render(user, *args)
+
+    monkeypatch.setattr(digest, 'render_digest', flaky_render)
+    with pytest.raises(RuntimeError):
+        digest.run_digest(_this_week(), chunk_size=2)
+    assert len(_outbox_rows()) == 2
+
+    monkeypatch.setattr(digest, 'render_digest', render)
+    result = digest.run_digest(_this_week(), chunk_size=2)
+    assert result['resumed_from'] == ids[1] and result['queued'] == 3
+    keys = [r['dedupe_key'] for r in _outbox_rows()]
+    assert keys == [f'digest:{_this_week()}:{user_id}' for user_id in ids]
+
+
+def test_lost_checkpoint_is_caught_by_dedupe_keys(db):
+    _add_users(2)
+    digest.run_digest(_this_week())
+    with database.get_db() as conn:
+        conn.execute('UPDATE digest_runs SET last_user_id = 0, finished_at = NULL')
+        conn.commit()
+    assert digest.run_digest(_this_week())['queued'] == 0
+    assert len(_outbox_rows()) == 2
+
+
+def test_rollups_are_limited_to_the_period(db):
+    [user_id] = _add_users(1)
+    _, start, end = digest.period_bounds(_this_week())
+    rollups = digest.load_rollups([user_id], start - timedelta(days=7), start)
+    assert rollups[user_id] == {'counts': {}, 'visits': 0, 'recent': []}
+    assert digest.load_rollups([user_id], start, end)[user_id]['recent'] == ['Widget 0']
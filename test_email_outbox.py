@@ -0,0 +1,187 @@
+"""
+Tests for the durable email outbox, run against a local SMTP stand-in
+Run with: python -m pytest test_email_outbox.py
+"""
+
+import threading
+import socketserver
+
+import pytest
+
+import app as app_module
+from backend import database
+from backend import email_utils
+from backend import outbox
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Just enough SMTP to accept mail; recipients listed in `reject` get that reply code"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.reject = {}
+        self.greeting = '220 fake ESMTP'
+        self.lock = threading.Lock()
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        self.reply(self.server.greeting)
+        if not self.server.greeting.startswith('220'):
+            return
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().rstrip('\r\n')
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 fake')
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip('<> ')
+                code = self.server.reject.get(address)
+                if code:
+                    self.reply(f'{code} rejected')
+                else:
+                    recipients.append(address)
+                    self.reply('250 ok')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                body = []
+                while True:
+                    data = self.rfile.readline().decode()
+                    if data in ('.\r\n', '.\n', ''):
+                        break
+                    body.append(data)
+                with self.server.lock:
+                    self.server.messages.append((recipients, ''.join(body)))
+                recipients = []
+                self.reply('250 queued')
+            else:
+                # MAIL, RSET, NOOP
+                recipients = [] if command == 'RSET' else recipients
+                self.reply('250 ok')
+
+
+@pytest.fixture
+def smtp(db, monkeypatch):
+    monkeypatch.setattr(outbox, 'OUTBOX_AUTOSTART', False)
+    monkeypatch.setattr(outbox, 'OUTBOX_RETRY_DELAY', 0)
+
+    server = FakeSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(email_utils, 'GMAIL_ADDRESS', 'noreply@example.com')
+    monkeypatch.setattr(email_utils, 'SMTP_HOST', '127.0.0.1')
+    monkeypatch.setattr(email_utils, 'SMTP_PORT', server.server_address[1])
+    monkeypatch.setattr(email_utils, 'SMTP_USE_SSL', False)
+    monkeypatch.setattr(email_utils, 'SMTP_AUTH', False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _status(message_id):
+    with database.get_db() as conn:
+        return dict(conn.execute('SELECT * FROM email_outbox WHERE id = ?', (message_id,)).fetchone())
+
+
+def test_batch_reuses_one_connection(smtp):
+    ids = [outbox.enqueue_email(f'user{i}@example.com', 'Hi', '<p>hi</p>') for i in range(5)]
+    assert smtp.connections == 0
+
+    assert outbox.process_outbox() == {'sent': 5, 'retry': 0, 'dead': 0}
+    assert smtp.connections == 1
+    assert [recipients for recipients, _ in smtp.messages] == [[f'user{i}@example.com'] for i in range(5)]
+    assert all(_status(i)['status'] == 'sent' for i in ids)
+    assert outbox.process_outbox() == {'sent': 0, 'retry': 0, 'dead': 0}
+
+
+def test_temporary_failure_retries_then_dead_letters(smtp, monkeypatch):
+    monkeypatch.setattr(outbox, 'OUTBOX_MAX_ATTEMPTS', 2)
+    smtp.reject['busy@example.com'] = 451
+    message_id = outbox.enqueue_email('busy@example.com', 'Hi', '<p>hi</p>')
+    ok_id = outbox.enqueue_email('ok@example.com', 'Hi', '<p>hi</p>')
+
+    assert outbox.process_outbox() == {'sent': 1, 'retry': 1, 'dead': 0}
+    assert _status(ok_id)['status'] == 'sent'
+    assert _status(message_id)['status'] == 'pending'
+
+    assert outbox.process_outbox() == {'sent': 0, 'retry': 0, 'dead': 1}
+    dead = outbox.get_dead_letters()
+    assert dead[0]['id'] == message_id and '451' in dead[0]['last_error']
+
+    del smtp.reject['busy@example.com']
+    assert outbox.requeue_dead() == 1
+    assert outbox.process_outbox()['sent'] == 1
+
+
+def test_permanent_rejection_is_dead_immediately(smtp):
+    smtp.reject['nobody@example.com'] = 550
+    message_id = outbox.enqueue_email('nobody@example.com', 'Hi', '<p>hi</p>')
+    assert outbox.process_outbox() == {'sent': 0, 'retry': 0, 'dead': 1}
+    assert _status(message_id)['attempts'] == 1
+
+
+def test_unreachable_server_keeps_mail_pending(smtp, monkeypatch):
+    monkeypatch.setattr(email_utils, 'SMTP_PORT', 1)
+    message_id = outbox.enqueue_email('user@example.com', 'Hi', '<p>hi</p>')
+    assert outbox.process_outbox() == {'sent': 0, 'retry': 1, 'dead': 0}
+    assert _status(message_id)['status'] == 'pending'
+    assert outbox.seconds_until_due() == 0
+
+
+def test_refused_connection_retries_the_whole_batch(smtp):
+    smtp.greeting = '554 no SMTP service here'
+    ids = [outbox.enqueue_email(f'user{i}@example.com', 'Hi', '<p>hi</p>') for i in range(3)]
+    assert outbox.process_outbox() == {'sent': 0, 'retry': 3, 'dead': 0}
+    assert all(_status(i)['status'] == 'pending' and '554' in _status(i)['last_error'] for i in ids)
+
+    smtp.greeting = '220 fake ESMTP'
+    assert outbox.process_outbox() == {'sent': 3, 'retry': 0, 'dead': 0}
+
+
+def test_stale_claims_are_reclaimed(smtp, monkeypatch):
+    message_id = outbox.enqueue_email('user@example.com', 'Hi', '<p>hi</p>')
+    assert [row['id'] for row in outbox.claim_batch()] == [message_id]
+    assert outbox.claim_batch() == []
+    monkeypatch.setattr(outbox, 'OUTBOX_CLAIM_TIMEOUT', -1)
+    assert outbox.process_outbox()['sent'] == 1
+
+
+def test_signup_only_enqueues(smtp):
+    client = app_module.app.test_client()
+    resp = client.post('/signup', json={'name': 'Ann', 'email': 'ann@example.com',
+                                        'password': 'Sec!ret123', 'password_confirm': 'Sec!ret123'})
+    assert resp.status_code == 201
+    assert smtp.connections == 0
+    assert outbox.outbox_stats() == {'pending': 1}
+
+    outbox.process_outbox()
+    [(recipients, body)] = smtp.messages
+    assert recipients == ['ann@example.com'] and 'Verify' in body
+
+
+def test_background_sender_drains_queue(smtp, monkeypatch):
+    monkeypatch.setattr(outbox, 'OUTBOX_AUTOSTART', True)
+    sender = outbox.OutboxSender()
+    monkeypatch.setattr(outbox, 'sender', sender)
+    outbox.enqueue_email('user@example.com', 'Hi', '<p>hi</p>')
+    for _ in range(200):
+        if sender._thread is None:
+            break
+        threading.Event().wait(0.01)
+    assert sender._thread is None
+    assert outbox.outbox_stats() == {'sent': 1}
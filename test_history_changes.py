@@ -0,0 +1,92 @@
+"""
+Tests for the incremental history change feed
+Run with: python -m pytest test_history_changes.py
+"""
+
+import pytest
+
+from backend import database
+from backend import history
+
+
+@pytest.fixture
+def client(user_client):
+    return user_client
+
+
+def _log(user_id=1, action_type='click'):
+    return history.log_user_activity(user_id, '/pitch', 'Pitch', action_type, metadata={'k': 'v'})
+
+
+def test_grouped_history_includes_cursor(client):
+    assert client.get('/api/history/grouped').json['cursor'] == 0
+    _log()
+    assert client.get('/api/history/grouped').json['cursor'] > 0
+
+
+def test_changes_after_cursor(client):
+    first = _log()
+    cursor = client.get('/api/history/grouped').json['cursor']
+    second = _log()
+    _log(user_id=2)
+    history.delete_history_item(1, first)
+
+    feed = client.get(f'/api/history/changes?since={cursor}').json
+    assert [item['id'] for item in feed['inserts']] == [second]
+    assert feed['inserts'][0]['metadata'] == {'k': 'v'}
+    assert feed['deletes'] == [first]
+    assert not feed['reset'] and not feed['has_more']
+
+    again = client.get(f"/api/history/changes?since={feed['cursor']}").json
+    assert again['inserts'] == [] and again['deletes'] == []
+
+
+def test_insert_then_delete_is_a_tombstone(client):
+    record_id = _log()
+    history.delete_history_item(1, record_id)
+    feed = client.get('/api/history/changes?since=0').json
+    assert feed['inserts'] == []
+    assert feed['deletes'] == [record_id]
+
+
+def test_paging_with_has_more(client):
+    ids = [_log() for _ in range(5)]
+    feed = client.get('/api/history/changes?since=0&limit=3').json
+    assert feed['has_more']
+    rest = client.get(f"/api/history/changes?since={feed['cursor']}&limit=3").json
+    assert not rest['has_more']
+    assert sorted(i['id'] for i in feed['inserts'] + rest['inserts']) == ids
+
+
+def test_pruned_cursor_requires_reset(client, monkeypatch):
+    _log()
+    with database.get_db() as conn:
+        conn.execute("UPDATE history_changes SET changed_at = '2000-01-01T00:00:00'")
+        conn.commit()
+    database.init_database()
+
+    assert client.get('/api/history/changes?since=0').json['reset']
+    cursor = client.get('/api/history/grouped').json['cursor']
+    assert not client.get(f'/api/history/changes?since={cursor}').json['reset']
+
+
+def test_change_log_is_pruned_while_running(client, monkeypatch):
+    _log()
+    with database.get_db() as conn:
+        conn.execute("UPDATE history_changes SET changed_at = '2000-01-01T00:00:00'")
+        conn.commit()
+    _log()
+    with database.get_db() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM history_changes').fetchone()[0] == 2
+
+    monkeypatch.setattr(history, '_last_changes_prune', 0.0)
+    latest = _log()
+    with database.get_db() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM history_changes').fetchone()[0] == 2
+    assert client.get('/api/history/changes?since=0').json['reset']
+    feed = client.get('/api/history/changes?since=1').json
+    assert not feed['reset'] and latest in [item['id'] for item in feed['inserts']]
+
+
+def test_since_is_required(client):
+    assert client.get('/api/history/changes').status_code == 400
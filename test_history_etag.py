@@ -0,0 +1,54 @@
+"""
+Tests for ETag / 304 handling on the history APIs
+Run with: python -m pytest test_history_etag.py
+"""
+
+import pytest
+
+import app as app_module
+from backend import database
+from backend import history
+
+
+@pytest.fixture
+def client(user_client):
+    return user_client
+
+
+def test_version_is_bumped_on_insert_and_delete(client):
+    assert database.get_history_version(1) == 0
+    record_id = history.log_user_activity(1, '/pitch', 'Pitch', 'click')
+    assert database.get_history_version(1) == 1
+    history.delete_history_item(1, record_id)
+    assert database.get_history_version(1) == 2
+    assert database.get_history_version(2) == 0
+
+
+def test_grouped_history_returns_304_without_querying(client, monkeypatch):
+    history.log_user_activity(1, '/pitch', 'Pitch', 'click')
+    first = client.get('/api/history/grouped')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and not etag.startswith('W/')
+
+    def fail(*args, **kwargs):
+        raise AssertionError('history was queried')
+
+    monkeypatch.setattr(app_module, 'get_user_grouped_history', fail)
+    second = client.get('/api/history/grouped', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+
+
+def test_etag_changes_after_write(client):
+    etag = client.get('/api/history/grouped').headers['ETag']
+    history.log_user_activity(1, '/pitch', 'Pitch', 'click')
+    resp = client.get('/api/history/grouped', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+def test_filtered_history_etag_depends_on_filters(client):
+    a = client.get('/api/history?platform=LinkedIn').headers['ETag']
+    b = client.get('/api/history?platform=TikTok').headers['ETag']
+    assert a != b
+    assert client.get('/api/history?platform=LinkedIn', headers={'If-None-Match': a}).status_code == 304
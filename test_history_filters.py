@@ -0,0 +1,80 @@
+"""
+Tests for metadata filtering on user_history generated columns
+Run with: python -m pytest test_history_filters.py
+"""
+
+import pytest
+
+from backend import database
+from backend import history
+
+
+def _log_samples():
+    history.log_user_activity(1, '/api/generate-campaign', 'Campaign Generator', 'campaign_generated',
+                              metadata={'product': 'Widget', 'audience': 'Developers', 'platform': 'LinkedIn', 'result': 'x'})
+    history.log_user_activity(1, '/api/generate-campaign', 'Campaign Generator', 'campaign_generated',
+                              metadata={'product': 'Gadget', 'audience': 'Students', 'platform': 'TikTok', 'result': 'y'})
+    history.log_user_activity(1, '/api/score-lead', 'Lead Scorer', 'lead_scored',
+                              metadata={'name': 'Acme', 'budget': '10k', 'need': 'CRM', 'urgency': 'High', 'result': 'z'})
+    history.log_user_activity(2, '/api/generate-campaign', 'Campaign Generator', 'campaign_generated',
+                              metadata={'product': 'Widget', 'audience': 'Developers', 'platform': 'LinkedIn', 'result': 'w'})
+
+
+def test_filter_by_platform_returns_only_matching_rows(db):
+    _log_samples()
+    rows = history.filter_user_history(1, {'platform': 'LinkedIn'})
+    assert len(rows) == 1
+    assert rows[0]['metadata']['product'] == 'Widget'
+
+
+def test_filter_by_lead_fields(db):
+    _log_samples()
+    rows = history.filter_user_history(1, {'lead_name': 'Acme', 'urgency': 'High'})
+    assert [r['action_type'] for r in rows] == ['lead_scored']
+
+
+def test_invalid_metadata_does_not_break_filters(db):
+    with database.get_db() as conn:
+        conn.execute('''
+            INSERT INTO user_history (user_id, page_url, page_title, action_type, metadata, timestamp)
+            VALUES (1, '/x', 'X', 'click', 'not json', '2024-01-01T00:00:00')
+        ''')
+        conn.commit()
+    assert history.filter_user_history(1, {'product': 'Widget'}) == []
+
+
+def test_unknown_filter_is_rejected(db):
+    with pytest.raises(ValueError):
+        history.build_history_filter_query(1, {'result': 'x'})
+
+
+@pytest.mark.parametrize('action_type', [None, 'campaign_generated'])
+@pytest.mark.parametrize('name', sorted(history.HISTORY_FILTERS))
+def test_filters_use_indexes(db, name, action_type):
+    _log_samples()
+    sql, params = history.build_history_filter_query(1, {name: 'value'}, action_type=action_type)
+    with database.get_db() as conn:
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+    column = history.HISTORY_FILTERS[name]
+    assert any(f'USING INDEX idx_history_{column}' in step for step in plan), plan
+    assert not any(step.startswith('SCAN user_history') for step in plan), plan
+    assert not any('USE TEMP B-TREE' in step for step in plan), plan
+
+
+def test_outdated_filter_indexes_are_rebuilt_with_action_type(db):
+    with database.get_db() as conn:
+        conn.execute('DROP INDEX idx_history_meta_platform')
+        conn.execute('CREATE INDEX idx_history_meta_platform ON user_history(user_id, meta_platform, timestamp DESC)')
+        conn.commit()
+    database.init_database()
+    with database.get_db() as conn:
+        for column in database.HISTORY_METADATA_COLUMNS:
+            indexed = [row[2] for row in conn.execute(f'PRAGMA index_info(idx_history_{column})')]
+            assert indexed == ['user_id', column, 'timestamp', 'action_type']
+
+
+def test_api_limit_is_clamped(user_client):
+    _log_samples()
+    for limit in (-1, 0):
+        resp = user_client.get(f'/api/history?limit={limit}')
+        assert resp.status_code == 200 and len(resp.json['data']) == 1
@@ -0,0 +1,77 @@
+"""
+Tests for live history updates over Server-Sent Events
+Run with: python -m pytest test_history_stream.py
+"""
+
+import json
+
+import pytest
+
+from backend import history
+from backend import live
+
+
+def _log(user_id=1):
+    return history.log_user_activity(user_id, '/pitch', 'Pitch', 'pitch_generated', metadata={'product': 'Widget'})
+
+
+def test_hub_delivers_only_to_the_owning_user(db):
+    hub = live.HistoryHub(poll_interval=3600)
+    mine = hub.subscribe(1)
+    theirs = hub.subscribe(2)
+    record_id = _log(user_id=1)
+
+    assert hub.poll_once() == 1
+    event, data = mine.queue.get_nowait()
+    assert event == 'history'
+    assert [item['id'] for item in data['inserts']] == [record_id]
+    assert data['inserts'][0]['metadata'] == {'product': 'Widget'}
+    assert theirs.queue.empty()
+
+
+def test_idle_poll_is_a_single_lookup(db):
+    hub = live.HistoryHub(poll_interval=3600)
+    hub.subscribe(1)
+    assert hub.poll_once() == 0
+
+
+def test_slow_subscriber_is_bounded(db):
+    hub = live.HistoryHub(poll_interval=3600, buffer_size=2)
+    subscriber = hub.subscribe(1)
+    for _ in range(4):
+        _log()
+        hub.poll_once()
+    assert subscriber.overflowed
+    assert subscriber.queue.qsize() <= 2
+    assert ('resync', {}) in list(subscriber.queue.queue)
+
+
+def test_unsubscribe_removes_user(db):
+    hub = live.HistoryHub(poll_interval=3600)
+    subscriber = hub.subscribe(1)
+    hub.unsubscribe(subscriber)
+    assert hub.subscriber_count() == 0
+
+
+def test_subscribe_reads_the_database_outside_the_lock(db, monkeypatch):
+    hub = live.HistoryHub(poll_interval=3600)
+    monkeypatch.setattr(hub, '_current_seq', lambda: 0 if not hub._lock.locked() else pytest.fail('lock held'))
+    hub.subscribe(1)
+    hub.subscribe(2)
+    assert hub.subscriber_count() == 2
+
+
+def test_stream_replays_changes_since_last_event_id(user_client, monkeypatch):
+    monkeypatch.setattr(live, 'hub', live.HistoryHub(poll_interval=3600))
+    monkeypatch.setattr(live.Subscriber.events, '__defaults__', (0.05, 0.1))
+    record_id = _log()
+
+    resp = user_client.get('/api/history/stream', headers={'Last-Event-ID': '0'})
+    assert resp.mimetype == 'text/event-stream'
+    body = resp.get_data(as_text=True)
+
+    assert body.startswith('retry: 3000')
+    data_line = next(line for line in body.splitlines() if line.startswith('data: '))
+    assert json.loads(data_line[6:])['inserts'][0]['id'] == record_id
+    assert ': heartbeat' in body
+    assert live.hub.subscriber_count() == 0
@@ -0,0 +1,61 @@
+"""
+Tests for the lazy history summaries and item endpoints
+Run with: python -m pytest test_history_summaries.py
+"""
+
+import pytest
+
+from backend import history
+
+
+@pytest.fixture
+def client(user_client):
+    return user_client
+
+
+def _log_campaign(result='x' * 4000, user_id=1):
+    return history.log_user_activity(user_id, '/campaign', 'Campaign', 'campaign_generated',
+                                     metadata={'product': 'Widget', 'audience': 'SMBs', 'result': result})
+
+
+def test_summaries_omit_result_bodies(client):
+    record_id = _log_campaign()
+    [item] = client.get('/api/history/summaries').json['items']
+    assert item['id'] == record_id
+    assert item['metadata'] == {'product': 'Widget', 'audience': 'SMBs'}
+    assert item['has_result'] and item['result_chars'] == 4000
+
+
+def test_summaries_keyset_paging(client):
+    ids = [_log_campaign(result=f'r{i}') for i in range(5)]
+    seen = []
+    page = client.get('/api/history/summaries?limit=2').json
+    while True:
+        seen.extend(item['id'] for item in page['items'])
+        if not page['has_more']:
+            break
+        before_ts, before_id = page['next']
+        page = client.get(f'/api/history/summaries?limit=2&before_ts={before_ts}&before_id={before_id}').json
+    assert seen == sorted(ids, reverse=True)
+
+
+def test_item_returns_full_result_and_revalidates(client):
+    record_id = _log_campaign(result='full body')
+    resp = client.get(f'/api/history/item/{record_id}')
+    assert resp.json['data']['metadata']['result'] == 'full body'
+    assert resp.headers['Cache-Control'] == 'private, no-cache'
+    again = client.get(f'/api/history/item/{record_id}', headers={'If-None-Match': resp.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_item_is_scoped_to_user(client):
+    record_id = _log_campaign(user_id=2)
+    assert client.get(f'/api/history/item/{record_id}').status_code == 404
+
+
+def test_first_page_is_much_smaller_than_grouped(client):
+    for _ in range(100):
+        _log_campaign()
+    grouped = client.get('/api/history/grouped').get_data()
+    summaries = client.get('/api/history/summaries?limit=50').get_data()
+    assert len(summaries) * 10 < len(grouped)
@@ -0,0 +1,110 @@
+"""
+Tests for structured lead scores and the top leads API
+Run with: python -m pytest test_leads.py
+"""
+
+import pytest
+
+import app as app_module
+from backend import database
+from backend import history
+from backend import leads
+
+ANALYSIS = '''## Lead Qualification Score: 82/100
+
+Strong budget, clear need.
+
+```json
+{"score": 82, "conversion_probability": "65%", "readiness": "hot", "budget": 90, "authority": 70, "need": 85, "urgency": 140}
+```
+'''
+
+
+@pytest.fixture
+def client(user_client, sync_tasks, monkeypatch):
+    monkeypatch.setattr(app_module, 'generate_response', lambda prompt, on_usage=None: ANALYSIS)
+    return user_client
+
+
+def _log_lead(user_id, name, score, result='analysis'):
+    scores = leads.validate_lead_score({'score': score, 'conversion_probability': score // 2})
+    return history.log_user_activity(user_id, '/api/score-lead', 'Lead Scorer', 'lead_scored',
+                                     metadata={'name': name, 'result': result, 'scores': scores})
+
+
+def test_split_validates_and_strips_the_json_block():
+    narrative, scores = leads.split_lead_score(ANALYSIS)
+    assert narrative.endswith('Strong budget, clear need.')
+    assert scores == {'score': 82, 'conversion_probability': 65, 'readiness': 'warm',
+                      'budget': 90, 'authority': 70, 'need': 85, 'urgency': None}
+
+
+def test_split_falls_back_to_the_score_in_the_text():
+    assert leads.split_lead_score('Score: 91 - call today')[1]['readiness'] == 'hot'
+    assert leads.split_lead_score('Rated 45 out of 100.\n```json\n{"score": "high"}\n```')[1]['score'] == 45
+    assert leads.split_lead_score('No numbers here') == ('No numbers here', None)
+
+
+def test_score_lead_returns_and_stores_structured_scores(client):
+    resp = client.post('/api/score-lead', json={'name': 'Acme', 'budget': '$50k', 'need': 'CRM',
+                                               'urgency': 'This quarter'})
+    assert resp.json['scores']['score'] == 82
+    assert '```' not in resp.json['result']
+    with database.get_db() as conn:
+        row = conn.execute('SELECT lead_score, lead_conversion, lead_readiness FROM user_history').fetchone()
+    assert tuple(row) == (82, 65, 'warm')
+
+
+def test_top_leads_are_ranked_filtered_and_paginated(client):
+    for name, score in (('A', 95), ('B', 40), ('C', 80), ('D', 80), ('E', 91)):
+        _log_lead(1, name, score)
+    _log_lead(2, 'Other user', 99)
+    history.log_user_activity(1, '/pitch', 'Pitch', 'visit')
+
+    first = client.get('/api/leads/top?limit=3').json
+    assert [item['name'] for item in first['items']] == ['A', 'E', 'D']
+    assert first['items'][0]['readiness'] == 'hot' and first['items'][0]['conversion_probability'] == 47
+    assert first['has_more']
+    score, last_id = first['next']
+    second = client.get(f'/api/leads/top?limit=3&before_score={score}&before_id={last_id}').json
+    assert [item['name'] for item in second['items']] == ['C', 'B'] and not second['has_more']
+
+    hot = client.get('/api/leads/top?readiness=hot').json['items']
+    assert [item['name'] for item in hot] == ['A', 'E']
+    assert client.get('/api/leads/top?min_score=85').json['items'][-1]['score'] == 91
+    assert client.get('/api/leads/top?readiness=lava').status_code == 400
+
+
+def test_top_leads_query_uses_the_partial_indexes(db):
+    for readiness in (None, 'hot'):
+        clauses = "user_id = 1 AND lead_score IS NOT NULL" + (" AND lead_readiness = 'hot'" if readiness else '')
+        with database.get_db() as conn:
+            plan = ' '.join(row[3] for row in conn.execute(f'''
+                EXPLAIN QUERY PLAN SELECT id FROM user_history WHERE {clauses}
+                ORDER BY lead_score DESC, id DESC LIMIT 20
+            '''))
+        assert 'idx_history_top_leads' in plan or 'idx_history_lead_readiness' in plan
+        assert 'TEMP B-TREE' not in plan
+
+
+def test_backfill_scores_legacy_results(client):
+    old_id = history.log_user_activity(1, '/api/score-lead', 'Lead Scorer', 'lead_scored',
+                                       metadata={'name': 'Old', 'result': '**Lead Qualification Score:** 77/100'})
+    history.log_user_activity(1, '/api/score-lead', 'Lead Scorer', 'lead_scored',
+                              metadata={'name': 'Vague', 'result': 'Promising lead.'})
+    version = database.get_history_version(1)
+    cursor = history.get_history_cursor(1)
+    cached = client.get(f'/api/history/item/{old_id}')
+
+    assert leads.backfill_lead_scores(batch_size=1) == (1, 1)
+    assert leads.backfill_lead_scores() == (0, 1)
+    [top] = leads.get_top_leads(1)['items']
+    assert (top['name'], top['score'], top['readiness']) == ('Old', 77, 'warm')
+    assert database.get_history_version(1) > version
+
+    # Cached copies of the item revalidate, and the change feed re-sends it
+    assert cached.headers['Cache-Control'] == 'private, no-cache'
+    fresh = client.get(f'/api/history/item/{old_id}', headers={'If-None-Match': cached.headers['ETag']})
+    assert fresh.status_code == 200 and fresh.json['data']['metadata']['scores']['score'] == 77
+    [changed] = client.get(f'/api/history/changes?since={cursor}').json['inserts']
+    assert changed['id'] == old_id and changed['metadata']['scores']['score'] == 77
@@ -0,0 +1,106 @@
+"""
+Tests for the load-test harness and the fake Groq server options
+Run with: python -m pytest test_loadtest.py
+"""
+
+import random
+import asyncio
+
+import httpx
+import pytest
+
+import asgi
+from backend import email_utils
+from backend import outbox
+from backend import passwords
+from backend import quotas
+from benchmarks import loadtest
+from benchmarks.fake_groq import FakeGroqServer, COMPLETIONS_PATH, ERROR_STATUSES, sample_latency
+
+
+@pytest.fixture
+def groq_server():
+    server = FakeGroqServer(latency=0.01, seed=7).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def app_env(groq_server, db, sync_tasks, monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    monkeypatch.setenv('GROQ_BASE_URL', groq_server.base_url)
+    for name in ('QUOTA_USER_RATE_LIMIT', 'QUOTA_IP_RATE_LIMIT', 'QUOTA_USER_DAILY_TOKENS', 'QUOTA_IP_DAILY_TOKENS'):
+        monkeypatch.setattr(quotas, name, 0)
+    monkeypatch.setattr(email_utils, 'GMAIL_ADDRESS', 'noreply@example.com')
+    monkeypatch.setattr(email_utils, 'GMAIL_APP_PASSWORD', 'x')
+    monkeypatch.setattr(outbox, 'OUTBOX_AUTOSTART', False)
+    # Cheap inline hashing, so signup does not eat the short run (pool start-up alone can take a second)
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_WORKERS', 0)
+    return groq_server
+
+
+def test_latency_distributions():
+    rng = random.Random(1)
+    assert sample_latency(1.5) == 1.5
+    assert sample_latency('0.25') == 0.25
+    assert sample_latency('fixed:2', rng) == 2
+    assert all(0.5 <= sample_latency('uniform:0.5,2', rng) <= 2 for _ in range(100))
+    draws = sorted(sample_latency('lognormal:1,0.5', rng) for _ in range(1001))
+    assert 0.9 < draws[500] < 1.1
+    with pytest.raises(ValueError):
+        sample_latency('pareto:1')
+
+
+def test_fake_groq_injects_errors_and_token_time(groq_server):
+    groq_server.error_rate = 1.0
+    resp = httpx.post(groq_server.base_url + COMPLETIONS_PATH, json={})
+    assert resp.status_code in ERROR_STATUSES
+    assert groq_server.stats['errors'] == 1 and groq_server.stats['completed'] == 0
+
+    groq_server.error_rate = 0.0
+    groq_server.latency = 0
+    groq_server.completion_tokens = 20
+    groq_server.token_rate = 100
+    resp = httpx.post(groq_server.base_url + COMPLETIONS_PATH, json={})
+    assert resp.status_code == 200
+    assert resp.elapsed.total_seconds() >= 0.2
+    assert resp.json()['usage']['completion_tokens'] == 20
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert loadtest.percentile(values, 50) == 50
+    assert loadtest.percentile(values, 99) == 99
+    assert loadtest.percentile([7], 95) == 7
+    assert loadtest.percentile([], 50) is None
+
+
+def test_virtual_users_drive_the_full_mix(app_env):
+    transport = httpx.ASGITransport(app=asgi.app)
+    recorder = asyncio.run(loadtest.run_users('http://test', users=3, duration=1.5, think=0.02,
+                                              seed=3, transport=transport))
+    summary = recorder.summary()
+
+    endpoints = summary['endpoints']
+    assert endpoints['POST /signup']['count'] == 3
+    assert endpoints['POST /login']['count'] >= 3
+    generations = [name for name, _ in loadtest.GENERATIONS]
+    assert any(f'POST {path}' in endpoints for path in generations)
+    assert any(f'GET {path}' in endpoints for path in loadtest.HISTORY_READS)
+    assert summary['errors'] == 0 and summary['rejected'] == 0
+    for stats in endpoints.values():
+        assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms'] <= stats['max_ms']
+    assert summary['throughput_rps'] > 0
+    assert app_env.stats['completed'] > 0
+
+
+def test_compare_reports_per_endpoint_changes():
+    def result(p95, rps):
+        stats = {'p50_ms': 10, 'p95_ms': p95, 'p99_ms': 50, 'throughput_rps': rps}
+        return {'commit': 'abc', 'throughput_rps': rps, 'endpoints': {'GET /': stats}}
+
+    rows = {row['endpoint']: row for row in loadtest.compare(result(20, 100), result(30, 80))}
+    assert rows['GET /']['p95_ms'] == (20, 30)
+    assert rows['total']['throughput_rps'] == (100, 80)
+    assert loadtest._delta(20, 30) == '20 -> 30 +50%'
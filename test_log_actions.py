@@ -0,0 +1,74 @@
+"""
+Tests for the bulk tracker ingestion endpoint
+Run with: python -m pytest test_log_actions.py
+"""
+
+import pytest
+
+import app as app_module
+from backend import database
+from backend.throttle import TokenBucket
+
+
+@pytest.fixture
+def client(user_client, monkeypatch):
+    monkeypatch.setattr(app_module, 'action_throttle', TokenBucket(capacity=5, rate=0))
+    return user_client
+
+
+def _event(action_type='click', **overrides):
+    event = {'action_type': action_type, 'page_url': '/campaign', 'page_title': 'Campaign',
+             'metadata': {'element_id': 'generate'}}
+    event.update(overrides)
+    return event
+
+
+def _action_types():
+    with database.get_db() as conn:
+        return [r[0] for r in conn.execute('SELECT action_type FROM user_history ORDER BY id')]
+
+
+def test_batch_is_written(client):
+    resp = client.post('/api/history/log-action', json={'events': [_event(), _event('submit')]})
+    assert resp.status_code == 200
+    assert resp.json['accepted'] == 2
+    assert _action_types() == ['click', 'submit']
+
+
+def test_invalid_events_are_rejected(client):
+    events = [
+        _event(),
+        _event('campaign_generated'),
+        _event(page_url='https://evil.example/'),
+        _event(metadata={'blob': 'x' * 5000}),
+        'not an event',
+    ]
+    resp = client.post('/api/history/log-action', json={'events': events})
+    assert resp.json['accepted'] == 1
+    assert resp.json['rejected'] == 4
+
+
+def test_beacon_body_without_json_content_type(client):
+    resp = client.post('/api/history/log-action', data='{"events": [{"action_type": "click", "page_url": "/pitch"}]}',
+                       content_type='text/plain')
+    assert resp.json['accepted'] == 1
+
+
+def test_session_is_throttled(client):
+    resp = client.post('/api/history/log-action', json={'events': [_event()] * 4})
+    assert resp.json['accepted'] == 4
+    resp = client.post('/api/history/log-action', json={'events': [_event()] * 4})
+    assert resp.json['accepted'] == 1
+    assert resp.json['throttled'] == 3
+    resp = client.post('/api/history/log-action', json={'events': [_event()]})
+    assert resp.status_code == 429
+
+
+def test_oversized_batch_is_refused(client):
+    resp = client.post('/api/history/log-action', json={'events': [_event()] * 51})
+    assert resp.status_code == 400
+
+
+def test_requires_login():
+    client = app_module.app.test_client()
+    assert client.post('/api/history/log-action', json={'events': []}).status_code == 401
@@ -0,0 +1,88 @@
+"""
+Tests for the Prometheus-style /metrics endpoint
+Run with: python -m pytest test_metrics.py
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from backend import database
+from backend import metrics
+
+
+def _sample(text, prefix):
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def test_endpoint_and_db_operation_are_recorded(client):
+    client.get('/login')
+    database.get_user_by_email('nobody@example.com')
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert '# TYPE marketmind_http_request_duration_seconds histogram' in text
+    assert _sample(text, 'marketmind_http_requests_total{endpoint="login_page",method="GET",status="200"}') >= 1
+    assert _sample(text, 'marketmind_db_operation_duration_seconds_count{operation="get_user_by_email"}') >= 1
+    assert _sample(text, 'marketmind_template_render_duration_seconds_count{template="login.html"}') >= 1
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = metrics.Histogram('test_latency_seconds', 'test', ('op',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        hist.observe(value, op='x')
+    text = metrics.render()
+    assert _sample(text, 'test_latency_seconds_bucket{op="x",le="0.1"}') == 2
+    assert _sample(text, 'test_latency_seconds_bucket{op="x",le="1.0"}') == 3
+    assert _sample(text, 'test_latency_seconds_bucket{op="x",le="+Inf"}') == 4
+    assert _sample(text, 'test_latency_seconds_count{op="x"}') == 4
+    assert _sample(text, 'test_latency_seconds_sum{op="x"}') == pytest.approx(5.65)
+
+
+def test_snapshots_from_all_workers_are_summed(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    counter = metrics.Counter('test_worker_events_total', 'test', ('kind',))
+    counter.inc(3, kind='a')
+
+    other_worker = {'test_worker_events_total': {'type': 'counter', 'samples': {json.dumps(['a']): 4}}}
+    (tmp_path / f'metrics_{os.getppid()}_1000.json').write_text(json.dumps(other_worker))
+
+    assert _sample(metrics.render(), 'test_worker_events_total{kind="a"}') == 7
+
+
+def test_counters_never_decrease_when_a_worker_exits(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    counter = metrics.Counter('test_exited_events_total', 'test')
+    histogram = metrics.Histogram('test_exited_latency_seconds', 'test', buckets=(1.0,))
+    counter.inc(1)
+    worker = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+
+    def snapshot(count):
+        return json.dumps({
+            'test_exited_events_total': {'type': 'counter', 'samples': {'[]': count}},
+            'test_exited_latency_seconds': {'type': 'histogram', 'samples': {'[]': [count, 0, 0.5 * count]}},
+        })
+    (tmp_path / f'metrics_{worker.pid}_1000.json').write_text(snapshot(50))
+    before = metrics.render()
+    assert _sample(before, 'test_exited_events_total') == 51
+    assert _sample(before, 'test_exited_latency_seconds_count') == 50
+
+    worker.kill()
+    worker.wait()
+    # The restarted worker reuses the PID and starts counting from zero
+    (tmp_path / f'metrics_{worker.pid}_2000.json').write_text(snapshot(2))
+    after = metrics.render()
+    assert _sample(after, 'test_exited_events_total') == 53
+    assert _sample(after, 'test_exited_latency_seconds_count') == 52
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
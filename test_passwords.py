@@ -0,0 +1,108 @@
+"""
+Tests for off-thread password hashing and login throttling
+Run with: python -m pytest test_passwords.py
+"""
+
+import os
+import threading
+
+import pytest
+
+import app as app_module
+from backend import auth
+from backend import database
+from backend import passwords
+from backend.throttle import SharedWindowCounter
+
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+@pytest.fixture
+def client(client, db, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_METHOD', FAST_METHOD)
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_WORKERS', 0)
+    db.create_user('Ann', 'ann@example.com', passwords.hash_password('Sec!ret123'))
+    return client
+
+
+def _login(client, password, email='ann@example.com', ip='10.0.0.1'):
+    return client.post('/login', json={'email': email, 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_hashing_runs_on_process_pool(monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_METHOD', FAST_METHOD)
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_WORKERS', 1)
+    password_hash = passwords.hash_password('Sec!ret123')
+    assert password_hash.startswith(FAST_METHOD + '$')
+    assert passwords.verify_password(password_hash, 'Sec!ret123')
+    assert not passwords.verify_password(password_hash, 'wrong')
+    assert passwords._pool is not None and passwords._pool_pid == os.getpid()
+
+
+def test_saturated_pool_sheds_load(client, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_WORKERS', 1)
+    monkeypatch.setattr(passwords, '_slots', threading.BoundedSemaphore(1))
+    passwords._slots.acquire()
+    resp = _login(client, 'Sec!ret123')
+    assert resp.status_code == 503 and resp.headers['Retry-After']
+
+
+def test_login_rehashes_outdated_hash(client, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:2000')
+    assert _login(client, 'Sec!ret123').status_code == 200
+    stored = database.get_user_by_email('ann@example.com')['password_hash']
+    assert stored.startswith('pbkdf2:sha256:2000$')
+    assert not passwords.needs_rehash(stored)
+
+
+def test_login_succeeds_when_the_rehash_finds_the_pool_full(client, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:2000')
+
+    def busy(password):
+        raise passwords.HashingBusy('Too many password checks in progress, try again shortly')
+    monkeypatch.setattr(auth, 'hash_password', busy)
+    assert _login(client, 'Sec!ret123').status_code == 200
+    stored = database.get_user_by_email('ann@example.com')['password_hash']
+    assert stored.startswith(FAST_METHOD + '$')
+
+
+def test_failed_logins_lock_the_email(client):
+    for _ in range(5):
+        assert _login(client, 'wrong').status_code == 401
+    resp = _login(client, 'Sec!ret123', ip='10.0.0.2')
+    assert resp.status_code == 429 and int(resp.headers['Retry-After']) > 0
+
+
+def test_successful_login_clears_failures(client):
+    for _ in range(4):
+        _login(client, 'wrong')
+    assert _login(client, 'Sec!ret123').status_code == 200
+    with client.session_transaction() as sess:
+        sess.clear()
+    assert _login(client, 'wrong').status_code == 401
+
+
+def test_ip_limit_applies_across_emails(client, monkeypatch):
+    monkeypatch.setattr(app_module.login_ip_limiter, 'limit', 3)
+    for i in range(3):
+        assert _login(client, 'x', email=f'user{i}@example.com').status_code == 401
+    assert _login(client, 'Sec!ret123').status_code == 429
+    assert _login(client, 'Sec!ret123', ip='10.0.0.9').status_code == 200
+
+
+def test_counters_are_shared_between_instances(client):
+    first = SharedWindowCounter('shared', limit=2, window=60)
+    second = SharedWindowCounter('shared', limit=2, window=60)
+    first.hit('k')
+    second.hit('k')
+    assert first.retry_after('k') > 0 and second.retry_after('k') > 0
+    second.reset('k')
+    assert first.retry_after('k') == 0
+
+
+def test_calibrate_picks_method_within_target():
+    method, elapsed_ms = passwords.calibrate(target_ms=1, algorithm='scrypt')
+    assert method == 'scrypt:16384:8:1' and elapsed_ms > 0
+    method, _ = passwords.calibrate(target_ms=50, algorithm='pbkdf2')
+    assert method.startswith('pbkdf2:sha256:')
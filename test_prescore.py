@@ -0,0 +1,147 @@
+"""
+Tests for local lead pre-scoring
+Run with: python -m pytest test_prescore.py
+"""
+
+import json
+import time
+import asyncio
+
+import httpx
+import pytest
+
+import app as app_module
+import asgi
+from backend import history
+from backend import leads
+from backend import prescore
+from backend import quotas
+from backend.metrics import lead_prescore_total
+from benchmarks import replay
+
+COLD = {'name': 'Cold Co', 'budget': 'None yet', 'need': 'Just browsing', 'urgency': 'No rush'}
+HOT = {'name': 'Hot Co', 'budget': '$50k-$100k annual', 'need': 'Critical: manual reporting', 'urgency': 'Immediate'}
+
+
+@pytest.fixture
+def client(user_client, sync_tasks, limiter, monkeypatch):
+    calls = []
+
+    def fake_generate(prompt, on_usage=None):
+        calls.append(prompt)
+        return 'Lead Qualification Score: 88/100'
+
+    monkeypatch.setattr(app_module, 'generate_response', fake_generate)
+    user_client.calls = calls
+    return user_client
+
+
+def _avoided():
+    return lead_prescore_total._values.get(('avoided',), 0)
+
+
+def _escalated():
+    return lead_prescore_total._values.get(('escalated',), 0)
+
+
+def test_rules_score_each_dimension():
+    results = prescore.prescore_leads([
+        COLD,
+        HOT,
+        {'budget': 'Not approved', 'need': 'no pain right now', 'urgency': 'not urgent'},
+        {'budget': '$2,000/month', 'need': 'Exploring options', 'urgency': 'within 3 weeks'},
+        {'budget': 'fiscal year TBD', 'need': 'something', 'urgency': 'whenever'},
+    ])
+    subscores = [(r['budget'], r['need'], r['urgency']) for r in results]
+    assert subscores == [(0, 10, 5), (95, 95, 95), (20, 10, 5), (70, 45, 80), (None, None, None)]
+    assert [r['escalate'] for r in results] == [False, True, False, True, True]
+    assert results[1]['readiness'] == 'hot' and results[4]['score'] == prescore.UNKNOWN_SUBSCORE
+    assert all(leads.validate_lead_score(r)['readiness'] == r['readiness'] for r in results)
+
+
+def test_batch_matches_scoring_one_at_a_time():
+    batch = [COLD, HOT, {'budget': 'High', 'need': 'Important', 'urgency': 'Short-term'}] * 50 + [{}]
+    scored = prescore.prescore_leads(batch, threshold=60)
+    assert scored == [prescore.prescore_leads([lead], threshold=60)[0] for lead in batch]
+    assert [r['escalate'] for r in scored[:3]] == [False, True, True]
+
+
+def test_cold_lead_is_answered_without_the_llm(client, limiter):
+    avoided = _avoided()
+    resp = client.post('/api/score-lead', json=COLD)
+    assert resp.status_code == 200 and resp.json['prescored']
+    assert resp.json['scores']['readiness'] == 'cold'
+    assert resp.json['result'].startswith('## Lead Qualification Score: 4/100 (provisional)')
+    assert client.calls == [] and _avoided() == avoided + 1
+    # One request-rate slot, no tokens
+    rate, _, _, used = limiter._usage('user:1', time.time())
+    assert (rate, used) == (1, 0)
+
+    [item] = history.get_user_history(1)
+    metadata = json.loads(item['metadata'])
+    assert metadata['prescored'] and metadata['scores']['score'] == 4
+    assert leads.get_top_leads(1)['items'][0]['name'] == 'Cold Co'
+
+
+def test_promising_and_forced_leads_reach_the_llm(client, monkeypatch):
+    resp = client.post('/api/score-lead', json=HOT)
+    assert resp.json['scores']['score'] == 88 and 'prescored' not in resp.json
+    monkeypatch.setattr(prescore, 'LEAD_PRESCORE_THRESHOLD', 0)
+    client.post('/api/score-lead', json=COLD)
+    assert len(client.calls) == 2
+
+
+def test_local_answers_use_the_request_rate_but_no_tokens(client, limiter, monkeypatch):
+    monkeypatch.setattr(quotas, 'QUOTA_USER_RATE_LIMIT', 3)
+    monkeypatch.setattr(quotas, 'QUOTA_USER_DAILY_TOKENS', 1)
+    limiter.check(1, None).charge(1, 1)
+    resp = client.post('/api/score-lead', json=HOT)
+    assert resp.status_code == 429 and resp.json['quota'] == 'tokens'
+    assert [client.post('/api/score-lead', json=COLD).status_code for _ in range(3)] == [200, 200, 429]
+    assert client.post('/api/leads/prescore', json={'leads': [COLD]}).status_code == 429
+    assert client.calls == [] and len(history.get_user_history(1)) == 2
+
+
+def test_escalations_are_counted_once_the_llm_is_called(client, limiter, monkeypatch):
+    escalated, avoided = _escalated(), _avoided()
+    assert client.post('/api/score-lead', json=dict(HOT, name='')).status_code == 400
+    monkeypatch.setattr(quotas, 'QUOTA_USER_RATE_LIMIT', 1)
+    assert client.post('/api/score-lead', json=HOT).status_code == 200
+    assert client.post('/api/score-lead', json=HOT).status_code == 429
+    assert client.post('/api/score-lead', json=COLD).status_code == 429
+    assert (_escalated(), _avoided()) == (escalated + 1, avoided)
+
+
+def test_bulk_prescore_endpoint(client):
+    resp = client.post('/api/leads/prescore', json={'leads': [COLD, HOT, HOT]})
+    assert (resp.json['escalated'], resp.json['local']) == (2, 1)
+    assert [item['escalate'] for item in resp.json['items']] == [False, True, True]
+    assert client.post('/api/leads/prescore', json={'leads': 'nope'}).status_code == 400
+    too_many = {'leads': [COLD] * (prescore.MAX_PRESCORE_BATCH + 1)}
+    assert client.post('/api/leads/prescore', json=too_many).status_code == 400
+    assert client.calls == []
+
+
+def test_replay_keeps_locally_answered_leads_cold():
+    entry = {'r': 'POST /api/score-lead', 's': 200, 'f': {'name': 10, 'budget': 30, 'need': 30, 'urgency': 30}}
+    body = replay.synthesize_body(entry)
+    assert len(body['budget']) == 30
+    assert not prescore.prescore_leads([body])[0]['escalate']
+    assert prescore.prescore_leads([replay.synthesize_body(dict(entry, l=[{'h': 'ab12'}]))])[0]['escalate']
+
+
+def test_async_endpoint_answers_cold_leads_locally(client, monkeypatch):
+    monkeypatch.setattr(quotas, 'QUOTA_USER_RATE_LIMIT', 1)
+    serializer = asgi.flask_app.session_interface.get_signing_serializer(asgi.flask_app)
+    cookies = {asgi.flask_app.config['SESSION_COOKIE_NAME']: serializer.dumps({'logged_in_user_id': 1})}
+
+    async def post():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', cookies=cookies) as http:
+            return [await http.post('/api/score-lead', json=COLD) for _ in range(2)]
+
+    resp, limited = asyncio.run(post())
+    assert resp.status_code == 200 and resp.json()['prescored']
+    assert limited.status_code == 429 and limited.json()['quota'] == 'rate'
+    [item] = history.get_user_history(1)
+    assert json.loads(item['metadata'])['scores']['readiness'] == 'cold'
@@ -0,0 +1,62 @@
+"""
+Tests for the admin profiling endpoints
+Run with: python -m pytest test_profiling.py
+"""
+
+import threading
+
+import pytest
+
+from backend import database
+from backend import profiling
+
+
+@pytest.fixture
+def client(client, db, login, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILING_ENABLED', True)
+    monkeypatch.setenv('ADMIN_EMAILS', 'admin@example.com')
+    return login(client, db.create_user('Admin', 'admin@example.com', 'x'))
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_disabled_by_default(client, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILING_ENABLED', False)
+    assert client.get('/admin/profile/cpu?duration=0').status_code == 404
+
+
+def test_requires_admin(client, login):
+    login(client, database.create_user('User', 'user@example.com', 'x'))
+    assert client.get('/admin/profile/cpu?duration=0').status_code == 403
+
+
+def test_cpu_profile_returns_collapsed_stacks(client):
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name='busy-worker')
+    worker.start()
+    try:
+        resp = client.get('/admin/profile/cpu?duration=0.2&interval=0.01')
+    finally:
+        stop.set()
+        worker.join()
+
+    text = resp.get_data(as_text=True)
+    busy = [line for line in text.splitlines() if line.startswith('thread:busy-worker;')]
+    assert busy and '_busy_loop (test_profiling.py' in busy[0]
+    assert int(busy[0].rsplit(' ', 1)[1]) >= 1
+
+
+def test_memory_snapshot_and_diff(client):
+    assert client.get('/admin/profile/memory/diff').status_code == 409
+    client.post('/admin/profile/memory/start')
+    try:
+        assert client.get('/admin/profile/memory/snapshot').json['success']
+        hoard = [bytearray(1024) for _ in range(2000)]
+        diff = client.get('/admin/profile/memory/diff').json
+        assert any('test_profiling.py' in row['location'] and row['size_diff_kb'] > 1000 for row in diff['top'])
+        del hoard
+    finally:
+        client.post('/admin/profile/memory/stop')
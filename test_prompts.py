@@ -0,0 +1,85 @@
+"""
+Tests for the prompt template registry and its token budgets
+Run with: python -m pytest test_prompts.py
+"""
+
+import json
+
+import pytest
+
+import app as app_module
+from backend import history
+from backend import prompts
+
+DESCRIPTION = '\n\n'.join(
+    ' '.join(f'Paragraph {p} sentence {s} describes the product in some detail.' for s in range(40))
+    for p in range(30)
+)
+
+
+@pytest.fixture
+def client(user_client, sync_tasks, monkeypatch):
+    sent = []
+
+    def fake_generate(prompt, on_usage=None):
+        sent.append(prompt)
+        return 'Pitch.'
+
+    monkeypatch.setattr(app_module, 'generate_response', fake_generate)
+    user_client.sent = sent
+    return user_client
+
+
+def test_short_inputs_render_unchanged():
+    prompt = prompts.lead_scoring_prompt('Ann', '$5k {per month}', 'CRM', 'Now')
+    assert prompt.template_id == 'lead_score@1' and prompt.truncated == ()
+    assert '- Budget Information: $5k {per month}\n' in prompt
+    assert '{"score": 0,' in prompt
+    assert prompt.tokens == prompts.estimate_tokens(prompt)
+
+
+def test_long_fields_are_cut_to_the_budget():
+    prompt = prompts.campaign_prompt(DESCRIPTION, 'Marketing managers', 'x' * 1000)
+    assert prompt.truncated == ('platform', 'product')
+    assert 'Target Audience: Marketing managers\n' in prompt
+    product = prompt.split('Product/Service: ')[1].split('\nTarget Audience')[0]
+    assert prompts.estimate_tokens(product) <= 800 and product.endswith(prompts.TRUNCATION_MARK)
+    # Lead sentences of every paragraph survive, in order
+    assert all(f'Paragraph {p} sentence 0 ' in product for p in range(30))
+    assert product.index('Paragraph 3 sentence 1 ') < product.index('Paragraph 4 sentence 0 ')
+    assert prompt.split('Marketing Platform: ')[1].startswith('x' * 200)
+
+    tight = prompts.render('pitch', {'product': DESCRIPTION, 'persona': DESCRIPTION[:2000]}, budget=600)
+    product, persona = tight.split('Product/Solution: ')[1].split('\n\nEnsure')[0].split('\nCustomer Persona: ')
+    assert prompts.estimate_tokens(product) <= 300 and prompts.estimate_tokens(persona) <= 300
+
+
+def test_allocation_keeps_small_fields_whole():
+    sizes = {'a': 50, 'b': 2000, 'c': 900, 'fixed': 100}
+    caps = {'a': 300, 'b': 1000, 'c': 1000, 'fixed': None}
+    assert prompts._allocate(sizes, caps, 1000) == {'a': 50, 'b': 425, 'c': 425}
+    assert prompts._allocate(sizes, caps, 5000) == {'a': 50, 'b': 1000, 'c': 900}
+
+
+def test_versions_can_be_pinned(monkeypatch):
+    monkeypatch.setitem(prompts.TEMPLATES, 'pitch', dict(prompts.TEMPLATES['pitch']))
+    prompts.register(prompts.PromptTemplate('pitch', 2, 'Pitch {product} to {persona}.',
+                                            {'product': (100, 'extract'), 'persona': (50, 'truncate')}))
+    assert prompts.sales_prompt('CRM', 'CFO') == 'Pitch CRM to CFO.'
+    assert prompts.sales_prompt('CRM', 'CFO').template_id == 'pitch@2'
+    monkeypatch.setattr(prompts, '_pinned', prompts._parse_pins('pitch=1, campaign=x'))
+    assert prompts.sales_prompt('CRM', 'CFO').template_id == 'pitch@1'
+    with pytest.raises(ValueError):
+        prompts.get_template('pitch', 7)
+    with pytest.raises(ValueError):
+        prompts.PromptTemplate('x', 1, '{a}', {'a': (10, 'summarize')})
+
+
+def test_generation_records_the_template_version(client):
+    resp = client.post('/api/generate-pitch', json={'product': DESCRIPTION, 'persona': 'CFO'})
+    assert resp.status_code == 200
+    [prompt] = client.sent
+    assert prompt.truncated == ('product',) and prompt.tokens < 1200
+    [item] = history.get_user_history(1)
+    metadata = json.loads(item['metadata'])
+    assert metadata['template'] == 'pitch@1' and metadata['product'] == DESCRIPTION
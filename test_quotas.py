@@ -0,0 +1,124 @@
+"""
+Tests for per-user and per-IP generation quotas
+Run with: python -m pytest test_quotas.py
+"""
+
+import pytest
+
+import app as app_module
+from backend import database
+from backend import quotas
+
+PITCH = {'product': 'Widget', 'persona': 'CTO'}
+
+
+def fake_generate_response(prompt, on_usage=None):
+    if on_usage:
+        on_usage(300, 200)
+    return 'Pitch'
+
+
+@pytest.fixture
+def limiter(limiter, monkeypatch):
+    monkeypatch.setattr(app_module, 'generate_response', fake_generate_response)
+    monkeypatch.setattr(quotas, 'QUOTA_USER_RATE_LIMIT', 3)
+    monkeypatch.setattr(quotas, 'QUOTA_USER_DAILY_TOKENS', 1000)
+    monkeypatch.setattr(quotas, 'QUOTA_IP_RATE_LIMIT', 100)
+    monkeypatch.setattr(quotas, 'QUOTA_SYNC_INTERVAL', 3600)
+    return limiter
+
+
+@pytest.fixture
+def client(client, limiter, login, monkeypatch):
+    monkeypatch.setenv('ADMIN_EMAILS', 'admin@example.com')
+    client.user_id = database.create_user('Ann', 'ann@example.com', 'x')
+    return login(client, client.user_id)
+
+
+def _pitch(client, ip='10.0.0.1'):
+    return client.post('/api/generate-pitch', json=PITCH, environ_base={'REMOTE_ADDR': ip})
+
+
+def test_rate_limit_returns_429_with_quota_headers(client, monkeypatch):
+    monkeypatch.setattr(quotas, 'QUOTA_USER_DAILY_TOKENS', 0)
+    for _ in range(3):
+        assert _pitch(client).status_code == 200
+    resp = _pitch(client)
+    assert resp.status_code == 429
+    assert resp.json['scope'] == 'user' and resp.json['quota'] == 'rate'
+    assert resp.headers['X-RateLimit-Limit'] == '3' and resp.headers['X-RateLimit-Remaining'] == '0'
+    assert int(resp.headers['Retry-After']) > 0
+
+
+def test_invalid_requests_do_not_use_the_rate_limit(client, monkeypatch):
+    monkeypatch.setattr(quotas, 'QUOTA_USER_DAILY_TOKENS', 0)
+    for path in ('/api/generate-campaign', '/api/generate-pitch', '/api/score-lead') * 2:
+        assert client.post(path, json={'product': 'Widget'}).status_code == 400
+    for _ in range(3):
+        assert _pitch(client).status_code == 200
+    assert _pitch(client).status_code == 429
+
+
+def test_token_budget_is_charged_from_usage(client):
+    assert _pitch(client).status_code == 200
+    assert _pitch(client).status_code == 200
+    resp = _pitch(client)
+    assert resp.status_code == 429 and resp.json['quota'] == 'tokens'
+    assert resp.headers['X-Token-Budget-Limit'] == '1000'
+    assert resp.headers['X-Token-Budget-Remaining'] == '0'
+
+
+def test_ip_limit_applies_across_users(client, login, monkeypatch):
+    monkeypatch.setattr(quotas, 'QUOTA_IP_RATE_LIMIT', 2)
+    assert _pitch(client).status_code == 200
+    login(client, database.create_user('Bob', 'bob@example.com', 'x'))
+    assert _pitch(client).status_code == 200
+    assert _pitch(client).json['scope'] == 'ip'
+    assert _pitch(client, ip='10.0.0.2').status_code == 200
+
+
+def test_workers_reconcile_near_the_limit(limiter):
+    # Two limiters stand in for two gunicorn workers sharing the database
+    other = quotas.QuotaLimiter()
+    other._ensure_syncer = lambda: None
+    limiter.check(1, None)
+    limiter.rates.sync()
+    other.check(1, None)
+    other.rates.sync()
+    limiter.check(1, None)
+    # Past the sync margin, each check reconciles first and sees the other worker's requests
+    with pytest.raises(quotas.QuotaExceeded):
+        limiter.check(1, None)
+    with pytest.raises(quotas.QuotaExceeded):
+        other.check(1, None)
+
+
+def test_first_check_loads_shared_token_usage(limiter):
+    limiter.check(1, None).charge(600, 0)
+    limiter.sync()
+    other = quotas.QuotaLimiter()
+    other._ensure_syncer = lambda: None
+    other.check(1, None).charge(600, 0)
+    with pytest.raises(quotas.QuotaExceeded) as exc:
+        other.check(1, None)
+    assert exc.value.kind == 'tokens'
+
+
+def test_admin_adjusts_budgets(client, login):
+    assert _pitch(client).status_code == 200
+    assert client.get('/admin/quotas').status_code == 403
+
+    admin_id = database.create_user('Admin', 'admin@example.com', 'x')
+    login(client, admin_id)
+    listed = client.get('/admin/quotas').json
+    assert [u['user_id'] for u in listed['users']] == [client.user_id]
+    assert listed['users'][0]['tokens_used_today'] == 500
+
+    resp = client.put(f'/admin/quotas/{client.user_id}', json={'daily_tokens': 5000, 'rate_limit': None})
+    assert resp.status_code == 200
+    assert resp.json['quota']['daily_tokens'] == 5000 and resp.json['quota']['rate_limit'] == 3
+    assert client.put(f'/admin/quotas/{client.user_id}', json={'daily_tokens': -1}).status_code == 400
+
+    assert client.post(f'/admin/quotas/{client.user_id}/reset').status_code == 200
+    [user] = client.get(f'/admin/quotas?user_id={client.user_id}').json['users']
+    assert user['tokens_used_today'] == 0 and user['overridden']
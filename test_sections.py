@@ -0,0 +1,142 @@
+"""
+Tests for section-level storage and regeneration of campaign and pitch results
+Run with: python -m pytest test_sections.py
+"""
+
+import pytest
+
+import app as app_module
+from backend import database
+from backend import history
+from backend import sections
+from backend.prompts import CAMPAIGN_SECTIONS, PITCH_SECTIONS
+
+CAMPAIGN = '''Here is your campaign strategy.
+
+## 1. Campaign Objectives
+Grow trial signups by 30% this quarter.
+
+## 2. **Audience Psychology**
+Busy founders who distrust hype.
+
+## 3. Content Ideas
+1. Founder interview series
+2. Campaign objectives teardown
+3. Customer stories
+
+## 4. Ad Copy Variations
+- "Ship faster"
+
+## 5. Call-to-Action Strategy
+Start a free trial today.
+'''
+
+PITCH = '''**1. 30-Second Elevator Pitch**
+We cut onboarding from weeks to days.
+
+**2. Value Proposition**
+Less churn.
+
+**3. Key Differentiators**
+Fast setup.
+
+**4. Pain Point Alignment**
+No more spreadsheets.
+
+**5. Closing Call-To-Action**
+Book a demo.'''
+
+
+@pytest.fixture
+def client(user_client, sync_tasks, monkeypatch):
+    prompts = []
+
+    def fake_generate(prompt, on_usage=None, max_tokens=2000):
+        prompts.append((prompt, max_tokens))
+        return CAMPAIGN if 'comprehensive marketing campaign' in prompt else '### Content Ideas\n- Live demo week'
+
+    monkeypatch.setattr(app_module, 'generate_response', fake_generate)
+    user_client.prompts = prompts
+    return user_client
+
+
+def test_split_round_trips_and_ignores_numbered_lists_inside_sections():
+    parts = sections.split_sections(CAMPAIGN, CAMPAIGN_SECTIONS)
+    assert [key for key, _, _ in parts] == ['intro'] + [key for key, _, _ in CAMPAIGN_SECTIONS]
+    assert sections.join_sections(parts) == CAMPAIGN
+    assert '2. Campaign objectives teardown' in parts[3][2]
+    assert sections.section_title(parts[2][1]) == 'Audience Psychology'
+
+    pitch = sections.split_sections(PITCH, PITCH_SECTIONS)
+    assert pitch[0][0] == 'elevator_pitch' and sections.join_sections(pitch) == PITCH
+    assert sections.split_sections('No structure at all', PITCH_SECTIONS) is None
+
+
+def test_generation_stores_sections(client):
+    resp = client.post('/api/generate-campaign', json={'product': 'CRM', 'audience': 'SMBs', 'platform': 'LinkedIn'})
+    assert resp.status_code == 200
+    with database.get_db() as conn:
+        history_id = conn.execute('SELECT id FROM user_history').fetchone()[0]
+        assert conn.execute('SELECT COUNT(*) FROM history_sections WHERE history_id = ?',
+                            (history_id,)).fetchone()[0] == 6
+
+    outline = client.get(f'/api/history/item/{history_id}/sections').json['sections']
+    assert outline[3] == {'key': 'content_ideas', 'title': 'Content Ideas', 'chars': 79}
+    section = client.get(f'/api/history/item/{history_id}/sections/ad_copy')
+    assert section.json['content'] == '- "Ship faster"'
+    assert client.get(f'/api/history/item/{history_id}/sections/ad_copy',
+                      headers={'If-None-Match': section.headers['ETag']}).status_code == 304
+
+
+def test_regenerate_replaces_one_section_in_a_new_entry(client):
+    client.post('/api/generate-campaign', json={'product': 'CRM', 'audience': 'SMBs', 'platform': 'LinkedIn'})
+    [(original_id, original)] = [(item['id'], item['metadata']['result'])
+                                 for item in history.filter_user_history(1, {})]
+
+    resp = client.post(f'/api/history/item/{original_id}/sections/content_ideas/regenerate')
+    assert resp.status_code == 200
+    assert resp.json['content'] == '- Live demo week'
+    prompt, max_tokens = client.prompts[-1]
+    assert max_tokens == sections.SECTION_MAX_TOKENS
+    assert '3. Content Ideas' in prompt and 'Grow trial signups' in prompt and 'Founder interview' not in prompt
+
+    result = resp.json['result']
+    before, after = original.split('## 3. Content Ideas')
+    assert result.startswith(before + '## 3. Content Ideas\n\n- Live demo week\n\n## 4. Ad Copy Variations')
+    assert result.endswith(after[after.index('## 4.'):])
+
+    item = history.get_history_item(1, resp.json['id'])
+    assert item['metadata']['revised_from'] == original_id and item['metadata']['result'] == result
+    assert history.get_history_item(1, original_id)['metadata']['result'] == original
+    stored = sections.get_history_sections(1, resp.json['id'])['parts']
+    assert sections.join_sections(stored) == result
+
+
+def test_regenerate_rejects_unknown_sections_and_items(client):
+    history_id = history.log_user_activity(1, '/api/score-lead', 'Lead Scorer', 'lead_scored',
+                                           metadata={'result': CAMPAIGN})
+    campaign_id = history.log_user_activity(1, '/api/generate-campaign', 'Campaign Generator', 'campaign_generated',
+                                            metadata={'product': 'CRM', 'result': CAMPAIGN})
+    assert client.post(f'/api/history/item/{history_id}/sections/ad_copy/regenerate').status_code == 409
+    assert client.post(f'/api/history/item/{campaign_id}/sections/intro/regenerate').status_code == 400
+    assert client.post(f'/api/history/item/{campaign_id}/sections/nope/regenerate').status_code == 400
+    assert client.post('/api/history/item/999/sections/ad_copy/regenerate').status_code == 404
+    assert client.prompts == []
+    # Stored without sections: split on read
+    assert len(client.get(f'/api/history/item/{campaign_id}/sections').json['sections']) == 6
+
+
+def test_deleting_an_entry_deletes_its_sections(db):
+    parts = sections.split_sections(PITCH, PITCH_SECTIONS)
+    history_id = history.log_user_activity(1, '/api/generate-pitch', 'Pitch Generator', 'pitch_generated',
+                                           metadata={'result': PITCH}, sections=parts)
+    assert sections.get_history_sections(1, history_id)['parts'] == parts
+    history.delete_history_item(1, history_id)
+    with database.get_db() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM history_sections').fetchone()[0] == 0
+
+
+def test_regenerate_reports_database_errors_as_json(client, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE_PATH', '/nonexistent/dir/sections.db')
+    resp = client.post('/api/history/item/1/sections/ad_copy/regenerate')
+    assert resp.status_code == 500 and 'error' in resp.json
@@ -0,0 +1,73 @@
+"""
+Cold-start regression tests: import-time side effects and import budget
+Run with: python -m pytest test_startup.py
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+from benchmarks import startup
+from backend import ai_engine
+
+# Generous budget for importing app.py in a fresh interpreter (CI machines vary)
+IMPORT_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '1500'))
+
+# Counts the work done while importing app.py
+_COUNT_SIDE_EFFECTS = '''
+import json, os, sys
+import dotenv, flask
+calls = {'load_dotenv': 0, 'Flask': 0, 'init_database': 0}
+
+def wrap(name, func):
+    def counted(*args, **kwargs):
+        calls[name] += 1
+        return func(*args, **kwargs)
+    return counted
+
+dotenv.load_dotenv = wrap('load_dotenv', dotenv.load_dotenv)
+flask.Flask.__init__ = wrap('Flask', flask.Flask.__init__)
+import backend.database
+backend.database.init_database = wrap('init_database', backend.database.init_database)
+import app
+calls['lazy_modules_loaded'] = sorted(m for m in ('groq', 'httpx') if m in sys.modules)
+calls['db_created_at_import'] = os.path.exists(os.environ['DATABASE_PATH'])
+client = app.app.test_client()
+calls['statuses'] = [client.get('/login').status_code for _ in range(2)]
+calls['db_created'] = os.path.exists(os.environ['DATABASE_PATH'])
+print(json.dumps(calls))
+'''
+
+
+def test_import_side_effects_run_once_and_schema_waits_for_a_request(tmp_path):
+    env = dict(os.environ, DATABASE_PATH=str(tmp_path / 'startup.db'), GROQ_API_KEY='test-key')
+    result = subprocess.run([sys.executable, '-c', _COUNT_SIDE_EFFECTS], cwd=startup.ROOT,
+                            capture_output=True, text=True, env=env, check=True)
+    calls = json.loads(result.stdout.strip().splitlines()[-1])
+    assert calls == {'load_dotenv': 1, 'Flask': 1, 'init_database': 1, 'lazy_modules_loaded': [],
+                     'db_created_at_import': False, 'statuses': [200, 200], 'db_created': True}
+
+
+def test_import_profile_within_budget():
+    profile = dict(startup.import_profile(top=1000))
+    assert 'groq' not in profile
+    assert profile['app'] / 1000 < IMPORT_BUDGET_MS
+
+
+def test_cold_start_serves_first_request():
+    run = startup.measure_startup()
+    assert not run['groq_loaded']
+    assert run['import_ms'] < IMPORT_BUDGET_MS
+
+
+def test_llm_client_is_created_per_process(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    monkeypatch.setattr(ai_engine, '_client_pid', None)
+    first = ai_engine.get_client()
+    assert first is not None and ai_engine.get_client() is first
+
+    # After a fork the child gets its own client (and connection pool)
+    monkeypatch.setattr(ai_engine.os, 'getpid', lambda: -1)
+    assert ai_engine.get_client() is not first
+    monkeypatch.setattr(ai_engine, '_client_pid', None)
@@ -0,0 +1,80 @@
+"""
+Tests for deferred post-response tasks
+Run with: python -m pytest test_tasks.py
+"""
+
+import pytest
+
+import app as app_module
+from backend import database
+from backend import tasks
+
+
+@pytest.fixture
+def client(user_client, monkeypatch):
+    monkeypatch.setattr(tasks, 'TASK_RETRY_DELAY', 0)
+    monkeypatch.setattr(app_module, 'generate_response', lambda prompt, on_usage=None: 'generated text')
+    return user_client
+
+
+def _history_count():
+    with database.get_db() as conn:
+        return conn.execute('SELECT COUNT(*) FROM user_history').fetchone()[0]
+
+
+def test_sync_mode_logs_before_returning(client, monkeypatch):
+    monkeypatch.setattr(tasks, 'TASKS_SYNC', True)
+    resp = client.post('/api/generate-pitch', json={'product': 'Widget', 'persona': 'CTO'})
+    assert resp.status_code == 200
+    assert _history_count() == 1
+
+
+def test_history_logged_after_response_closes(client, monkeypatch):
+    monkeypatch.setattr(tasks, 'TASKS_SYNC', False)
+    resp = client.post('/api/generate-campaign',
+                       json={'product': 'Widget', 'audience': 'Developers', 'platform': 'LinkedIn'})
+    assert resp.json['result'] == 'generated text'
+    resp.close()
+    assert tasks.wait_for_tasks(timeout=5)
+    assert _history_count() == 1
+
+
+def test_failing_task_is_retried_then_reported(monkeypatch, capsys):
+    monkeypatch.setattr(tasks, 'TASKS_SYNC', True)
+    monkeypatch.setattr(tasks, 'TASK_RETRY_DELAY', 0)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        raise RuntimeError('database is locked')
+
+    failed_before = tasks.stats['failed']
+    tasks.submit(flaky)
+    assert len(calls) == tasks.TASK_MAX_ATTEMPTS
+    assert tasks.stats['failed'] == failed_before + 1
+    assert 'flaky failed after' in capsys.readouterr().out
+
+
+def test_task_succeeds_on_retry(monkeypatch):
+    monkeypatch.setattr(tasks, 'TASKS_SYNC', True)
+    attempts = []
+
+    def eventually_ok():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError('transient')
+
+    tasks.submit(eventually_ok)
+    assert len(attempts) == 2
+
+
+def test_stats_count_every_pooled_task(monkeypatch):
+    monkeypatch.setattr(tasks, 'TASKS_SYNC', False)
+    monkeypatch.setattr(tasks, 'TASK_WORKERS', 8)
+    monkeypatch.setattr(tasks, '_executor', None)
+    before = dict(tasks.stats)
+    for _ in range(500):
+        tasks.submit(lambda: None)
+    assert tasks.wait_for_tasks(timeout=10)
+    assert tasks.stats['submitted'] - before['submitted'] == 500
+    assert tasks.stats['succeeded'] - before['succeeded'] == 500
@@ -0,0 +1,58 @@
+"""
+Tests for per-request tracing and slow-request capture
+Run with: python -m pytest test_tracing.py
+"""
+
+import os
+
+import pytest
+
+from backend import tracing
+
+
+@pytest.fixture
+def client(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACE_LOG', str(tmp_path / 'slow.jsonl'))
+    return client
+
+
+def test_request_id_is_generated_and_echoed(client):
+    generated = client.get('/login').headers['X-Request-ID']
+    assert len(generated) == 32
+    assert client.get('/login', headers={'X-Request-ID': 'abc-123'}).headers['X-Request-ID'] == 'abc-123'
+    assert client.get('/login', headers={'X-Request-ID': 'bad id!'}).headers['X-Request-ID'] != 'bad id!'
+
+
+def test_fast_requests_are_not_logged(client, monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACE_SLOW_MS', 60_000)
+    client.get('/login')
+    assert not os.path.exists(tracing.TRACE_LOG)
+
+
+def test_slow_request_span_tree_is_written(client, login, monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACE_SLOW_MS', 0)
+    login(client)
+    client.get('/campaign', headers={'X-Request-ID': 'slow-1'})
+
+    [record] = tracing.read_slow_traces(request_id='slow-1')
+    assert record['name'] == 'GET /campaign'
+    assert record['attrs']['status'] == 200
+    spans = {s['name']: s for s in record['spans']}
+    assert spans['db.get_user_by_id']['parent_id'] == spans['auth.get_current_user']['id']
+    assert spans['template.render']['attrs']['template'] == 'campaign.html'
+    assert all(s['duration_ms'] is not None for s in record['spans'])
+
+
+def test_chrome_trace_export(client, monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACE_SLOW_MS', 0)
+    client.get('/login', headers={'X-Request-ID': 'export-1'})
+    exported = tracing.to_chrome_trace(tracing.read_slow_traces())
+    complete = [e for e in exported['traceEvents'] if e['ph'] == 'X']
+    assert complete[0]['name'] == 'GET /login'
+    assert any(e['name'] == 'template.render' for e in complete)
+
+
+def test_spans_are_noops_outside_requests():
+    with tracing.span('db.standalone'):
+        pass
+    assert tracing.current_request_id() is None
@@ -0,0 +1,65 @@
+"""
+Tests for aggregated page visit tracking
+Run with: python -m pytest test_visits.py
+"""
+
+from backend import database
+from backend import visits
+from backend.visits import VisitTracker, get_page_visit_counts
+
+
+def _count_rows(table):
+    with database.get_db() as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_record_does_not_touch_database(db, monkeypatch):
+    tracker = VisitTracker(flush_interval=3600)
+    monkeypatch.setattr(visits, 'get_db', None)
+    tracker.record('/campaign', 'Campaign Generator', user_id=1)
+    assert sum(tracker._counts.values()) == 1
+
+
+def test_flush_writes_aggregate_rows(db):
+    tracker = VisitTracker(flush_interval=3600)
+    for _ in range(5):
+        tracker.record('/campaign', 'Campaign Generator', user_id=1)
+    tracker.record('/pitch', 'Sales Pitch Generator', user_id=1)
+    tracker.record('/pitch', 'Sales Pitch Generator', session_id='anon-1')
+
+    assert tracker.flush() == 3
+    assert _count_rows('page_visit_counts') == 3
+    assert get_page_visit_counts(1) == {'/campaign': 5, '/pitch': 1}
+
+    tracker.record('/campaign', 'Campaign Generator', user_id=1)
+    tracker.flush()
+    assert get_page_visit_counts(1)['/campaign'] == 6
+
+
+def test_sampling_controls_raw_events(db):
+    tracker = VisitTracker(flush_interval=3600, sample_rate=1.0)
+    tracker.record('/history', 'History', user_id=1)
+    tracker.record('/history', 'History', session_id='anon-1')
+    tracker.flush()
+    assert _count_rows('user_history') == 1
+
+    tracker = VisitTracker(flush_interval=3600, sample_rate=0.0)
+    tracker.record('/history', 'History', user_id=1)
+    tracker.flush()
+    assert _count_rows('user_history') == 1
+
+
+def test_failed_flush_keeps_counts_and_samples(db, monkeypatch):
+    tracker = VisitTracker(flush_interval=3600, sample_rate=1.0, max_samples=2)
+    tracker.record('/campaign', 'Campaign Generator', user_id=1)
+    path = database.DATABASE_PATH
+    monkeypatch.setattr(database, 'DATABASE_PATH', '/nonexistent/dir/visits.db')
+    assert tracker.flush() == 0
+    assert sum(tracker._counts.values()) == 1
+
+    tracker.record('/pitch', 'Pitch Generator', user_id=1)
+    tracker.record('/pitch', 'Pitch Generator', user_id=1)
+    assert [sample[1] for sample in tracker._samples] == ['/campaign', '/pitch']
+    monkeypatch.setattr(database, 'DATABASE_PATH', path)
+    tracker.flush()
+    assert _count_rows('user_history') == 2